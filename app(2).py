@@ -11,6 +11,7 @@ import dash_cytoscape as cyto
 
 from utilities.ont import get_cytoscape_elements
 from utilities.ont import get_sparql_query_results
+from utilities.indicators import compute_indicators
 
 # --------------------------------------------------
 # ontology configuration details
@@ -598,13 +599,7 @@ def submit_button_selected(n_clicks, graph_type, selected_cryptos, ontology_endp
     # Convert the set back to a list and create the filtered DataFrame
     filtered_df = results_df[list(filtered_columns)].copy()
 
-    for col in filtered_df.columns:
-        if col == 'date':
-            continue
-        ma_col_name = col + '_20d_ma'
-        diff_col_name = col + '_diff'
-        filtered_df.loc[:, ma_col_name] = filtered_df[col].rolling(window=20).mean()
-        filtered_df.loc[:, diff_col_name] = filtered_df[col].astype(float) - filtered_df[ma_col_name].astype(float)
+    filtered_df, indicator_kinds = compute_indicators(filtered_df)
 
     data = []
     for col in filtered_df.columns:
@@ -612,7 +607,7 @@ def submit_button_selected(n_clicks, graph_type, selected_cryptos, ontology_endp
             continue
         
         # Plot for daily price
-        if '_20d_ma' not in col and '_diff' not in col:
+        if col not in indicator_kinds:
             daily_price_trace = dict(
                 type=graph_type,  # Assuming you want a line plot for daily prices
                 x=filtered_df['date'],
@@ -621,8 +616,8 @@ def submit_button_selected(n_clicks, graph_type, selected_cryptos, ontology_endp
             )
             data.append(daily_price_trace)
         
-        # Corresponding 20-day moving average plot
-        if '_20d_ma' in col:
+        # Corresponding moving average plot
+        if indicator_kinds.get(col) == 'ma':
             moving_avg_trace = dict(
                 type="line",  # Line plot for moving averages
                 x=filtered_df['date'],
@@ -633,7 +628,7 @@ def submit_button_selected(n_clicks, graph_type, selected_cryptos, ontology_endp
             data.append(moving_avg_trace)
 
         # Corresponding difference plot
-        if '_diff' in col:
+        if indicator_kinds.get(col) == 'diff':
             #colors = ['green' if diff>0 else 'red' for diff in filtered_df[col]]
             diff_trace = dict(
                 type="bar",  # Bar plot for the difference
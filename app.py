@@ -1,16 +1,34 @@
+import json
+import os
 import pathlib
+from urllib.parse import urlencode
 import pandas as pd
 import dash_daq as daq
-import math
 
+import flask
 import dash
 from dash import dcc, html, dash_table, Input, Output, State
 import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import ThemeChangerAIO
 import dash_cytoscape as cyto
+from rdflib import URIRef
 
-from utilities.ont import get_cytoscape_elements
-from utilities.ont import get_sparql_query_results
+from utilities.cache import DiskCache
+from utilities.catalogue import Catalogue
+from utilities.downsample import CHART_MAX_POINTS, downsample
+from utilities.instrumentation import instrument_callbacks, instrument_server, metrics
+from utilities.jobs import JobRunner
+from utilities.ont import get_cytoscape_elements, get_cytoscape_layout, get_ontology_predicates
+from utilities.ont import get_graph_cache_stats, get_query_cache_stats
+from utilities.ont import get_ontology_version
+from utilities.ont import get_sparql_template_indicators
+from utilities.ont import prepare_query_templates
+from utilities.ont import QUERY_CACHE_DIR, QUERY_CACHE_TTL_SECONDS, QUERY_CHUNK_ROWS
+from utilities.projection import DEFAULT_PROJECTION, PROJECTIONS, local_name
+from utilities.results import ResultStore, get_results_page
+from utilities.results import get_result_chunks, iter_csv
+from utilities.template import render_query_template
+from utilities.warmup import OntologyWarmup
 
 # --------------------------------------------------
 # ontology configuration details
@@ -19,14 +37,27 @@ from utilities.ont import get_sparql_query_results
 BASE_PATH = pathlib.Path(__file__).parent.resolve()
 DATA_PATH = BASE_PATH.joinpath("data").resolve()
 
+# ontologies and their sparql queries, reloaded when the csv files change
+catalogue = Catalogue(DATA_PATH.joinpath("ontologies.csv"))
+
 # ontology names
-ontologies_df = pd.read_csv(DATA_PATH.joinpath("ontologies.csv"))
-ontology_names_as_list = ontologies_df["Name"].unique()
+ontologies_df = catalogue.ontologies_df
+ontology_names_as_list = catalogue.names()
 
 # ontology specific sparql queries
 queries_list = pd.DataFrame()
 df_query_results = ontologies_df.copy()
 
+# query results are kept server-side; the table only receives the visible page
+result_store = ResultStore(256 * 1024 * 1024,
+                           directory=os.path.join(QUERY_CACHE_DIR, 'results'),
+                           ttl=QUERY_CACHE_TTL_SECONDS)
+
+# submitted queries run on threads of the web process, which keep its warm caches;
+# their progress and results are shared on disk, so any worker process can answer a poll
+query_jobs = JobRunner(DiskCache(os.path.join(QUERY_CACHE_DIR, 'jobs'), 64 * 1024 * 1024,
+                                 ttl=QUERY_CACHE_TTL_SECONDS, name='jobs'))
+
 # ontology specific cytoscape data elements
 ontology_view_elements = []
 
@@ -51,9 +82,20 @@ view_control_panel_format = "bg-light text-primary text-center"
 # instantiate the dash server
 #
 dbc_css = "https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates/dbc.min.css"
+
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SKETCHY, dbc_css])
 app.config.suppress_callback_exceptions = True
 
+# --------------------------------------------------
+# load every listed ontology in the background; /ready reports when all are loaded
+#
+ontology_warmup = OntologyWarmup()
+if os.environ.get('WARMUP_ONTOLOGIES', '1') != '0':
+    ontology_warmup.start(
+        (endpoint, DATA_PATH.joinpath(sparql_file))
+        for endpoint, sparql_file in zip(ontologies_df['Endpoint'], ontologies_df['Sparql'])
+    )
+
 ####################################################################################################################
 # top container
 #
@@ -156,6 +198,23 @@ sidebar_container = html.Div(
                                 ),
                             ],
                         ),
+                        # progress and cancellation of the running query job
+                        html.Div(
+                            id="query-progress-div",
+                            children=[
+                                html.P(id="query-progress", children=''),
+                                dbc.Button(
+                                    id="cancel-button",
+                                    children="Cancel",
+                                    n_clicks=0,
+                                    disabled=True,
+                                    style={'width': '100%'},
+                                ),
+                                # id of the running query job, polled until it finishes
+                                dcc.Store(id='query-job'),
+                                dcc.Interval(id='query-job-poll', interval=500, disabled=True),
+                            ],
+                        ),
                     ],
                     title="Ontology",
                     className=accordian_item_format,
@@ -196,6 +255,23 @@ body_container_view = \
                                     for name in ['random', 'grid', 'circle', 'concentric', 'breadthfirst']
                                 ],
                             ),
+                            html.Br(),
+                            dcc.Dropdown(
+                                id='ontology-view-projection',
+                                value=DEFAULT_PROJECTION,
+                                clearable=False,
+                                options=[
+                                    {'label': name.capitalize(), 'value': name}
+                                    for name in PROJECTIONS
+                                ],
+                            ),
+                            html.Br(),
+                            # only these predicates are drawn; empty draws all of them
+                            dcc.Dropdown(
+                                id='ontology-view-predicates',
+                                multi=True,
+                                placeholder='Predicates',
+                            ),
                         ],
                     ),
                 ],
@@ -208,7 +284,9 @@ body_container_view = \
                         id='ontology-view',
                         elements=ontology_view_elements,
                         style={'width': '100%', 'height': '1000px'},
-                    )
+                    ),
+                    # version of the ontology whose elements are currently shown
+                    dcc.Store(id='ontology-view-version'),
                 ],
                 width=10,
             ),
@@ -218,9 +296,29 @@ body_container_view = \
 
 @app.callback(
     Output('ontology-view', 'layout'),
-    Input('ontology-view-update-layout', 'value'))
-def update_layout(layout):
-    return {'name': layout}
+    [Input('ontology-view-update-layout', 'value'),
+     Input('ontology-view-version', 'data'),
+     Input('ontology-view-projection', 'value'),
+     Input('ontology-view-predicates', 'value')],
+    [State('ontology-endpoint', 'children')])
+def update_layout(layout, ontology_view_version, projection, predicates, ontology_endpoint):
+    if ontology_view_version is None or not ontology_endpoint:
+        return {'name': layout}
+
+    # positions are computed once per ontology version on the server; the browser only draws
+    positions = get_cytoscape_layout(ontology_endpoint, layout, projection, predicates or None)
+    return {'name': 'preset', 'positions': positions, 'fit': True}
+
+
+@app.callback(
+    Output('ontology-view-predicates', 'options'),
+    [Input('ontology-view-version', 'data')],
+    [State('ontology-endpoint', 'children')])
+def ontology_view_predicates(ontology_view_version, ontology_endpoint):
+    if ontology_view_version is None or not ontology_endpoint:
+        return []
+
+    return [{'label': local_name(URIRef(p)), 'value': p} for p in get_ontology_predicates(ontology_endpoint)]
 
 
 ####################################################################################################################
@@ -466,7 +564,11 @@ body_container_query = \
                                                    ),
                                             dcc.Graph(
                                                 id="query-results-chart"
-                                            )
+                                            ),
+                                            # server-side indicators and settings of the chart
+                                            dcc.Store(id='query-chart-state'),
+                                            # the chart as the server drew it; the browser applies the graph type
+                                            dcc.Store(id='query-chart-figure'),
                                         ],
                                         width=6,
                                     ),
@@ -483,6 +585,7 @@ body_container_query = \
 
                                                 page_current=0,
                                                 page_size=25,
+                                                page_action="custom",
                                                 fixed_rows={'headers': True},
 
                                                 style_cell={'textAlign': 'left'},
@@ -490,11 +593,21 @@ body_container_query = \
 
                                                 row_deletable=False,
                                                 editable=False,
-                                                filter_action="native",
-                                                sort_action="native",
+                                                filter_action="custom",
+                                                filter_query='',
+                                                sort_action="custom",
+                                                sort_mode="single",
+                                                sort_by=[],
                                                 style_table={"overflowX": "auto", 'overflowY': 'auto'},
-                                                export_format="csv",
-                                            )
+                                            ),
+                                            # the whole result, filtered and sorted like the table, streamed as csv
+                                            html.A("Download CSV",
+                                                   id='query-results-download',
+                                                   href='',
+                                                   style={'display': 'none'},
+                                                   ),
+                                            # id of the server-side result shown in the table
+                                            dcc.Store(id='query-result-id'),
                                         ],
                                         width=6,
                                     ),
@@ -567,17 +680,18 @@ app.layout = dbc.Container(
 )
 def ontology_select_dropdown_selected(ontology_selected):
     if ontology_selected is None:
-        return '', '', [{"label": i, "value": i} for i in ontology_names_as_list], True
+        return '', '', [{"label": i, "value": i} for i in catalogue.names()], True
 
     # get attributes regarding the selected ontology
-    df = ontologies_df.query(f'Name == "{ontology_selected}"')
-    ontology_description = df['Description'].unique()[0]
-    ontology_endpoint = df['Endpoint'].unique()[0]
-    sparql_query_file = df['Sparql'].unique()[0]
-    sparql_query_df = pd.read_csv(DATA_PATH.joinpath(sparql_query_file))
-    query_name_list = sparql_query_df['Name'].unique()
+    ontology = catalogue.ontology(ontology_selected)
+    if ontology is None:
+        return '', '', [], True
+    ontology_description = ontology['Description']
+    ontology_endpoint = ontology['Endpoint']
+    sparql_queries = catalogue.queries(ontology_selected)
+    prepare_query_templates(ontology_endpoint, sparql_queries.values())
     sparql_query_options = []
-    for q in query_name_list:
+    for q in sparql_queries:
         sparql_query_options.append({'label': q, 'value': q})
 
     return ontology_description, ontology_endpoint, sparql_query_options, False
@@ -605,7 +719,11 @@ def ontology_select_dropdown_selected(ontology_selected):
     [State("ontology-select", "value")]
 )
 def sparql_query_select_dropdown_selected(query_selected, ontology_selected):
-    if ontology_selected is None or query_selected is None:
+    sparql_query_template = None
+    if ontology_selected is not None and query_selected is not None:
+        sparql_query_template = catalogue.query(ontology_selected, query_selected)
+
+    if sparql_query_template is None:
         return ('', True, True,
                 True, 'Disabled', [],
                 True, 'Disabled', [],
@@ -615,12 +733,6 @@ def sparql_query_select_dropdown_selected(query_selected, ontology_selected):
                 True,
                 )
 
-    df = ontologies_df.query(f'Name == "{ontology_selected}"')
-    sparql_query_file = df['Sparql'].unique()[0]
-    sparql_query_df = pd.read_csv(DATA_PATH.joinpath(sparql_query_file))
-    sparql_query_df.query(f'Name == "{query_selected}"', inplace=True)
-    sparql_query_template = sparql_query_df['Sparql'].unique()[0]
-
     # determine which of the parameters control are needed for this query
 
     return (sparql_query_template, False, False,
@@ -632,124 +744,325 @@ def sparql_query_select_dropdown_selected(query_selected, ontology_selected):
             False)
 
 
-@app.callback(
-    Output("sparql-query-text", "value"),
-    Output("sparql-query-text", "disabled"),
-    Output("query-results-table", "data"),
-    Output("query-results-table", "columns"),
-    Output("ontology-view", "elements"),
-    Output("query-results-chart", "figure"),
-    [Input("submit-button", "n_clicks"), 
-     Input("graph-type-dropdown", "value")],
-    [State("ontology-endpoint", "children"),
-     State("sparql-query-template-text", "value"),
-     State("dropdown1-select", "value"),
-     State("dropdown2-select", "value"),
-     State("dropdown3-select", "value"),
-     State("dropdown4-select", "value"),
-     State("date-range-picker-select", "start_date"),
-     State("date-range-picker-select", "end_date"),
-     State("precision-select", "value")
-     ]
-)
-def submit_button_selected(n_clicks, graph_type, ontology_endpoint, sparql_query_template,
-                           dropdown_1, dropdown_2, dropdown_3, dropdown_4,
-                           start_date, end_date, precision):
-    import plotly.express as px
-    figure = px.line(x=['a', 'b', 'c', 'd'], y=[1, 2, 2, 1], title='placeholder figure')
-
+def run_sparql_query(set_progress, n_clicks, ontology_endpoint, sparql_query_template,
+                     dropdown_1, dropdown_2, dropdown_3, dropdown_4,
+                     start_date, end_date, precision, ontology_view_version):
     if n_clicks == 0 or ontology_endpoint is None or sparql_query_template is None:
-        data = ontologies_df.to_dict('records')
-        columns = [{'id': c, 'name': c} for c in ontologies_df.columns]
-        return '', True, data, columns, ontology_view_elements, figure
-
-    sparql_query_text = sparql_query_template
-
-    # replace according to meta tags
-    start_tag, end_tag = "<<", ">>"
-    start_index = 0
-    while True:
-        idx_1 = sparql_query_template.find(start_tag, start_index)
-        if idx_1 == -1:
-            break
-        idx_2 = sparql_query_template.find(end_tag, start_index + len(start_tag))
-        if idx_2 == -1:
-            break
-        tag = sparql_query_template[idx_1 + len(start_tag): idx_2]
-        name_value = tag.split(':')
-
-        if name_value[1].strip() == 'dropdown1':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_1)
-        elif name_value[1].strip() == 'dropdown2':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_2)
-        elif name_value[1].strip() == 'dropdown3':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_3)
-        elif name_value[1].strip() == 'dropdown4':
-            sparql_query_text = sparql_query_text.replace(name_value[0], dropdown_4)
-        elif name_value[1].strip() == 'start_date':
-            sparql_query_text = sparql_query_text.replace(name_value[0], start_date)
-        elif name_value[1].strip() == 'end_date':
-            sparql_query_text = sparql_query_text.replace(name_value[0], end_date)
-        elif name_value[1].strip() == 'precision':
-            sparql_query_text = sparql_query_text.replace('precision', str(math.pow(10, precision)))
-        start_index = idx_2
-
-    results_table, results_columns, results_df = get_sparql_query_results(ontology_endpoint, sparql_query_text)
+        columns = [{'id': c, 'name': c} for c in catalogue.ontologies_df.columns]
+        return '', True, None, columns, 0, dash.no_update, None
 
-    for col in results_df.columns:
-        if col == 'date':
-            continue
-        results_df[col + '_20d_ma'] = results_df[col].rolling(window=20).mean()
-        results_df[col + '_diff'] = results_df[col].astype(float) - results_df[col + '_20d_ma'].astype(float)
+    query_parameters = {
+        'dropdown1': dropdown_1, 'dropdown2': dropdown_2, 'dropdown3': dropdown_3, 'dropdown4': dropdown_4,
+        'start_date': start_date, 'end_date': end_date, 'precision': precision,
+    }
+    sparql_query_text = render_query_template(sparql_query_template, query_parameters)
+
+    if set_progress is not None:
+        set_progress('Running query...')
+    results_columns, results_df, indicators_df, indicator_kinds = get_sparql_template_indicators(
+        ontology_endpoint, sparql_query_template, query_parameters)
+    if set_progress is not None:
+        # a job cancelled while its query ran stops here
+        set_progress('Storing results...')
+    # the query is kept with the result, so an evicted result can still be downloaded
+    result_id = result_store.put(results_df, query=(ontology_endpoint, get_ontology_version(ontology_endpoint),
+                                                    sparql_query_template, query_parameters))
+
+    # the chart is drawn from the stored indicators, so zooming can fetch more points
+    chart_state = {'result_id': result_store.put(indicators_df), 'kinds': indicator_kinds}
 
+    # the view tab only needs new elements when the ontology itself changed
+    version = f'{ontology_endpoint}@{get_ontology_version(ontology_endpoint)}'
+    if version == ontology_view_version:
+        version = dash.no_update
+
+    return sparql_query_text, False, result_id, results_columns, 0, version, chart_state
+
+
+def build_chart_figure(results_df, indicator_kinds, graph_type, x_range=None, max_points=CHART_MAX_POINTS,
+                       uirevision=None):
+    """
+    Return the chart of a query result and its indicators, with every trace
+    downsampled to at most max_points points.
+    :param results_df: query result with indicator columns
+    :param indicator_kinds: dictionary of indicator column to indicator
+    :param graph_type: plotly trace type of the query result columns
+    :param x_range: pair of dates the chart is zoomed to, or None for every date; ignored unless is_zoomable
+    :param max_points: points per trace at most
+    :param uirevision: plotly keeps the zoom of the user while this stays the same
+    :return: plotly figure as a dictionary
+    """
+    if x_range is not None and is_zoomable(results_df):
+        dates = results_df['date'].to_numpy()
+        lo, hi = pd.to_datetime(x_range[0]).to_datetime64(), pd.to_datetime(x_range[1]).to_datetime64()
+        # one point beyond either edge, so lines run to the border of the plot
+        start = max(dates.searchsorted(lo, side='left') - 1, 0)
+        stop = dates.searchsorted(hi, side='right') + 1
+        results_df = results_df.iloc[start:stop]
 
     data = []
     for col in results_df.columns:
         if col == 'date':
             continue
-        
+
         # Plot for daily price
-        if '_20d_ma' not in col and '_diff' not in col:
+        if col not in indicator_kinds:
+            x, y = downsample(results_df['date'], results_df[col], max_points)
             daily_price_trace = dict(
                 type=graph_type,  # Assuming you want a line plot for daily prices
-                x=results_df['date'],
-                y=results_df[col],
+                x=x,
+                y=y,
                 name=col,
+                meta='price',  # the graph type dropdown switches these in the browser
             )
             data.append(daily_price_trace)
-        
-        # Corresponding 20-day moving average plot
-        if '_20d_ma' in col:
+
+        # Corresponding moving average plot
+        if indicator_kinds.get(col) == 'ma':
+            x, y = downsample(results_df['date'], results_df[col], max_points)
             moving_avg_trace = dict(
                 type="line",  # Line plot for moving averages
-                x=results_df['date'],
-                y=results_df[col],
+                x=x,
+                y=y,
                 name=col,
                 line=dict(dash='dash')  # Dashed line for the moving average
             )
             data.append(moving_avg_trace)
 
         # Corresponding difference plot
-        if '_diff' in col:
+        if indicator_kinds.get(col) == 'diff':
+            # min/max buckets keep the spikes of the bars
+            x, y = downsample(results_df['date'], results_df[col], max_points, method='minmax')
             diff_trace = dict(
                 type="bar",  # Bar plot for the difference
-                x=results_df['date'],
-                y=results_df[col],
+                x=x,
+                y=y,
                 name=col,
             )
             data.append(diff_trace)
 
+    layout = {"title": "Results", "dragmode": "select", "showlegend": True, "autosize": True,
+              "uirevision": uirevision}
+    return dict(data=data, layout=layout)
+
+
+def is_zoomable(results_df):
+    """
+    Whether zooming the chart of a query result can fetch the visible dates
+    again: only a sorted datetime column can be searched for the zoomed range.
+    :param results_df: query result with indicator columns
+    :return: bool
+    """
+    return 'date' in results_df.columns and pd.api.types.is_datetime64_any_dtype(results_df['date'])
+
 
-    layout = {"title": "Results", "dragmode": "select", "showlegend": True, "autosize": True}
-    figure = dict(data=data, layout=layout)
+def relayout_x_range(relayout_data):
+    """
+    Return the date range a chart was zoomed to from its relayoutData.
+    :param relayout_data: relayoutData of a dcc.Graph
+    :return: tuple of the (start, end) pair, or None, and whether the zoom was reset
+    """
+    relayout_data = relayout_data or {}
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return (relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']), False
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'][:2]), False
+    return None, bool(relayout_data.get('xaxis.autorange'))
+
+
+@app.callback(
+    Output("query-job", "data"),
+    [Input("submit-button", "n_clicks"),
+     Input("cancel-button", "n_clicks"),
+     Input("ontology-select", "value")],
+    [State("query-job", "data"),
+     State("ontology-endpoint", "children"),
+     State("sparql-query-template-text", "value"),
+     State("dropdown1-select", "value"),
+     State("dropdown2-select", "value"),
+     State("dropdown3-select", "value"),
+     State("dropdown4-select", "value"),
+     State("date-range-picker-select", "start_date"),
+     State("date-range-picker-select", "end_date"),
+     State("precision-select", "value"),
+     State("ontology-view-version", "data")
+     ]
+)
+def submit_button_selected(n_clicks, cancel_clicks, ontology_name, running_job, *query_state):
+    # resubmitting cancels the running query; so do the cancel button and choosing another ontology
+    if running_job is not None:
+        query_jobs.cancel(running_job)
+    if dash.callback_context.triggered_id != "submit-button" or not n_clicks:
+        return None
+    return query_jobs.submit(run_sparql_query, n_clicks, *query_state)
+
+
+@app.callback(
+    Output("sparql-query-text", "value"),
+    Output("sparql-query-text", "disabled"),
+    Output("query-result-id", "data"),
+    Output("query-results-table", "columns"),
+    Output("query-results-table", "page_current"),
+    Output("ontology-view-version", "data"),
+    Output("query-chart-state", "data"),
+    Output("query-progress", "children"),
+    Output("query-job-poll", "disabled"),
+    Output("cancel-button", "disabled"),
+    [Input("query-job", "data"),
+     Input("query-job-poll", "n_intervals")]
+)
+def query_job_polled(job_id, n_intervals):
+    unchanged = (dash.no_update,) * 7
+    if job_id is None:
+        return unchanged + ('', True, True)
+    status = query_jobs.status(job_id)
+    if status['state'] == 'running':
+        return unchanged + (status['progress'] or 'Queued...', False, False)
+    if status['state'] == 'done':
+        return tuple(status['result']) + ('', True, True)
+    return unchanged + (status['progress'], True, True)
+
+
+@app.callback(
+    Output("query-chart-figure", "data"),
+    [Input("query-chart-state", "data"),
+     Input("query-results-chart", "relayoutData")],
+    [State("graph-type-dropdown", "value")]
+)
+def query_results_chart(chart_state, relayout_data, graph_type):
+    if chart_state is None:
+        import plotly.express as px
+        return px.line(x=['a', 'b', 'c', 'd'], y=[1, 2, 2, 1], title='placeholder figure')
 
-    cytoscape_elements = get_cytoscape_elements(ontology_endpoint)
+    x_range = None
+    if 'query-results-chart.relayoutData' in [t['prop_id'] for t in dash.callback_context.triggered]:
+        # zooming in fetches the points of the visible dates at full resolution again
+        x_range, reset = relayout_x_range(relayout_data)
+        if x_range is None and not reset:
+            return dash.no_update
 
-    return sparql_query_text, False, results_table, results_columns, cytoscape_elements, figure
+    results_df = result_store.get(chart_state['result_id'])
+    if results_df is None:
+        # the result expired from the store; keep showing the current figure
+        return dash.no_update
+    if x_range is not None and not is_zoomable(results_df):
+        # dates that are not typed as dates can only be zoomed by plotly itself
+        return dash.no_update
+    return build_chart_figure(results_df, chart_state['kinds'], graph_type, x_range,
+                              uirevision=chart_state['result_id'])
+
+
+# switching the graph type only changes the type of the price traces, so it is
+# done in the browser on the figure the server sent last, without a request
+app.clientside_callback(
+    """
+    function(figure, graph_type) {
+        if (!figure) {
+            return window.dash_clientside.no_update;
+        }
+        if (['line', 'bar', 'scatter', 'histogram'].indexOf(graph_type) < 0) {
+            return figure;
+        }
+        var data = figure.data.map(function(trace) {
+            return trace.meta === 'price' ? Object.assign({}, trace, {type: graph_type}) : trace;
+        });
+        return Object.assign({}, figure, {data: data});
+    }
+    """,
+    Output("query-results-chart", "figure"),
+    [Input("query-chart-figure", "data"),
+     Input("graph-type-dropdown", "value")]
+)
+
+
+@app.callback(
+    Output("query-results-table", "data"),
+    Output("query-results-table", "page_count"),
+    [Input("query-result-id", "data"),
+     Input("query-results-table", "page_current"),
+     Input("query-results-table", "page_size"),
+     Input("query-results-table", "sort_by"),
+     Input("query-results-table", "filter_query")]
+)
+def query_results_table_paged(result_id, page_current, page_size, sort_by, filter_query):
+    results_df = catalogue.ontologies_df if result_id is None else result_store.get(result_id)
+    if results_df is None:
+        # the result expired from the store; the user has to submit the query again
+        return [], 1
+
+    return get_results_page(results_df, page_current or 0, page_size, sort_by, filter_query)
+
+
+@app.callback(
+    Output("ontology-view", "elements"),
+    [Input("ontology-view-version", "data"),
+     Input("ontology-view-projection", "value"),
+     Input("ontology-view-predicates", "value")],
+    [State("ontology-endpoint", "children")]
+)
+def ontology_view_version_changed(ontology_view_version, projection, predicates, ontology_endpoint):
+    if ontology_view_version is None or not ontology_endpoint:
+        return ontology_view_elements
+
+    return get_cytoscape_elements(ontology_endpoint, projection, predicates or None)
+
+
+@app.callback(
+    Output("query-results-download", "href"),
+    Output("query-results-download", "style"),
+    [Input("query-result-id", "data"),
+     Input("query-results-table", "sort_by"),
+     Input("query-results-table", "filter_query")]
+)
+def query_results_download_link(result_id, sort_by, filter_query):
+    if result_id is None:
+        return '', {'display': 'none'}
+
+    arguments = urlencode({'filter': filter_query or '', 'sort': json.dumps(sort_by or [])})
+    # relative to the app's path prefix, e.g. behind a proxy or with requests_pathname_prefix
+    return f"{app.get_relative_path(f'/download/{result_id}.csv')}?{arguments}", {}
+
+
+@app.server.route('/ready')
+def ready():
+    # load balancers should only route traffic here once the ontologies are loaded
+    status = ontology_warmup.status()
+    return flask.jsonify(status), 200 if status['ready'] else 503
+
+
+@app.server.route(f"{app.config.routes_pathname_prefix}download/<result_id>.csv")
+def download_query_results(result_id):
+    try:
+        sort_by = json.loads(flask.request.args.get('sort', '[]'))
+    except ValueError:
+        flask.abort(400)
+    # a DataTable sort_by property: a list of {'column_id', 'direction'} dictionaries
+    if not isinstance(sort_by, list) or not all(
+            isinstance(s, dict) and isinstance(s.get('column_id'), str) and s.get('direction') in ('asc', 'desc')
+            for s in sort_by):
+        flask.abort(400)
+    chunks = get_result_chunks(result_store, result_id, QUERY_CHUNK_ROWS, sort_by, flask.request.args.get('filter', ''))
+    if chunks is None:
+        flask.abort(404)
+    return flask.Response(
+        flask.stream_with_context(iter_csv(chunks)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=query-results.csv'},
+    )
+
+
+# --------------------------------------------------
+# timing spans of every callback and request, logged as json; prometheus scrapes /metrics
+#
+instrument_callbacks(app)
+instrument_server(app.server)
+metrics.register_cache(get_graph_cache_stats)
+metrics.register_cache(get_query_cache_stats)
+metrics.register_cache(result_store.stats)
 
 
 ##############################################
 # Run the server
 #
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    app.run(debug=True)
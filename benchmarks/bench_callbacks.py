@@ -0,0 +1,383 @@
+"""
+Benchmark of the dashboard callbacks against data/defi/defi.owl and scaled
+copies of it, called directly and through the Flask test client.
+
+For every scale and callback the latency percentiles, the peak resident set
+size while the callback ran and the size of its JSON payload are reported.
+The first call of a scale runs against empty caches and is reported apart.
+
+    python benchmarks/bench_callbacks.py [--scales 1x,10x] [--repeat N]
+    python benchmarks/bench_callbacks.py --save-baseline     # write benchmarks/baselines/callbacks.json
+    python benchmarks/bench_callbacks.py --compare           # exit 1 when a p50 regressed
+
+--scales also takes the names of ontologies registered in data/ontologies.csv,
+e.g. by tools/generate_ontology.py --register, which need a 'Show ticker
+prices' query.
+
+Every scale runs in its own process, so the caches and the peak RSS of one
+scale do not carry over to the next.
+"""
+import argparse
+import datetime
+import inspect
+import json
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BASE_PATH = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(BASE_PATH))
+
+DEFI_ENDPOINT = BASE_PATH.joinpath('data', 'defi', 'defi.owl')
+DEFI_QUERIES = BASE_PATH.joinpath('data', 'defi', 'defi_sparql.csv')
+BASELINE_FILE = BASE_PATH.joinpath('benchmarks', 'baselines', 'callbacks.json')
+ONTOLOGIES_FILE = BASE_PATH.joinpath('data', 'ontologies.csv')
+
+# scaled copies of defi.owl: (multiple of the days, multiple of the tickers)
+SCALES = {'1x': (1, 1), '10x': (5, 2), '100x': (10, 10)}
+
+PRICE_NAMESPACE = 'http://www.semanticweb.org/sichengyun/ontologies/2023/6/'
+ONTOLOGY_NAME = 'Defi'
+QUERY_NAME = 'Show ticker prices'
+
+
+# --------------------------------------------------
+# scaled ontologies
+#
+def scale_ontology(source, days, tickers, destination):
+    """
+    Write a copy of a ticker price ontology with days times the dates and
+    tickers times the tickers.  Every copy repeats the price triples of the
+    original, subject by subject: earlier copies shift the dates back by the
+    original range, and the added tickers BTC1, BTC2, ... repeat BTC's prices.
+    :param source: ontology file
+    :param days: multiple of the dates
+    :param tickers: multiple of the tickers
+    :param destination: file to write
+    :return: number of triples written
+    """
+    from rdflib import Graph, Literal, URIRef
+    from rdflib.namespace import XSD
+
+    g = Graph()
+    g.parse(str(source), format='application/rdf+xml')
+    scaled = Graph()
+    scaled.namespace_manager = g.namespace_manager
+    prices = []
+    for s, p, o in g:
+        name = str(p)[len(PRICE_NAMESPACE):] if str(p).startswith(PRICE_NAMESPACE) else ''
+        ticker, _, field = name.rpartition('_')
+        if ticker and field in ('date', 'price'):
+            prices.append((s, ticker, field, o))
+        else:
+            scaled.add((s, p, o))
+
+    dates = [datetime.date.fromisoformat(str(o)) for _, _, field, o in prices if field == 'date']
+    span = max(dates) - min(dates) + datetime.timedelta(days=1)
+    for i in range(days):
+        for j in range(tickers):
+            for s, ticker, field, o in prices:
+                name = ticker if j == 0 else f'{ticker}{j}'
+                subject = s if i == 0 and j == 0 else URIRef(f'{s}_{i}_{j}')
+                if field == 'date' and i > 0:
+                    o = Literal((datetime.date.fromisoformat(str(o)) - i * span).isoformat(), datatype=XSD.date)
+                scaled.add((subject, URIRef(f'{PRICE_NAMESPACE}{name}_{field}'), o))
+    pathlib.Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    scaled.serialize(destination=str(destination), format='xml')
+    return len(scaled)
+
+
+def prepare_scale(scale, data_dir):
+    """
+    Write the scaled ontology, unless it exists, and a catalogue listing it.
+    :param scale: key of SCALES
+    :param data_dir: directory of the scaled ontologies
+    :return: tuple of the catalogue csv file and the ontology endpoint
+    """
+    days, tickers = SCALES[scale]
+    directory = pathlib.Path(data_dir).joinpath(scale)
+    endpoint = DEFI_ENDPOINT if (days, tickers) == (1, 1) else directory.joinpath('defi.owl')
+    if not endpoint.exists():
+        scale_ontology(DEFI_ENDPOINT, days, tickers, endpoint)
+    catalogue_file = directory.joinpath('ontologies.csv')
+    directory.mkdir(parents=True, exist_ok=True)
+    catalogue_file.write_text('Name,Description,Endpoint,Sparql\n'
+                              f'{ONTOLOGY_NAME},Defi {scale},{endpoint},{DEFI_QUERIES}\n')
+    return catalogue_file, str(endpoint)
+
+
+# --------------------------------------------------
+# measurements
+#
+class PeakRSS:
+    """
+    Samples the resident set size of this process while a block runs.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._stop.clear()
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+
+def current_rss():
+    """
+    Return the resident set size of this process in bytes; the peak so far
+    where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(fn, repeat):
+    """
+    Call fn once against cold caches and repeat times against warm ones.
+    :param fn: function returning the JSON payload size of one call
+    :param repeat: number of warm calls
+    :return: dictionary of latencies in ms, peak rss in MB and payload bytes
+    """
+    samples, peak, payload = [], 0, 0
+    for i in range(repeat + 1):
+        with PeakRSS() as rss:
+            started = time.perf_counter()
+            payload = fn()
+            elapsed = (time.perf_counter() - started) * 1000
+        peak = max(peak, rss.peak)
+        if i == 0:
+            cold = elapsed
+        else:
+            samples.append(elapsed)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if samples else (cold,) * 3
+    return {'cold_ms': round(cold, 3), 'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3),
+            'p99_ms': round(p99, 3), 'peak_rss_mb': round(peak / 2 ** 20, 1), 'payload_bytes': payload}
+
+
+# --------------------------------------------------
+# callbacks
+#
+def callback_request(app_module, function_name, inputs, state=()):
+    """
+    Return the body of the request dash sends to run a callback.
+    :param app_module: the imported app module
+    :param function_name: name of the callback function
+    :param inputs: values of its inputs, in order
+    :param state: values of its states, in order
+    :return: dictionary
+    """
+    for output, spec in app_module.app.callback_map.items():
+        if 'callback' in spec and spec['callback'].__name__ == function_name:
+            break
+    else:
+        raise KeyError(function_name)
+    outputs = [{'id': o.split('.')[0], 'property': o.split('.')[1]} for o in output.strip('.').split('...')]
+    return {
+        'output': output,
+        'outputs': outputs if output.startswith('..') else outputs[0],
+        'inputs': [dict(i, value=v) for i, v in zip(spec['inputs'], inputs)],
+        'state': [dict(s, value=v) for s, v in zip(spec['state'], state)],
+        'changedPropIds': [f"{spec['inputs'][0]['id']}.{spec['inputs'][0]['property']}"],
+    }
+
+
+def post_callback(client, body):
+    """
+    Run a callback through the Flask test client.
+    :return: response bytes
+    """
+    response = client.post('/_dash-update-component', json=body)
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f'callback failed with status {response.status_code}: {response.data[:200]!r}')
+    return response.data
+
+
+def run_scale(scale, data_dir, repeat, ontologies_file=ONTOLOGIES_FILE):
+    """
+    Benchmark every callback against one scale, or one registered ontology, in this process.
+    :return: dictionary of callback name to measurements
+    """
+    if scale in SCALES:
+        catalogue_file, endpoint = prepare_scale(scale, data_dir)
+        ontology_name = ONTOLOGY_NAME
+    else:
+        catalogue_file, ontology_name = ontologies_file, scale
+    os.environ.setdefault('QUERY_CACHE_DIR', tempfile.mkdtemp(prefix='bench-callbacks-'))
+    os.environ['WARMUP_ONTOLOGIES'] = '0'
+    import plotly.io.json
+    import app as app_module
+    from utilities.catalogue import Catalogue
+    from utilities.ont import build_ontology_as_rdflib_graph, get_cytoscape_elements
+    from utilities.projection import DEFAULT_PROJECTION
+
+    app_module.catalogue = Catalogue(catalogue_file)
+    if scale not in SCALES:
+        ontology = app_module.catalogue.ontology(ontology_name)
+        if ontology is None:
+            raise SystemExit(f'{scale} is neither a scale nor an ontology in {ontologies_file}')
+        endpoint = ontology['Endpoint']
+    template = app_module.catalogue.query(ontology_name, QUERY_NAME)
+    dates = [d.toPython() for d in build_ontology_as_rdflib_graph(endpoint).objects()
+             if getattr(d, 'datatype', None) is not None and str(d.datatype).endswith('#date')]
+    start_date, end_date = min(dates).isoformat(), max(dates).isoformat()
+    submit_state = [endpoint, template, None, None, None, None, start_date, end_date, 2, None]
+
+    def call(function_name, *args):
+        return inspect.unwrap(getattr(app_module, function_name))(*args)
+
+    def direct(function_name, *args):
+        return lambda: len(plotly.io.json.to_json_plotly(call(function_name, *args)))
+
+    client = app_module.app.server.test_client()
+
+    def http(function_name, inputs, state=()):
+        body = callback_request(app_module, function_name, inputs, state)
+        return lambda: len(post_callback(client, body))
+
+    def http_query():
+        # the submit callback starts a job; its results arrive with a poll that finds it done
+        job_id = json.loads(post_callback(client, callback_request(
+            app_module, 'submit_button_selected', [1, 0, ontology_name], [None] + submit_state)))
+        job_id = job_id['response']['query-job']['data']
+        body = callback_request(app_module, 'query_job_polled', [job_id, 0])
+        deadline = time.monotonic() + 300
+        while True:
+            data = post_callback(client, body)
+            if json.loads(data)['response']['query-job-poll']['disabled']:
+                return len(data)
+            if time.monotonic() > deadline:
+                raise TimeoutError('query job did not finish')
+            time.sleep(0.001)
+
+    # the chart draws the indicators the submitted query stored
+    chart_state = call('run_sparql_query', None, 1, *submit_state)[6]
+    cases = {
+        'ontology_select_dropdown_selected': (
+            direct('ontology_select_dropdown_selected', ontology_name),
+            http('ontology_select_dropdown_selected', [ontology_name])),
+        'sparql_query_select_dropdown_selected': (
+            direct('sparql_query_select_dropdown_selected', QUERY_NAME, ontology_name),
+            http('sparql_query_select_dropdown_selected', [QUERY_NAME], [ontology_name])),
+        'submit_button_selected': (
+            direct('run_sparql_query', None, 1, *submit_state),
+            http_query),
+        'query_results_chart': (
+            # the callback reads which input fired from its request, so it is timed through its helper
+            lambda: len(plotly.io.json.to_json_plotly(app_module.build_chart_figure(
+                app_module.result_store.get(chart_state['result_id']), chart_state['kinds'],
+                'line', uirevision=chart_state['result_id']))),
+            http('query_results_chart', [chart_state, None], ['line'])),
+        'get_cytoscape_elements': (
+            lambda: len(plotly.io.json.to_json_plotly(get_cytoscape_elements(endpoint))),
+            http('ontology_view_version_changed', [f'{endpoint}@0', DEFAULT_PROJECTION, None], [endpoint])),
+    }
+    results = {}
+    for name, (direct_call, http_call) in cases.items():
+        results[f'{name}/direct'] = measure(direct_call, repeat)
+        results[f'{name}/http'] = measure(http_call, repeat)
+    return results
+
+
+# --------------------------------------------------
+# reports and baselines
+#
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """
+    Return the callbacks whose p50 latency exceeds the baseline by more than
+    tolerance, and by more than min_delta_ms, below which timings are noise.
+    :return: list of (scale, callback, baseline p50, p50) tuples
+    """
+    regressions = []
+    for scale, callbacks in results.items():
+        for name, measured in callbacks.items():
+            before = baseline.get(scale, {}).get(name)
+            if before and measured['p50_ms'] > max(before['p50_ms'] * (1 + tolerance),
+                                                   before['p50_ms'] + min_delta_ms):
+                regressions.append((scale, name, before['p50_ms'], measured['p50_ms']))
+    return regressions
+
+
+def print_results(results):
+    width = max(len('scale'), *(len(scale) for scale in results)) + 2
+    print(f'{"scale":<{width}}{"callback":<46}{"cold ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+          f'{"rss MB":>9}{"bytes":>11}')
+    for scale, callbacks in results.items():
+        for name, m in callbacks.items():
+            print(f'{scale:<{width}}{name:<46}{m["cold_ms"]:>10.1f}{m["p50_ms"]:>10.1f}{m["p95_ms"]:>10.1f}'
+                  f'{m["p99_ms"]:>10.1f}{m["peak_rss_mb"]:>9.1f}{m["payload_bytes"]:>11}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1x,10x',
+                        help=f'comma separated, of {", ".join(SCALES)} or registered ontology names')
+    parser.add_argument('--repeat', type=int, default=20, help='warm calls per callback')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'bench-callbacks-data'),
+                        help='directory of the scaled ontologies')
+    parser.add_argument('--ontologies-file', default=str(ONTOLOGIES_FILE),
+                        help='catalogue of the ontologies named in --scales')
+    parser.add_argument('--baseline', default=str(BASELINE_FILE))
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='exit 1 when a p50 regressed against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 regression, as a fraction')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='p50 regressions below this are ignored')
+    parser.add_argument('--run-scale', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        # child process: one scale, results as json on the last line of stdout
+        print(json.dumps(run_scale(args.run_scale, args.data_dir, args.repeat, args.ontologies_file)))
+        return
+
+    results = {}
+    for scale in args.scales.split(','):
+        out = subprocess.run([sys.executable, __file__, '--run-scale', scale, '--repeat', str(args.repeat),
+                              '--data-dir', args.data_dir, '--ontologies-file', args.ontologies_file],
+                             cwd=BASE_PATH, check=True,
+                             stdout=subprocess.PIPE, text=True).stdout
+        results[scale] = json.loads(out.strip().splitlines()[-1])
+    print_results(results)
+
+    baseline_file = pathlib.Path(args.baseline)
+    if args.save_baseline:
+        baseline = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+        baseline.update(results)
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        print(f'baseline written to {baseline_file}')
+    if args.compare:
+        regressions = compare(results, json.loads(baseline_file.read_text()), args.tolerance, args.min_delta_ms)
+        for scale, name, before, after in regressions:
+            print(f'REGRESSION {scale} {name}: p50 {before:.1f} ms -> {after:.1f} ms')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
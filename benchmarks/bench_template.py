@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of sparql template rendering: the string-scanning loop that
+submit_button_selected used to run against utilities.template.
+
+    python benchmarks/bench_template.py [--repeat N]
+"""
+import argparse
+import math
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+from utilities.template import QueryTemplate, render_query_template  # noqa: E402
+
+PARAMETERS = {'start_date': '2023-01-01', 'end_date': '2023-03-01', 'precision': 2,
+              'dropdown1': 'BTC', 'dropdown2': 'ETH', 'dropdown3': 'BNB', 'dropdown4': 'XRP'}
+
+
+def render_with_loop(sparql_query_template, parameters):
+    """
+    The tag substitution loop submit_button_selected used before utilities.template.
+    """
+    sparql_query_text = sparql_query_template
+    start_tag, end_tag = "<<", ">>"
+    start_index = 0
+    while True:
+        idx_1 = sparql_query_template.find(start_tag, start_index)
+        if idx_1 == -1:
+            break
+        idx_2 = sparql_query_template.find(end_tag, start_index + len(start_tag))
+        if idx_2 == -1:
+            break
+        tag = sparql_query_template[idx_1 + len(start_tag): idx_2]
+        name_value = tag.split(':')
+
+        if name_value[1].strip() in ('dropdown1', 'dropdown2', 'dropdown3', 'dropdown4', 'start_date', 'end_date'):
+            sparql_query_text = sparql_query_text.replace(name_value[0], parameters[name_value[1].strip()])
+        elif name_value[1].strip() == 'precision':
+            sparql_query_text = sparql_query_text.replace('precision', str(math.pow(10, parameters['precision'])))
+        start_index = idx_2
+    return sparql_query_text
+
+
+def build_template(n_tickers):
+    """
+    Return a ticker price template over n_tickers tickers, with two date tags,
+    a precision tag and one ticker tag per ticker.
+    """
+    tickers = [f'ticker{i}' for i in range(n_tickers)]
+    tags = ['# <<start_date: start_date>>', '# <<end_date: end_date>>', '# <<precision: precision>>']
+    tags += [f'# <<{t}: dropdown{i % 4 + 1}>>' for i, t in enumerate(tickers)]
+    select = '\n'.join(f'(ROUND(?{t}Price*precision)/precision AS ?{t}Price)' for t in tickers)
+    where = '\n'.join(f'?{t} ns1:{t}_date ?date ;\n    ns1:{t}_price ?{t}Price .' for t in tickers)
+    return '\n'.join(tags) + f'''
+PREFIX ns1: <http://www.semanticweb.org/sichengyun/ontologies/2023/6/>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+SELECT
+{select}
+?date
+WHERE {{
+{where}
+FILTER(?date >= "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date)
+}}
+ORDER BY ?date'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000, help='renders per measurement')
+    args = parser.parse_args()
+
+    print(f'{"tags":>6} {"loop us":>10} {"parse us":>10} {"render us":>10} {"speedup":>8}')
+    for n_tickers in (4, 16, 64, 256):
+        text = build_template(n_tickers)
+        n_tags = n_tickers + 3
+        repeat = max(10, args.repeat // n_tickers)
+        loop = min(timeit.repeat(lambda: render_with_loop(text, PARAMETERS), number=repeat, repeat=5)) / repeat
+        parse = min(timeit.repeat(lambda: QueryTemplate(text), number=10, repeat=3)) / 10
+        render_query_template(text, PARAMETERS)
+        render = min(timeit.repeat(lambda: render_query_template(text, PARAMETERS), number=repeat, repeat=5)) / repeat
+        print(f'{n_tags:>6} {loop * 1e6:>10.1f} {parse * 1e6:>10.1f} {render * 1e6:>10.1f} {loop / render:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+HTTP load test of a running app: a fixed number of concurrent clients
+request the page, the layout and the ontology dropdown callback for a fixed
+duration, and the throughput and latency percentiles are reported.
+
+    python app.py                                          # dev server
+    gunicorn -c gunicorn.conf.py wsgi:application          # production server
+    python benchmarks/load_test.py --url http://127.0.0.1:8050 [--clients N] [--seconds S]
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# the outputs of ontology_select_dropdown_selected, in dash's multi-output notation
+ONTOLOGY_SELECT_OUTPUTS = [('ontology-description', 'children'), ('ontology-endpoint', 'children'),
+                           ('sparql-query-select', 'options'), ('sparql-query-select', 'disabled')]
+
+
+def ontology_select_request(ontology):
+    """
+    Return the body of the callback request dash sends when an ontology is selected.
+    """
+    return json.dumps({
+        'output': '..' + '...'.join(f'{i}.{p}' for i, p in ONTOLOGY_SELECT_OUTPUTS) + '..',
+        'outputs': [{'id': i, 'property': p} for i, p in ONTOLOGY_SELECT_OUTPUTS],
+        'inputs': [{'id': 'ontology-select', 'property': 'value', 'value': ontology}],
+        'changedPropIds': ['ontology-select.value'],
+        'state': [],
+    }).encode()
+
+
+def build_requests(url, ontology):
+    """
+    Return the (name, urllib request) pairs the clients cycle through.
+    """
+    return [
+        ('page', urllib.request.Request(f'{url}/')),
+        ('layout', urllib.request.Request(f'{url}/_dash-layout')),
+        ('ontology-select', urllib.request.Request(f'{url}/_dash-update-component',
+                                                   data=ontology_select_request(ontology),
+                                                   headers={'Content-Type': 'application/json'})),
+    ]
+
+
+def run_client(requests, deadline, latencies, errors):
+    i = 0
+    while time.perf_counter() < deadline:
+        name, request = requests[i % len(requests)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+        except (urllib.error.URLError, OSError):
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8050')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--seconds', type=float, default=30, help='duration of the test')
+    parser.add_argument('--ontology', default='Pizza', help='ontology selected by the callback requests')
+    args = parser.parse_args()
+
+    requests = build_requests(args.url.rstrip('/'), args.ontology)
+    deadline = time.perf_counter() + args.seconds
+    # one result dictionary per client, so clients never contend on them
+    results = [({}, {}) for _ in range(args.clients)]
+    clients = [threading.Thread(target=run_client, args=(requests, deadline) + r) for r in results]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    print(f'{args.url}  clients={args.clients}  seconds={elapsed:.1f}')
+    print(f'{"request":<16}{"count":>8}{"errors":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+    total = 0
+    for name, _ in requests:
+        latencies = np.array([s for r, _ in results for s in r.get(name, [])]) * 1000
+        errors = sum(e.get(name, 0) for _, e in results)
+        total += len(latencies)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+        print(f'{name:<16}{len(latencies):>8}{errors:>8}{len(latencies) / elapsed:>9.1f}'
+              f'{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}')
+    print(f'{"total":<16}{total:>8}{"":>8}{total / elapsed:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
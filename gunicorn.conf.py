@@ -0,0 +1,61 @@
+"""
+gunicorn settings for serving wsgi:application.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is imported once in the master process, which loads every listed
+ontology before forking the workers, so the parsed graphs, price indexes and
+compiled queries are shared copy-on-write instead of being loaded per worker.
+"""
+import gc
+import multiprocessing
+import os
+
+# --------------------------------------------------
+# settings, each overridable from the environment
+#
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8050')
+
+# worker processes; every worker holds its own copy of the pages it writes to
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+
+# threads per worker; callbacks that wait on queries or the disk overlap
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# load the app and the ontologies in the master before forking
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+# seconds a worker may spend on one request before it is restarted
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# seconds the master waits for the ontologies to load before forking anyway
+preload_timeout = float(os.environ.get('GUNICORN_PRELOAD_TIMEOUT', 600))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', None)
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+# --------------------------------------------------
+# server hooks
+#
+def when_ready(server):
+    """
+    Finish loading the ontologies before the first worker is forked.
+    Forking while a warm-up thread holds a lock would leave the lock held in
+    every worker, and ontologies loaded after the fork are not shared.
+    """
+    if not server.cfg.preload_app:
+        return
+    from app import ontology_warmup
+    if ontology_warmup.wait(preload_timeout):
+        server.log.info('ontologies loaded: %s', ontology_warmup.status()['ontologies'])
+    else:
+        server.log.warning('ontologies still loading after %s s; workers load the rest on first use', preload_timeout)
+    # move the loaded objects out of the collector's reach, so collections in
+    # the workers do not write to (and so copy) the shared pages
+    gc.collect()
+    gc.freeze()
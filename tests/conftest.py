@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import XSD
+
+# the cache directories are created when utilities.ont is imported; keep them out of the user's cache
+os.environ.setdefault('QUERY_CACHE_DIR', os.path.join(tempfile.mkdtemp(prefix='semantic-web-tests-'), 'cache'))
+os.environ.setdefault('INSTRUMENTATION_LOG', '')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PRICE_NAMESPACE = 'http://www.semanticweb.org/sichengyun/ontologies/2023/6/'
+
+
+@pytest.fixture(scope='session')
+def price_ontology(tmp_path_factory):
+    """
+    An ontology of 90 days of BTC and ETH prices, in the layout of defi.owl.
+    """
+    g = Graph()
+    rng = np.random.default_rng(0)
+    for ticker in ('BTC', 'ETH'):
+        for i, date in enumerate(pd.date_range('2023-01-01', periods=90)):
+            observation = URIRef(f'{PRICE_NAMESPACE}{ticker}_{i}')
+            g.add((observation, URIRef(f'{PRICE_NAMESPACE}{ticker}_date'), Literal(date.date(), datatype=XSD.date)))
+            g.add((observation, URIRef(f'{PRICE_NAMESPACE}{ticker}_price'),
+                   Literal(f'{100 + 10 * rng.random():.4f}', datatype=XSD.decimal)))
+    path = tmp_path_factory.mktemp('ontology') / 'prices.owl'
+    g.serialize(str(path), format='application/rdf+xml')
+    return str(path)
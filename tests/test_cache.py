@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+from utilities.cache import DiskCache, LRUCache, private_directory
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+def age(cache, key, seconds):
+    # entries are evicted by modification time, oldest first
+    path = cache._path(key)
+    mtime = os.stat(path).st_mtime - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_put_and_get(directory):
+    cache = DiskCache(directory, 1024 * 1024)
+    cache.put(('endpoint', 'query'), {'rows': [1, 2]})
+    assert cache.get(('endpoint', 'query')) == {'rows': [1, 2]}
+    assert ('endpoint', 'query') in cache
+    assert cache.get('missing', 'default') == 'default'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_shared_by_instances(directory):
+    DiskCache(directory, 1024 * 1024).put('key', 'value')
+    assert DiskCache(directory, 1024 * 1024).get('key') == 'value'
+
+
+def test_ttl(directory):
+    cache = DiskCache(directory, 1024 * 1024, ttl=0.2)
+    cache.put('short', 1)
+    cache.put('long', 2, ttl=60)
+    assert cache.get('short') == 1
+    time.sleep(0.3)
+    assert cache.get('short') is None
+    # an expired entry is removed when it is read
+    assert 'short' not in cache
+    assert cache.get('long') == 2
+
+
+def test_without_ttl_entries_do_not_expire(directory):
+    cache = DiskCache(directory, 1024 * 1024)
+    cache.put('key', 'value')
+    age(cache, 'key', 10 * 365 * 24 * 3600)
+    assert cache.get('key') == 'value'
+
+
+def test_eviction_drops_the_least_recently_used(directory):
+    value = 'x' * 1000
+    cache = DiskCache(directory, 3500)
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, value)
+        age(cache, key, 100 - i)
+    # reading an entry makes it the most recently used
+    assert cache.get('a') == value
+    cache.put('d', value)
+    assert 'b' not in cache
+    assert all(key in cache for key in ('a', 'c', 'd'))
+    assert cache.stats()['evictions'] == 1
+
+
+def test_eviction_keeps_the_newest_entry(directory):
+    cache = DiskCache(directory, 10)
+    cache.put('small', 1)
+    age(cache, 'small', 10)
+    cache.put('large', 'x' * 1000)
+    assert 'small' not in cache
+    assert cache.get('large') == 'x' * 1000
+
+
+def test_unreadable_entry_is_a_miss(directory):
+    cache = DiskCache(directory, 1024 * 1024)
+    cache.put('key', 'value')
+    with open(cache._path('key'), 'wb') as f:
+        f.write(b'not a pickle')
+    assert cache.get('key', 'default') == 'default'
+
+
+def test_discard_and_clear(directory):
+    cache = DiskCache(directory, 1024 * 1024)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key)
+    cache.discard('a')
+    assert 'a' not in cache and 'b' in cache
+    cache.clear()
+    assert not os.listdir(directory)
+
+
+def test_private_directory_is_created_private(directory):
+    assert private_directory(directory) == directory
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='no file owners')
+def test_directory_open_to_others_is_refused(directory):
+    os.makedirs(directory, mode=0o777)
+    os.chmod(directory, 0o777)
+    with pytest.raises(PermissionError):
+        DiskCache(directory, 1024)
+
+
+def test_symlink_is_refused(tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir(mode=0o700)
+    link = tmp_path / 'link'
+    link.symlink_to(target)
+    with pytest.raises(PermissionError):
+        private_directory(str(link))
+
+
+def test_lru_cache_budget():
+    cache = LRUCache(10)
+    cache.put('a', 1, cost=4)
+    cache.put('b', 2, cost=4)
+    cache.get('a')
+    cache.put('c', 3, cost=4)
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+    cache.put('huge', 4, cost=100)
+    assert list(cache._entries) == ['huge']
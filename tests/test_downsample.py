@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities.downsample import downsample, lttb_indices, minmax_indices
+
+
+def lttb_reference(x, y, n_out):
+    # one bucket at a time, anchored on the previous bucket's average like lttb_indices
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    means = [(x[a:b].mean(), y[a:b].mean()) for a, b in zip(edges[:-1], edges[1:])]
+    kept = [0]
+    for i, (a, b) in enumerate(zip(edges[:-1], edges[1:])):
+        px, py = (x[0], y[0]) if i == 0 else means[i - 1]
+        nx, ny = (x[-1], y[-1]) if i == len(means) - 1 else means[i + 1]
+        areas = [abs((px - nx) * (y[j] - py) - (px - x[j]) * (ny - py)) for j in range(a, b)]
+        kept.append(a + int(np.argmax(areas)))
+    kept.append(n - 1)
+    return np.array(kept)
+
+
+@pytest.mark.parametrize('n, n_out', [(10, 5), (1000, 100), (1001, 37), (5000, 1000), (7, 6)])
+def test_lttb_matches_the_reference(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.random(n)) * 1000
+    y = rng.standard_normal(n).cumsum()
+    np.testing.assert_array_equal(lttb_indices(x, y, n_out), lttb_reference(x, y, n_out))
+
+
+@pytest.mark.parametrize('n, n_out', [(100, 10), (1000, 999), (12345, 1000)])
+def test_lttb_keeps_the_ends_and_order(n, n_out):
+    x = np.arange(n, dtype=np.float64)
+    y = np.sin(x / 10)
+    kept = lttb_indices(x, y, n_out)
+    assert len(kept) == n_out
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert (np.diff(kept) > 0).all()
+
+
+@pytest.mark.parametrize('n_out', [2, 100, 1000])
+def test_lttb_keeps_short_traces(n_out):
+    x = np.arange(100, dtype=np.float64)
+    np.testing.assert_array_equal(lttb_indices(x, x, n_out), np.arange(100))
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[567] = 100
+    assert 567 in lttb_indices(x, y, 50)
+
+
+@pytest.mark.parametrize('n, n_out', [(100, 10), (1000, 101), (12345, 1000)])
+def test_minmax_keeps_every_bucket_extreme(n, n_out):
+    rng = np.random.default_rng(n)
+    y = rng.standard_normal(n)
+    kept = minmax_indices(y, n_out)
+    assert len(kept) <= n_out
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert (np.diff(kept) > 0).all()
+    buckets = (n_out - 2) // 2
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    for a, b in zip(edges[:-1], edges[1:]):
+        assert a + y[a:b].argmin() in kept
+        assert a + y[a:b].argmax() in kept
+
+
+@pytest.mark.parametrize('n_out', [3, 100, 1000])
+def test_minmax_keeps_short_traces(n_out):
+    y = np.arange(100, dtype=np.float64)
+    np.testing.assert_array_equal(minmax_indices(y, n_out), np.arange(100))
+
+
+def test_downsample_dates():
+    x = pd.date_range('2020-01-01', periods=5000).to_numpy()
+    y = np.random.default_rng(0).standard_normal(5000).cumsum()
+    dx, dy = downsample(x, y, 500)
+    assert len(dx) == len(dy) == 500
+    assert dx.dtype == x.dtype
+    assert dx[0] == x[0] and dx[-1] == x[-1]
+
+
+def test_downsample_drops_missing_values():
+    y = np.arange(10, dtype=np.float64)
+    y[[2, 5]] = np.nan
+    dx, dy = downsample(np.arange(10), y, 100)
+    assert dx.tolist() == [0, 1, 3, 4, 6, 7, 8, 9]
+    assert not np.isnan(dy).any()
+
+
+def test_downsample_string_dates():
+    x = np.array([f'2020-01-{i:02d}' for i in range(1, 29)] * 40)
+    dx, dy = downsample(x, np.arange(len(x)), 100)
+    assert len(dx) == 100
+
+
+def test_downsample_unknown_method():
+    with pytest.raises(ValueError):
+        downsample(np.arange(10), np.arange(10), 5, method='mean')
@@ -0,0 +1,161 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities.indicators import IndicatorSeries, compute_indicators, price_columns
+
+
+def prices(days=120, start='2023-01-01', tickers=('BTC', 'ETH')):
+    rng = np.random.default_rng(0)
+    dates = pd.date_range(start, periods=days)
+    df = pd.DataFrame({'date': dates})
+    for i, ticker in enumerate(tickers):
+        df[ticker] = 100 * (i + 1) + rng.standard_normal(days).cumsum()
+    return df
+
+
+def test_price_columns():
+    df = pd.DataFrame({
+        'date': ['2023-01-01'], 'BTC': [1.5], 'count': [3], 'ETH': [Decimal('2.5')],
+        'name': ['bitcoin'], 'flag': [True],
+    })
+    assert price_columns(df) == ['BTC', 'count', 'ETH']
+
+
+@pytest.mark.parametrize('window', [1, 5, 20])
+def test_indicators_match_pandas(window):
+    df = prices()
+    result, kinds = compute_indicators(df, windows=(window,), indicators=('ma', 'diff', 'vol', 'return'))
+    for ticker in ('BTC', 'ETH'):
+        mean = df[ticker].rolling(window).mean()
+        returns = df[ticker].pct_change()
+        pd.testing.assert_series_equal(result[f'{ticker}_{window}d_ma'], mean, check_names=False)
+        pd.testing.assert_series_equal(result[f'{ticker}_diff'], df[ticker] - mean, check_names=False)
+        pd.testing.assert_series_equal(result[f'{ticker}_return'], returns, check_names=False)
+        pd.testing.assert_series_equal(result[f'{ticker}_{window}d_vol'], returns.rolling(window).std(),
+                                       check_names=False)
+    assert kinds['BTC_diff'] == 'diff' and kinds[f'ETH_{window}d_vol'] == 'vol'
+
+
+def test_indicator_columns_follow_their_price_column():
+    result, kinds = compute_indicators(prices(), windows=(5, 10))
+    assert list(result.columns) == [
+        'date', 'BTC', 'ETH',
+        'BTC_5d_ma', 'BTC_diff', 'BTC_10d_ma', 'BTC_10d_diff',
+        'ETH_5d_ma', 'ETH_diff', 'ETH_10d_ma', 'ETH_10d_diff',
+    ]
+    assert kinds == {c: c.rsplit('_', 1)[1] for c in result.columns[3:]}
+
+
+def test_decimal_prices():
+    df = prices(days=30)
+    decimals = df.assign(BTC=[Decimal(str(round(p, 6))) for p in df['BTC']])
+    result, _ = compute_indicators(decimals, windows=(5,))
+    expected = df['BTC'].round(6).rolling(5).mean()
+    np.testing.assert_allclose(result['BTC_5d_ma'], expected)
+
+
+def test_missing_prices_blank_their_windows():
+    df = prices(days=30)
+    df.loc[10, 'BTC'] = np.nan
+    result, _ = compute_indicators(df, windows=(5,))
+    assert result['BTC_5d_ma'][10:15].isna().all()
+    assert result['BTC_5d_ma'][15:].notna().all()
+    assert result['ETH_5d_ma'][4:].notna().all()
+
+
+def test_unknown_indicator():
+    with pytest.raises(ValueError):
+        compute_indicators(prices(), indicators=('ma', 'rsi'))
+
+
+def day(text):
+    return np.datetime64(text, 'D')
+
+
+class Fetcher:
+    """
+    Query results of a date range out of a full price table, recording the ranges asked for.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        dates = self.df['date'].to_numpy().astype('datetime64[D]')
+        return self.df[(dates >= start) & (dates <= end)].reset_index(drop=True)
+
+
+def fresh(df, start, end, windows=(5, 10)):
+    # what a new query over the range would compute
+    rows = Fetcher(df)(day(start), day(end))
+    return compute_indicators(rows, windows)[0]
+
+
+@pytest.fixture
+def series():
+    df = prices()
+    fetch = Fetcher(df)
+    series = IndicatorSeries(fetch(day('2023-02-01'), day('2023-02-28')), day('2023-02-01'), day('2023-02-28'),
+                             windows=(5, 10))
+    fetch.calls.clear()
+    return df, fetch, series
+
+
+def test_append(series):
+    df, fetch, series = series
+    _, frame = series.select(day('2023-02-01'), day('2023-03-15'), fetch)
+    assert fetch.calls == [(day('2023-03-01'), day('2023-03-15'))]
+    pd.testing.assert_frame_equal(frame, fresh(df, '2023-02-01', '2023-03-15'))
+
+
+def test_append_a_day_at_a_time(series):
+    df, fetch, series = series
+    for end in pd.date_range('2023-03-01', '2023-03-10'):
+        series.select(day('2023-02-01'), day(end.date().isoformat()), fetch)
+    assert len(fetch.calls) == 10
+    _, frame = series.select(day('2023-02-01'), day('2023-03-10'), fetch)
+    pd.testing.assert_frame_equal(frame, fresh(df, '2023-02-01', '2023-03-10'))
+
+
+def test_prepend(series):
+    df, fetch, series = series
+    _, frame = series.select(day('2023-01-15'), day('2023-02-28'), fetch)
+    assert fetch.calls == [(day('2023-01-15'), day('2023-01-31'))]
+    pd.testing.assert_frame_equal(frame, fresh(df, '2023-01-15', '2023-02-28'))
+
+
+def test_prepend_and_append(series):
+    df, fetch, series = series
+    rows, frame = series.select(day('2023-01-20'), day('2023-03-05'), fetch)
+    assert fetch.calls == [(day('2023-01-20'), day('2023-01-31')), (day('2023-03-01'), day('2023-03-05'))]
+    expected = fresh(df, '2023-01-20', '2023-03-05')
+    pd.testing.assert_frame_equal(frame, expected)
+    pd.testing.assert_frame_equal(rows, expected[['date', 'BTC', 'ETH']])
+
+
+def test_narrower_range_starts_without_history(series):
+    df, fetch, series = series
+    _, frame = series.select(day('2023-02-10'), day('2023-02-20'), fetch)
+    assert fetch.calls == []
+    pd.testing.assert_frame_equal(frame, fresh(df, '2023-02-10', '2023-02-20'))
+
+
+def test_range_without_rows(series):
+    df, fetch, series = series
+    _, frame = series.select(day('2023-02-01'), day('2023-12-31'), fetch)
+    # the price table ends on 2023-04-30
+    pd.testing.assert_frame_equal(frame, fresh(df, '2023-02-01', '2023-04-30'))
+    assert series.end == day('2023-12-31')
+
+
+def test_supports():
+    df = prices(days=5)
+    assert IndicatorSeries.supports(df)
+    assert not IndicatorSeries.supports(df.iloc[::-1])
+    assert not IndicatorSeries.supports(df.drop(columns='date'))
+    assert not IndicatorSeries.supports(df.assign(date=['not a date'] * 5))
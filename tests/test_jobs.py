@@ -0,0 +1,107 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from utilities.cache import DiskCache
+from utilities.jobs import JobRunner
+from utilities.ont import single_flight
+
+
+@pytest.fixture
+def runner(tmp_path):
+    return JobRunner(DiskCache(str(tmp_path / 'jobs'), 1024 * 1024, ttl=60))
+
+
+def wait(runner, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while runner.status(job_id)['state'] == 'running':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return runner.status(job_id)
+
+
+def test_result(runner):
+    job_id = runner.submit(lambda set_progress, a, b: a + b, 2, 3)
+    assert wait(runner, job_id) == {'state': 'done', 'progress': '', 'result': 5}
+
+
+def test_progress(runner):
+    started, release = threading.Event(), threading.Event()
+
+    def job(set_progress):
+        set_progress('Running query...')
+        started.set()
+        release.wait(10)
+        return 'rows'
+
+    job_id = runner.submit(job)
+    started.wait(10)
+    assert runner.status(job_id) == {'state': 'running', 'progress': 'Running query...'}
+    release.set()
+    assert wait(runner, job_id)['result'] == 'rows'
+
+
+def test_cancel_stops_at_the_next_progress_report(runner):
+    started, release = threading.Event(), threading.Event()
+    reached = []
+
+    def job(set_progress):
+        set_progress('Running query...')
+        started.set()
+        release.wait(10)
+        set_progress('Storing results...')
+        reached.append('stored')
+        return 'rows'
+
+    job_id = runner.submit(job)
+    started.wait(10)
+    runner.cancel(job_id)
+    release.set()
+    time.sleep(0.1)
+    assert runner.status(job_id)['state'] == 'cancelled'
+    assert runner.cancelled(job_id)
+    assert reached == []
+
+
+def test_error(runner):
+    job_id = runner.submit(lambda set_progress: 1 / 0)
+    assert wait(runner, job_id) == {'state': 'error', 'progress': 'ZeroDivisionError: division by zero'}
+
+
+def test_status_is_shared_through_the_store(runner):
+    job_id = runner.submit(lambda set_progress: 'rows')
+    wait(runner, job_id)
+    # another worker process reads the same directory
+    other = JobRunner(DiskCache(runner.store.directory, 1024 * 1024))
+    assert other.status(job_id)['result'] == 'rows'
+    assert other.status('unknown') == {'state': 'missing', 'progress': ''}
+
+
+def hold_lock(key, held, release):
+    with single_flight(key) as locked:
+        assert locked
+        held.set()
+        release.wait(10)
+
+
+def test_single_flight_serialises_a_key_across_processes():
+    held, release = multiprocessing.Event(), multiprocessing.Event()
+    process = multiprocessing.Process(target=hold_lock, args=(('endpoint', 'query'), held, release))
+    process.start()
+    try:
+        assert held.wait(10)
+        started = time.monotonic()
+        with single_flight(('endpoint', 'query'), timeout=0.3) as locked:
+            # the wait is bounded; the caller goes ahead without the lock
+            assert not locked
+        assert 0.3 <= time.monotonic() - started < 2
+        # other keys are not held up
+        with single_flight(('endpoint', 'another query'), timeout=0) as locked:
+            assert locked
+    finally:
+        release.set()
+        process.join(10)
+    with single_flight(('endpoint', 'query'), timeout=0) as locked:
+        assert locked
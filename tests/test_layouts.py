@@ -0,0 +1,124 @@
+import networkx as nx
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import OWL, RDF, RDFS
+
+from utilities.layouts import LAYOUTS, NODE_SPACING, compute_layout, elements_to_networkx
+from utilities.ont import LayoutExecutor, OntologyVersionChanged
+from utilities.ont import build_cytoscape_layout, get_cytoscape_layout, get_ontology_version
+
+NS = 'http://example.org/'
+
+
+def tree():
+    g = nx.Graph()
+    g.add_edges_from([('root', 'a'), ('root', 'b'), ('root', 'c'), ('a', 'd')])
+    g.add_node('alone')
+    return g
+
+
+@pytest.mark.parametrize('name', LAYOUTS)
+def test_every_node_gets_a_distinct_position(name):
+    positions = compute_layout(tree(), name)
+    assert set(positions) == {'root', 'a', 'b', 'c', 'd', 'alone'}
+    assert len({(p['x'], p['y']) for p in positions.values()}) == len(positions)
+
+
+@pytest.mark.parametrize('name', LAYOUTS)
+def test_layouts_are_stable(name):
+    assert compute_layout(tree(), name) == compute_layout(tree(), name)
+
+
+@pytest.mark.parametrize('name', LAYOUTS)
+def test_empty_graph(name):
+    assert compute_layout(nx.Graph(), name) == {}
+
+
+def test_unknown_layout():
+    with pytest.raises(ValueError):
+        compute_layout(tree(), 'cose')
+
+
+def test_grid():
+    positions = compute_layout(tree(), 'grid')
+    # six nodes on a 3 x 3 grid
+    assert {p['x'] for p in positions.values()} == {0, NODE_SPACING, 2 * NODE_SPACING}
+    assert {p['y'] for p in positions.values()} == {0, NODE_SPACING}
+
+
+def test_breadthfirst_levels():
+    positions = compute_layout(tree(), 'breadthfirst')
+    assert positions['root']['y'] == 0
+    assert positions['a']['y'] == positions['b']['y'] == positions['c']['y'] == NODE_SPACING
+    assert positions['d']['y'] == 2 * NODE_SPACING
+    # the second component is laid out beside the first
+    assert positions['alone']['x'] > max(p['x'] for node, p in positions.items() if node != 'alone')
+
+
+def test_concentric_rings_do_not_overlap():
+    positions = compute_layout(tree(), 'concentric')
+    radii = {node: round((p['x'] ** 2 + p['y'] ** 2) ** 0.5, 1) for node, p in positions.items()}
+    assert radii['root'] == 0
+    # one level per degree: 3, 2, 1 and 0
+    assert 0 < radii['a'] < radii['b'] == radii['c'] == radii['d'] < radii['alone']
+
+
+def test_concentric_puts_the_best_connected_node_in_the_middle():
+    positions = compute_layout(nx.star_graph(6), 'concentric')
+    assert positions['0'] == {'x': 0.0, 'y': 0.0}
+    assert all(p != {'x': 0.0, 'y': 0.0} for node, p in positions.items() if node != '0')
+
+
+def test_directed_breadthfirst():
+    g = nx.DiGraph([('a', 'b'), ('c', 'b')])
+    positions = compute_layout(g, 'breadthfirst')
+    # followed in both directions: one component
+    assert positions['b']['y'] == 0
+    assert positions['a']['y'] == positions['c']['y'] == NODE_SPACING
+
+
+def test_elements_to_networkx():
+    elements = [
+        {'data': {'id': 'a', 'label': 'a'}},
+        {'data': {'id': 'b', 'label': 'b'}},
+        {'data': {'source': 'a', 'target': 'b', 'label': 'p'}},
+    ]
+    g = elements_to_networkx(elements)
+    assert set(g.nodes) == {'a', 'b'}
+    assert list(g.edges) == [('a', 'b')]
+
+
+@pytest.fixture
+def endpoint(tmp_path):
+    g = Graph()
+    for name in ('Asset', 'Coin', 'Token'):
+        g.add((URIRef(NS + name), RDF.type, OWL.Class))
+    g.add((URIRef(NS + 'Coin'), RDFS.subClassOf, URIRef(NS + 'Asset')))
+    g.add((URIRef(NS + 'Token'), RDFS.subClassOf, URIRef(NS + 'Asset')))
+    g.add((URIRef(NS + 'btc'), RDFS.label, Literal('bitcoin')))
+    path = tmp_path / 'classes.owl'
+    g.serialize(str(path), format='application/rdf+xml')
+    return str(path)
+
+
+def test_cytoscape_layout(endpoint):
+    positions = get_cytoscape_layout(endpoint, 'grid')
+    assert set(positions) == {NS + 'Asset', NS + 'Coin', NS + 'Token'}
+    assert get_cytoscape_layout(endpoint, 'grid') is positions
+
+
+def test_layout_of_another_version_is_refused(endpoint):
+    with pytest.raises(OntologyVersionChanged):
+        build_cytoscape_layout(endpoint, 'grid', version='0-0')
+    assert build_cytoscape_layout(endpoint, 'grid', version=get_ontology_version(endpoint))
+
+
+def test_layout_worker_checks_the_version(endpoint):
+    executor = LayoutExecutor(1, timeout=60)
+    try:
+        with pytest.raises(OntologyVersionChanged):
+            executor.run(endpoint, 'grid', version='0-0')
+        positions = executor.run(endpoint, 'grid', version=get_ontology_version(endpoint))
+        assert positions == build_cytoscape_layout(endpoint, 'grid')
+    finally:
+        executor.close()
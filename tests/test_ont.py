@@ -0,0 +1,317 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdflib import Graph, Literal, URIRef, Variable
+from rdflib.namespace import OWL, RDF, XSD
+
+from conftest import PRICE_NAMESPACE
+from utilities import ont
+from utilities.cache import LRUCache
+from utilities.ont import QueryResult, bindings_to_dataframe
+from utilities.ont import build_ontology_as_rdflib_graph, clear_graph_cache, get_graph_cache_stats
+from utilities.ont import get_ontology_version, get_snapshot_path
+from utilities.ont import get_prepared_query, get_sparql_query_results, get_sparql_template_indicators
+from utilities.ont import has_inclusive_date_range, iter_sparql_query_results, iter_sparql_template_results
+from utilities.serialization import read_snapshot_header
+from utilities.template import render_query_template
+
+PREFIXES = f'PREFIX ns1: <{PRICE_NAMESPACE}>\nPREFIX xsd: <http://www.w3.org/2001/XMLSchema#>\n'
+
+
+def price_template(select='?date ?BTCPrice ?ETHPrice', date_filter='?date >= "start_date"^^xsd:date && '
+                   '?date <= "end_date"^^xsd:date', modifiers='ORDER BY ?date'):
+    return f'''# <<start_date: start_date>>
+# <<end_date: end_date>>
+{PREFIXES}
+SELECT {select} WHERE {{
+    ?BTC ns1:BTC_date ?date ; ns1:BTC_price ?BTCPrice .
+    ?ETH ns1:ETH_date ?date ; ns1:ETH_price ?ETHPrice .
+    FILTER({date_filter})
+}}
+{modifiers}'''
+
+
+INCLUSIVE = price_template()
+EXCLUSIVE = price_template(date_filter='?date > "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date')
+LIMITED = price_template(modifiers='ORDER BY ?date LIMIT 40')
+DISTINCT = price_template(select='DISTINCT ?date ?BTCPrice ?ETHPrice')
+LITERAL_BOUND = price_template(date_filter='?date >= "start_date"^^xsd:date && ?date <= "2023-03-31"^^xsd:date')
+
+
+@pytest.mark.parametrize('template, expected', [
+    (INCLUSIVE, True),
+    (EXCLUSIVE, False),
+    (LIMITED, False),
+    (DISTINCT, False),
+    (LITERAL_BOUND, False),
+], ids=['inclusive', 'exclusive', 'limit', 'distinct', 'literal bound'])
+def test_has_inclusive_date_range(price_ontology, template, expected):
+    assert has_inclusive_date_range(get_prepared_query(price_ontology, template, is_template=True)) is expected
+
+
+@pytest.mark.parametrize('template', [INCLUSIVE, EXCLUSIVE, LIMITED, DISTINCT, LITERAL_BOUND],
+                         ids=['inclusive', 'exclusive', 'limit', 'distinct', 'literal bound'])
+def test_indicators_follow_the_date_range(price_ontology, template):
+    # widen, then narrow: each result must be the one a fresh query of the range gives
+    for start, end in (('2023-01-10', '2023-01-20'), ('2023-01-05', '2023-02-20'), ('2023-01-15', '2023-01-25'),
+                       ('2023-01-01', '2023-03-31')):
+        parameters = {'start_date': start, 'end_date': end}
+        _, dataframe, frame, _ = get_sparql_template_indicators(price_ontology, template, parameters, windows=(5,))
+        expected = get_sparql_query_results(price_ontology, render_query_template(template, parameters)).dataframe
+        pd.testing.assert_frame_equal(dataframe.reset_index(drop=True), expected, check_dtype=False)
+        assert len(frame) == len(expected)
+
+
+# answered by the price index, and by the sparql evaluator, which the OPTIONAL keeps the query away from
+CHUNKED = [
+    PREFIXES + 'SELECT ?date ?BTCPrice WHERE { ?BTC ns1:BTC_date ?date ; ns1:BTC_price ?BTCPrice . } ORDER BY ?date',
+    PREFIXES + '''SELECT ?date ?BTCPrice WHERE {
+        ?BTC ns1:BTC_date ?date OPTIONAL { ?BTC ns1:BTC_price ?BTCPrice }
+    } ORDER BY ?date''',
+]
+
+
+@pytest.mark.parametrize('query', CHUNKED, ids=['price index', 'evaluator'])
+@pytest.mark.parametrize('chunk_size', [1, 7, 90, 1000])
+def test_iter_sparql_query_results(price_ontology, query, chunk_size):
+    chunks = list(iter_sparql_query_results(price_ontology, query, chunk_size))
+    # full chunks, then the rest
+    full, rest = divmod(90, chunk_size)
+    assert [len(c) for c in chunks] == [chunk_size] * full + ([rest] if rest else [])
+    for chunk in chunks:
+        assert pd.api.types.is_datetime64_any_dtype(chunk['date'])
+        assert chunk['BTCPrice'].dtype == np.float64
+    expected = get_sparql_query_results(price_ontology, query).dataframe
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+
+def test_iter_sparql_query_results_defaults_to_query_chunk_rows(price_ontology, monkeypatch):
+    monkeypatch.setattr(ont, 'QUERY_CHUNK_ROWS', 40)
+    assert [len(c) for c in iter_sparql_query_results(price_ontology, CHUNKED[1])] == [40, 40, 10]
+
+
+def test_iter_sparql_template_results(price_ontology):
+    parameters = {'start_date': '2023-01-10', 'end_date': '2023-02-20'}
+    chunks = list(iter_sparql_template_results(price_ontology, INCLUSIVE, parameters, 10))
+    assert [len(c) for c in chunks] == [10, 10, 10, 10, 2]
+    expected = get_sparql_query_results(price_ontology, render_query_template(INCLUSIVE, parameters)).dataframe
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+
+# --------------------------------------------------
+# parsed ontology cache
+#
+@pytest.fixture
+def small_ontology(tmp_path):
+    g = Graph()
+    g.add((URIRef(PRICE_NAMESPACE + 'Coin'), RDF.type, OWL.Class))
+    path = tmp_path / 'small.owl'
+    g.serialize(str(path), format='application/rdf+xml')
+    return str(path)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    # endpoints whose snapshot was loaded, i.e. every miss of the graph cache
+    calls = []
+
+    def load(endpoint, fmt='application/rdf+xml'):
+        calls.append(endpoint)
+        return load_snapshot(endpoint, fmt)
+
+    load_snapshot = ont.load_ontology_snapshot
+    monkeypatch.setattr(ont, 'load_ontology_snapshot', load)
+    return calls
+
+
+def touch(path, seconds=1):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + int(seconds * 1e9)))
+
+
+def test_ontology_version(small_ontology, tmp_path):
+    st = os.stat(small_ontology)
+    assert get_ontology_version(small_ontology) == f'{st.st_mtime_ns}-{st.st_size}'
+    touch(small_ontology)
+    assert get_ontology_version(small_ontology) != f'{st.st_mtime_ns}-{st.st_size}'
+    assert get_ontology_version(str(tmp_path / 'missing.owl')) is None
+    assert get_ontology_version(None) is None
+
+
+def test_graph_cache_hit(small_ontology, loads):
+    hits = get_graph_cache_stats()['hits']
+    g = build_ontology_as_rdflib_graph(small_ontology)
+    assert build_ontology_as_rdflib_graph(small_ontology) is g
+    assert loads == [small_ontology]
+    assert get_graph_cache_stats()['hits'] == hits + 1
+
+
+def test_touched_ontology_is_parsed_again(small_ontology, loads):
+    g = build_ontology_as_rdflib_graph(small_ontology)
+    touch(small_ontology)
+    reloaded = build_ontology_as_rdflib_graph(small_ontology)
+    assert reloaded is not g
+    assert loads == [small_ontology, small_ontology]
+    # the snapshot was written again for the new version, and the old version was dropped
+    metadata = read_snapshot_header(get_snapshot_path(small_ontology))['metadata']
+    assert metadata['source_version'] == get_ontology_version(small_ontology)
+    assert [k for k in ont._graph_cache._entries if k[0] == small_ontology] == [
+        (small_ontology, 'application/rdf+xml', get_ontology_version(small_ontology))]
+    # unchanged since, so a hit
+    assert build_ontology_as_rdflib_graph(small_ontology) is reloaded
+    assert len(loads) == 2
+
+
+def test_changed_ontology_is_parsed_again(small_ontology, loads):
+    g = build_ontology_as_rdflib_graph(small_ontology)
+    changed = Graph()
+    changed.add((URIRef(PRICE_NAMESPACE + 'Token'), RDF.type, OWL.Class))
+    changed.serialize(small_ontology, format='application/rdf+xml')
+    touch(small_ontology)
+    reloaded = build_ontology_as_rdflib_graph(small_ontology)
+    assert (URIRef(PRICE_NAMESPACE + 'Token'), RDF.type, OWL.Class) in reloaded
+    assert (URIRef(PRICE_NAMESPACE + 'Coin'), RDF.type, OWL.Class) in g
+
+
+def test_graph_cache_eviction(small_ontology, price_ontology, loads, monkeypatch):
+    # a budget below one graph keeps only the newest
+    monkeypatch.setattr(ont, '_graph_cache', LRUCache(1, name='graph'))
+    build_ontology_as_rdflib_graph(small_ontology)
+    build_ontology_as_rdflib_graph(price_ontology)
+    build_ontology_as_rdflib_graph(small_ontology)
+    assert loads == [small_ontology, price_ontology, small_ontology]
+    stats = get_graph_cache_stats()
+    assert (stats['misses'], stats['hits'], stats['evictions'], stats['entries']) == (3, 0, 2, 1)
+    assert stats['cost'] == build_ontology_as_rdflib_graph(small_ontology).store.nbytes
+
+
+def test_clear_graph_cache(small_ontology, loads):
+    g = build_ontology_as_rdflib_graph(small_ontology)
+    clear_graph_cache()
+    assert build_ontology_as_rdflib_graph(small_ontology) is not g
+    assert loads == [small_ontology, small_ontology]
+
+
+# --------------------------------------------------
+# prepared queries
+#
+ROUNDED = f'''# <<start_date: start_date>>
+# <<end_date: end_date>>
+# <<precision: precision>>
+{PREFIXES}
+SELECT (ROUND(?BTCPrice*precision)/precision AS ?BTCPrice) (ROUND(?ETHPrice*precision)/precision AS ?ETHPrice) ?date
+WHERE {{
+    ?BTC ns1:BTC_date ?date ; ns1:BTC_price ?BTCPrice .
+    ?ETH ns1:ETH_date ?date ; ns1:ETH_price ?ETHPrice .
+    FILTER(?date >= "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date)
+}}
+ORDER BY ?date'''
+
+
+def evaluate(endpoint, text, is_template=False, bindings=None):
+    # with the sparql evaluator, bypassing the price index
+    prepared = ont.PreparedQuery(text, dict(build_ontology_as_rdflib_graph(endpoint).namespaces()), is_template)
+    prepared.price_query = None
+    return prepared.execute(endpoint, bindings).dataframe
+
+
+@pytest.mark.parametrize('template', [ROUNDED, INCLUSIVE, EXCLUSIVE, LIMITED], ids=['rounded', 'inclusive',
+                                                                                 'exclusive', 'limit'])
+@pytest.mark.parametrize('parameters', [
+    {'start_date': '2023-01-10', 'end_date': '2023-02-20', 'precision': 2},
+    {'start_date': '2023-01-01', 'end_date': '2023-12-31', 'precision': 0},
+    {'start_date': '2023-02-01', 'end_date': '2023-02-01', 'precision': 4},
+    {'start_date': '2023-03-01', 'end_date': '2023-02-01', 'precision': 1},
+], ids=['range', 'everything', 'one day', 'empty'])
+def test_bound_template_matches_the_rendered_query(price_ontology, template, parameters):
+    prepared = get_prepared_query(price_ontology, template, is_template=True)
+    assert prepared.query is not None
+    bound = evaluate(price_ontology, template, True, prepared.bindings(parameters))
+    rendered = evaluate(price_ontology, render_query_template(template, parameters))
+    pd.testing.assert_frame_equal(bound, rendered)
+    if prepared.price_query is not None:
+        # and the price index agrees with both
+        pd.testing.assert_frame_equal(prepared.execute(price_ontology, prepared.bindings(parameters)).dataframe,
+                                      rendered, check_dtype=False)
+
+
+# --------------------------------------------------
+# typed results
+#
+def test_bindings_to_dataframe_types():
+    date, price, count, name = (Variable(v) for v in ('date', 'price', 'count', 'name'))
+    rows = [
+        {date: Literal('2023-01-01', datatype=XSD.date), price: Literal('16500.5', datatype=XSD.decimal),
+         count: Literal(1), name: URIRef(PRICE_NAMESPACE + 'BTC')},
+        {date: Literal('2023-01-02', datatype=XSD.date), price: Literal('1.25e3', datatype=XSD.double),
+         count: Literal(2), name: Literal('ether')},
+    ]
+    df = bindings_to_dataframe(rows, [date, price, count, name])
+    assert list(df.columns) == ['date', 'price', 'count', 'name']
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+    assert df['date'].dt.strftime('%Y-%m-%d').tolist() == ['2023-01-01', '2023-01-02']
+    assert df['price'].dtype == np.float64
+    assert df['price'].tolist() == [16500.5, 1250.0]
+    assert df['count'].dtype == np.int64
+    # other terms keep their python values; pandas may hold them as strings
+    assert not pd.api.types.is_numeric_dtype(df['name'])
+    assert [str(v) for v in df['name']] == [PRICE_NAMESPACE + 'BTC', 'ether']
+
+
+def test_bindings_to_dataframe_missing_values():
+    date, price, count = Variable('date'), Variable('price'), Variable('count')
+    rows = [
+        {date: Literal('2023-01-01', datatype=XSD.date), price: Literal('1.5', datatype=XSD.decimal),
+         count: Literal(1)},
+        {date: Literal('2023-01-02', datatype=XSD.date)},
+        # rows binding nothing are dropped, like rdflib drops them
+        {},
+        {price: Literal('', datatype=XSD.decimal)},
+    ]
+    df = bindings_to_dataframe(rows, [date, price, count])
+    assert len(df) == 3
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+    assert df['date'].isna().tolist() == [False, False, True]
+    # an ill-typed decimal is missing too; a missing integer makes the column float
+    assert df['price'].dtype == np.float64
+    assert df['price'].isna().tolist() == [False, True, True]
+    assert df['count'].dtype == np.float64
+    assert df['count'].isna().tolist() == [False, True, True]
+
+
+def test_optional_values_become_missing(price_ontology):
+    query = PREFIXES + '''SELECT ?date ?BTCPrice ?volume WHERE {
+        ?BTC ns1:BTC_date ?date OPTIONAL { ?BTC ns1:BTC_price ?BTCPrice FILTER(?date < "2023-01-05"^^xsd:date) }
+        OPTIONAL { ?BTC ns1:BTC_volume ?volume }
+    } ORDER BY ?date LIMIT 10'''
+    result = get_sparql_query_results(price_ontology, query)
+    df = result.dataframe
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+    assert df['BTCPrice'].dtype == np.float64
+    assert df['BTCPrice'].isna().tolist() == [False] * 4 + [True] * 6
+    assert df['volume'].isna().all()
+    # the table gets json-friendly records: ISO dates and None for missing values
+    assert result.records[0]['date'] == '2023-01-01'
+    assert isinstance(result.records[0]['BTCPrice'], float)
+    assert result.records[4]['BTCPrice'] is None
+    assert result.records[0]['volume'] is None
+
+
+def test_query_result():
+    df = pd.DataFrame({'date': pd.to_datetime(['2023-01-01']), 'price': [1.5]})
+    result = QueryResult(df)
+    assert len(result) == 1
+    assert result.columns == [{'name': 'date', 'id': 'date'}, {'name': 'price', 'id': 'price'}]
+    assert result.records == [{'date': '2023-01-01', 'price': 1.5}]
+    # the former tuple interface
+    records, columns, dataframe = result
+    assert (records, columns) == (result.records, result.columns)
+    assert dataframe is df
+    # records are derived again after unpickling
+    restored = pickle.loads(pickle.dumps(result))
+    assert restored._records is None
+    pd.testing.assert_frame_equal(restored.dataframe, df)
+    assert restored.records == result.records
@@ -0,0 +1,104 @@
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import OWL, RDF, RDFS
+
+from utilities.projection import PROJECTIONS, graph_predicates, local_name, project_graph
+
+NS = 'http://example.org/defi#'
+
+
+def uri(name):
+    return URIRef(NS + name)
+
+
+@pytest.fixture
+def graph():
+    g = Graph()
+    for name in ('Asset', 'Coin', 'Token'):
+        g.add((uri(name), RDF.type, OWL.Class))
+    g.add((uri('Coin'), RDFS.subClassOf, uri('Asset')))
+    g.add((uri('Token'), RDFS.subClassOf, uri('Asset')))
+    # a restriction is a blank node and no part of the hierarchy
+    restriction = BNode()
+    g.add((restriction, RDF.type, OWL.Restriction))
+    g.add((uri('Token'), RDFS.subClassOf, restriction))
+    g.add((uri('btc'), RDF.type, uri('Coin')))
+    g.add((uri('btc'), uri('symbol'), Literal('BTC')))
+    g.add((uri('btc'), uri('price'), Literal('101.5')))
+    g.add((uri('btc'), uri('price'), Literal('102.5')))
+    return g
+
+
+def split(elements):
+    nodes = {e['data']['id']: e['data'] for e in elements if 'source' not in e['data']}
+    edges = {(e['data']['source'], e['data']['label'], e['data']['target'])
+             for e in elements if 'source' in e['data']}
+    return nodes, edges
+
+
+def test_classes(graph):
+    nodes, edges = split(project_graph(graph, 'classes'))
+    assert set(nodes) == {NS + 'Asset', NS + 'Coin', NS + 'Token'}
+    assert nodes[NS + 'Coin']['label'] == 'Coin'
+    assert edges == {(NS + 'Coin', 'subClassOf', NS + 'Asset'), (NS + 'Token', 'subClassOf', NS + 'Asset')}
+
+
+def test_classes_ignore_predicates(graph):
+    assert project_graph(graph, 'classes', [NS + 'symbol']) == project_graph(graph, 'classes')
+
+
+def test_individuals_fold_literals(graph):
+    nodes, edges = split(project_graph(graph, 'individuals'))
+    assert nodes[NS + 'btc']['literals']['symbol'] == 'BTC'
+    assert sorted(nodes[NS + 'btc']['literals']['price']) == ['101.5', '102.5']
+    assert (NS + 'btc', 'type', NS + 'Coin') in edges
+    assert not any(target in ('BTC', '101.5', '102.5') for _, _, target in edges)
+
+
+def test_individuals_with_predicates(graph):
+    nodes, edges = split(project_graph(graph, 'individuals', [str(RDF.type)]))
+    assert (NS + 'btc', 'type', NS + 'Coin') in edges
+    assert all(label == 'type' for _, label, _ in edges)
+    assert 'literals' not in nodes[NS + 'btc']
+
+
+def test_full(graph):
+    nodes, edges = split(project_graph(graph, 'full'))
+    assert len(edges) == len(graph)
+    assert nodes['BTC']['label'] == 'BTC'
+    assert (NS + 'btc', 'symbol', 'BTC') in edges
+
+
+def test_full_with_predicates(graph):
+    _, edges = split(project_graph(graph, 'full', [NS + 'price']))
+    assert edges == {(NS + 'btc', 'price', '101.5'), (NS + 'btc', 'price', '102.5')}
+
+
+@pytest.mark.parametrize('projection', PROJECTIONS)
+def test_every_edge_joins_two_nodes(graph, projection):
+    nodes, edges = split(project_graph(graph, projection))
+    assert all(s in nodes and o in nodes for s, _, o in edges)
+
+
+@pytest.mark.parametrize('projection', PROJECTIONS)
+def test_empty_graph(projection):
+    assert project_graph(Graph(), projection) == []
+
+
+def test_unknown_projection(graph):
+    with pytest.raises(ValueError):
+        project_graph(graph, 'tree')
+
+
+def test_graph_predicates(graph):
+    assert graph_predicates(graph) == sorted({str(RDF.type), str(RDFS.subClassOf), NS + 'symbol', NS + 'price'})
+
+
+@pytest.mark.parametrize('term, expected', [
+    (URIRef('http://example.org/defi#Coin'), 'Coin'),
+    (URIRef('http://example.org/defi/Coin'), 'Coin'),
+    (URIRef('http://example.org/defi/'), 'defi'),
+    (Literal('a/b#c'), 'a/b#c'),
+])
+def test_local_name(term, expected):
+    assert local_name(term) == expected
@@ -0,0 +1,90 @@
+import pytest
+from rdflib import Graph, Literal, URIRef
+
+from utilities.ont import QueryExecutor, QueryExecutorBusy
+
+NS = 'http://example.org/'
+
+# 50 triples joined with themselves three times: 125,000 rows, many seconds of evaluation
+SLOW_QUERY = 'SELECT * WHERE { ?a ?b ?c . ?d ?e ?f . ?g ?h ?i }'
+FAST_QUERY = f'SELECT ?o WHERE {{ <{NS}s0> <{NS}p> ?o }}'
+
+
+@pytest.fixture(scope='module')
+def endpoint(tmp_path_factory):
+    g = Graph()
+    for i in range(50):
+        g.add((URIRef(f'{NS}s{i}'), URIRef(f'{NS}p'), Literal(i)))
+    path = tmp_path_factory.mktemp('ontology') / 'small.owl'
+    g.serialize(str(path), format='application/rdf+xml')
+    return str(path)
+
+
+@pytest.fixture
+def executor():
+    executor = QueryExecutor(1, max_pending=0, timeout=60)
+    yield executor
+    executor.close()
+
+
+def test_run(executor, endpoint):
+    assert executor.run(endpoint, FAST_QUERY).dataframe['o'].tolist() == [0]
+
+
+def test_timeout_replaces_the_worker(executor, endpoint):
+    [(process, _)] = executor._processes
+    with pytest.raises(TimeoutError):
+        executor.run(endpoint, SLOW_QUERY, timeout=0.5)
+    assert process.poll() is not None
+    # the replacement answers the next query
+    assert len(executor._processes) == 1
+    assert executor.run(endpoint, FAST_QUERY).dataframe['o'].tolist() == [0]
+
+
+def test_dead_worker_is_replaced(executor, endpoint):
+    [(process, _)] = executor._processes
+    process.kill()
+    process.wait()
+    with pytest.raises(RuntimeError):
+        executor.run(endpoint, FAST_QUERY)
+    assert executor.run(endpoint, FAST_QUERY).dataframe['o'].tolist() == [0]
+
+
+def test_dead_worker_is_not_reused_when_it_cannot_be_replaced(executor, endpoint, monkeypatch):
+    [(process, _)] = executor._processes
+    spawn = executor._spawn
+
+    def failing_spawn():
+        raise OSError('no more processes')
+
+    monkeypatch.setattr(executor, '_spawn', failing_spawn)
+    process.kill()
+    process.wait()
+    with pytest.raises(RuntimeError):
+        executor.run(endpoint, FAST_QUERY)
+    assert executor._idle.empty()
+    assert not executor._processes
+    # with no worker left, the failure to start one is reported
+    with pytest.raises(OSError):
+        executor.run(endpoint, FAST_QUERY)
+
+    # once workers start again, the pool is whole again
+    monkeypatch.setattr(executor, '_spawn', spawn)
+    assert executor.run(endpoint, FAST_QUERY).dataframe['o'].tolist() == [0]
+    assert len(executor._processes) == 1
+
+
+def test_busy(endpoint):
+    executor = QueryExecutor(1, max_pending=0, timeout=60)
+    try:
+        executor._slots.acquire()
+        with pytest.raises(QueryExecutorBusy):
+            executor.run(endpoint, FAST_QUERY)
+    finally:
+        executor.close()
+
+
+def test_closed(executor, endpoint):
+    executor.close()
+    with pytest.raises(RuntimeError):
+        executor.run(endpoint, FAST_QUERY)
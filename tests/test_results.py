@@ -0,0 +1,185 @@
+import pandas as pd
+import pytest
+
+from conftest import PRICE_NAMESPACE
+from utilities.ont import get_ontology_version, get_sparql_template_results
+from utilities.results import ResultStore, filter_dataframe, get_result_chunks, split_filter_part
+
+
+@pytest.fixture
+def results_df():
+    return pd.DataFrame({
+        'date': pd.to_datetime(['2023-01-01', '2023-01-02', '2023-01-03']),
+        'price': [15.5, 16.0, 116.25],
+        'count': [1, 2, 3],
+        'ticker': ['BTC', 'ETH', 'BNB'],
+    })
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    # float column
+    ('{price} >= 16', [16.0, 116.25]),
+    ('{price} <= 16', [15.5, 16.0]),
+    ('{price} < 16', [15.5]),
+    ('{price} > 16', [116.25]),
+    ('{price} != 16', [15.5, 116.25]),
+    ('{price} = 16', [16.0]),
+    ('{price} contains 16', [16.0, 116.25]),
+    ('{price} contains 6.2', [116.25]),
+    ('{price} ge 16', [16.0, 116.25]),
+    ('{price} eq 16', [16.0]),
+])
+def test_filter_float_column(results_df, filter_query, expected):
+    assert filter_dataframe(results_df, filter_query)['price'].tolist() == expected
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    # integer column
+    ('{count} >= 2', [2, 3]),
+    ('{count} <= 2', [1, 2]),
+    ('{count} < 2', [1]),
+    ('{count} > 2', [3]),
+    ('{count} != 2', [1, 3]),
+    ('{count} = 2', [2]),
+    ('{count} contains 2', [2]),
+])
+def test_filter_integer_column(results_df, filter_query, expected):
+    assert filter_dataframe(results_df, filter_query)['count'].tolist() == expected
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    # string column
+    ('{ticker} = BTC', ['BTC']),
+    ('{ticker} = "BTC"', ['BTC']),
+    ('{ticker} != BTC', ['ETH', 'BNB']),
+    ('{ticker} > BNB', ['BTC', 'ETH']),
+    ('{ticker} < C', ['BTC', 'BNB']),
+    ('{ticker} contains B', ['BTC', 'BNB']),
+    ('{ticker} contains T', ['BTC', 'ETH']),
+])
+def test_filter_string_column(results_df, filter_query, expected):
+    assert filter_dataframe(results_df, filter_query)['ticker'].tolist() == expected
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    # datetime column
+    ('{date} >= 2023-01-02', ['2023-01-02', '2023-01-03']),
+    ('{date} <= 2023-01-02', ['2023-01-01', '2023-01-02']),
+    ('{date} < 2023-01-02', ['2023-01-01']),
+    ('{date} > 2023-01-02', ['2023-01-03']),
+    ('{date} != 2023-01-02', ['2023-01-01', '2023-01-03']),
+    ('{date} = 2023-01-02', ['2023-01-02']),
+    ('{date} datestartswith 2023-01-0', ['2023-01-01', '2023-01-02', '2023-01-03']),
+    ('{date} datestartswith 2023-01-03', ['2023-01-03']),
+    ('{date} contains 01-02', ['2023-01-02']),
+    # a bare year is a date too, not a number of nanoseconds since the epoch
+    ('{date} >= 2023', ['2023-01-01', '2023-01-02', '2023-01-03']),
+    ('{date} < 2023', []),
+])
+def test_filter_datetime_column(results_df, filter_query, expected):
+    dates = filter_dataframe(results_df, filter_query)['date'].dt.strftime('%Y-%m-%d').tolist()
+    assert dates == expected
+
+
+@pytest.mark.parametrize('filter_query', [
+    '{date} > abc',
+    '{date} = ',
+    '{date} < 2023-13-45',
+])
+def test_filter_ignores_parts_that_are_not_dates(results_df, filter_query):
+    assert len(filter_dataframe(results_df, filter_query)) == len(results_df)
+
+
+def test_filter_combines_parts(results_df):
+    filtered = filter_dataframe(results_df, '{price} > 15 && {date} > abc && {ticker} contains B')
+    assert filtered['ticker'].tolist() == ['BTC', 'BNB']
+
+
+@pytest.mark.parametrize('filter_query', ['', None, '{missing} > 1', 'not a filter'])
+def test_filter_without_known_columns_keeps_every_row(results_df, filter_query):
+    assert len(filter_dataframe(results_df, filter_query)) == len(results_df)
+
+
+@pytest.mark.parametrize('filter_part, expected', [
+    ('{price} > 100', ('price', 'gt', 100.0)),
+    ('{price} >= 100', ('price', 'ge', 100.0)),
+    ('{ticker} = "B\\"TC"', ('ticker', 'eq', 'B"TC')),
+    ('{ticker} contains BTC', ('ticker', 'contains', 'BTC')),
+    ('nothing', (None, None, None)),
+])
+def test_split_filter_part(filter_part, expected):
+    assert split_filter_part(filter_part) == expected
+
+
+TEMPLATE = f'''# <<start_date: start_date>>
+# <<end_date: end_date>>
+PREFIX ns1: <{PRICE_NAMESPACE}>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+SELECT ?date ?BTCPrice WHERE {{
+    ?BTC ns1:BTC_date ?date OPTIONAL {{ ?BTC ns1:BTC_price ?BTCPrice }}
+    FILTER(?date >= "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date)
+}}
+ORDER BY ?date'''
+
+PARAMETERS = {'start_date': '2023-01-10', 'end_date': '2023-02-20'}
+
+
+@pytest.fixture
+def stored(tmp_path, price_ontology):
+    store = ResultStore(1024 * 1024, directory=str(tmp_path / 'results'))
+    dataframe = get_sparql_template_results(price_ontology, TEMPLATE, PARAMETERS).dataframe
+    query = (price_ontology, get_ontology_version(price_ontology), TEMPLATE, PARAMETERS)
+    return store, store.put(dataframe, query=query), dataframe
+
+
+def evict(store, result_id):
+    store._cache.discard(result_id)
+    store._shared.discard(result_id)
+
+
+def test_chunks_of_a_stored_result(stored):
+    store, result_id, dataframe = stored
+    chunks = list(get_result_chunks(store, result_id, 10))
+    assert [len(c) for c in chunks] == [10, 10, 10, 10, 2]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), dataframe)
+
+
+def test_evicted_result_is_queried_again(stored):
+    store, result_id, dataframe = stored
+    evict(store, result_id)
+    assert store.get(result_id) is None
+    chunks = list(get_result_chunks(store, result_id, 10))
+    assert [len(c) for c in chunks] == [10, 10, 10, 10, 2]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), dataframe)
+
+
+@pytest.mark.parametrize('sort_by, filter_query', [
+    ([{'column_id': 'BTCPrice', 'direction': 'desc'}], ''),
+    ([], '{BTCPrice} > 105'),
+    ([{'column_id': 'date', 'direction': 'desc'}], '{date} < 2023-02-01'),
+    ([], '{BTCPrice} > 1000'),
+])
+def test_evicted_result_is_filtered_and_sorted(stored, sort_by, filter_query):
+    store, result_id, _ = stored
+    expected = list(get_result_chunks(store, result_id, 10, sort_by, filter_query))
+    evict(store, result_id)
+    chunks = list(get_result_chunks(store, result_id, 10, sort_by, filter_query))
+    if not expected:
+        assert chunks == []
+        return
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), pd.concat(expected, ignore_index=True))
+
+
+def test_query_is_shared_through_the_directory(stored, tmp_path):
+    store, result_id, dataframe = stored
+    evict(store, result_id)
+    other = ResultStore(1024 * 1024, directory=str(tmp_path / 'results'))
+    pd.testing.assert_frame_equal(pd.concat(get_result_chunks(other, result_id, 100), ignore_index=True), dataframe)
+
+
+def test_result_of_another_version_is_gone(tmp_path, price_ontology):
+    store = ResultStore(1024 * 1024)
+    result_id = store.put(pd.DataFrame(), query=(price_ontology, '0-0', TEMPLATE, PARAMETERS))
+    store._cache.discard(result_id)
+    assert get_result_chunks(store, result_id, 10) is None
+    assert get_result_chunks(store, 'unknown', 10) is None
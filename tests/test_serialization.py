@@ -0,0 +1,172 @@
+import itertools
+import os
+
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import OWL, RDF, RDFS, XSD
+
+from utilities.ont import get_ontology_version, get_snapshot_path, load_ontology_snapshot
+from utilities.serialization import SNAPSHOT_MAGIC, SnapshotStore, load_snapshot, read_snapshot_header
+from utilities.serialization import write_snapshot
+
+NS = 'http://example.org/onto#'
+
+# an empty file, another file, a header length past the end, a broken header and a snapshot of a later format
+CORRUPT = [
+    b'',
+    b'not a snapshot',
+    SNAPSHOT_MAGIC + b'\xff' * 8,
+    SNAPSHOT_MAGIC + (3).to_bytes(8, 'little') + b'{"v',
+    SNAPSHOT_MAGIC + (14).to_bytes(8, 'little') + b'{"version": 2}',
+]
+
+
+def uri(name):
+    return URIRef(NS + name)
+
+
+@pytest.fixture
+def graph():
+    g = Graph()
+    g.bind('ex', NS)
+    for name in ('Asset', 'Coin', 'Token'):
+        g.add((uri(name), RDF.type, OWL.Class))
+    g.add((uri('Coin'), RDFS.subClassOf, uri('Asset')))
+    g.add((uri('Token'), RDFS.subClassOf, uri('Asset')))
+    g.add((uri('btc'), RDF.type, uri('Coin')))
+    g.add((uri('btc'), RDFS.label, Literal('bitcoin', lang='en')))
+    g.add((uri('btc'), RDFS.label, Literal('Bitcoin')))
+    g.add((uri('btc'), RDFS.comment, Literal('première crypto-monnaie', lang='fr')))
+    g.add((uri('eth'), RDF.type, uri('Token')))
+    g.add((uri('eth'), RDFS.label, Literal('ether')))
+    for i, (day, price) in enumerate((('2023-01-01', '16500.5'), ('2023-01-02', '16612.25'))):
+        observation = BNode(f'observation{i}')
+        g.add((observation, uri('BTC_date'), Literal(day, datatype=XSD.date)))
+        g.add((observation, uri('BTC_price'), Literal(price, datatype=XSD.decimal)))
+        g.add((observation, uri('rank'), Literal(i + 1)))
+    return g
+
+
+@pytest.fixture
+def snapshot(graph, tmp_path):
+    filename = str(tmp_path / 'graph.snapshot')
+    write_snapshot(graph, filename, metadata={'source_version': '1-2'})
+    return load_snapshot(filename)
+
+
+def test_round_trip(graph, snapshot):
+    assert len(snapshot) == len(graph)
+    assert set(snapshot) == set(graph)
+    assert dict(snapshot.namespaces())['ex'] == URIRef(NS)
+
+
+def test_header(graph, tmp_path):
+    filename = str(tmp_path / 'graph.snapshot')
+    write_snapshot(graph, filename, metadata={'source_version': '1-2'})
+    header = read_snapshot_header(filename)
+    assert header['triples'] == len(graph)
+    assert header['metadata'] == {'source_version': '1-2'}
+
+
+def test_empty_graph(tmp_path):
+    filename = str(tmp_path / 'empty.snapshot')
+    write_snapshot(Graph(), filename)
+    g = load_snapshot(filename)
+    assert len(g) == 0
+    assert list(g.triples((None, None, None))) == []
+
+
+@pytest.mark.parametrize('mask', list(itertools.product((False, True), repeat=3)),
+                         ids=lambda mask: ''.join('spo'[i] if bound else '?' for i, bound in enumerate(mask)))
+def test_triples(graph, snapshot, mask):
+    # every pattern with this mask that has answers, plus one with a term the graph does not hold
+    patterns = {tuple(t if bound else None for t, bound in zip(triple, mask)) for triple in graph}
+    patterns.add(tuple(uri('missing') if bound else None for bound in mask))
+    for pattern in patterns:
+        assert set(snapshot.triples(pattern)) == set(graph.triples(pattern)), pattern
+
+
+@pytest.mark.parametrize('query', [
+    'SELECT ?class WHERE { ?class a owl:Class }',
+    'SELECT ?s ?label WHERE { ?s rdfs:label ?label FILTER(lang(?label) = "en") }',
+    'SELECT ?s ?super WHERE { ?s rdfs:subClassOf+ ?super }',
+    '''SELECT ?date ?price ?rank WHERE {
+        ?o ex:BTC_date ?date ; ex:BTC_price ?price OPTIONAL { ?o ex:rank ?rank }
+        FILTER(?date >= "2023-01-02"^^xsd:date)
+    }''',
+    'SELECT ?s (COUNT(?o) AS ?n) WHERE { ?s ?p ?o } GROUP BY ?s',
+], ids=['classes', 'language', 'path', 'dates', 'count'])
+def test_sparql(graph, snapshot, query):
+    prefixes = f'PREFIX ex: <{NS}>\nPREFIX xsd: <{XSD}>\n'
+    assert set(snapshot.query(prefixes + query)) == set(graph.query(prefixes + query))
+
+
+def test_snapshot_is_read_only(snapshot):
+    with pytest.raises(TypeError):
+        snapshot.add((uri('btc'), RDFS.label, Literal('btc')))
+    with pytest.raises(TypeError):
+        snapshot.remove((uri('btc'), None, None))
+
+
+@pytest.mark.parametrize('content', CORRUPT)
+def test_corrupt_snapshot_is_refused(tmp_path, content):
+    filename = str(tmp_path / 'corrupt.snapshot')
+    with open(filename, 'wb') as output_file:
+        output_file.write(content)
+    with pytest.raises(ValueError):
+        load_snapshot(filename)
+
+
+def test_truncated_snapshot_is_refused(graph, tmp_path):
+    filename = str(tmp_path / 'graph.snapshot')
+    write_snapshot(graph, filename)
+    os.truncate(filename, os.path.getsize(filename) - 16)
+    with pytest.raises(ValueError):
+        load_snapshot(filename)
+
+
+# --------------------------------------------------
+# snapshots of ontology files
+#
+@pytest.fixture
+def endpoint(graph, tmp_path):
+    path = str(tmp_path / 'onto.owl')
+    graph.serialize(path, format='application/rdf+xml')
+    return path
+
+
+def test_snapshot_is_written_next_to_the_ontology(graph, endpoint):
+    g = load_ontology_snapshot(endpoint)
+    assert isinstance(g.store, SnapshotStore)
+    # blank nodes are renamed by the RDF/XML round trip
+    assert isomorphic(g, graph)
+    metadata = read_snapshot_header(get_snapshot_path(endpoint))['metadata']
+    assert metadata['source_version'] == get_ontology_version(endpoint)
+
+
+def test_stale_snapshot_is_rewritten(graph, endpoint):
+    load_ontology_snapshot(endpoint)
+    graph.add((uri('xrp'), RDF.type, uri('Token')))
+    # the version is the file's modification time and size, and the size changes
+    graph.serialize(endpoint, format='application/rdf+xml')
+    g = load_ontology_snapshot(endpoint)
+    assert (uri('xrp'), RDF.type, uri('Token')) in g
+    assert read_snapshot_header(get_snapshot_path(endpoint))['metadata']['source_version'] == \
+        get_ontology_version(endpoint)
+
+
+def test_snapshot_of_another_version_is_not_used(graph, endpoint, tmp_path):
+    other = Graph()
+    other.add((uri('other'), RDF.type, OWL.Class))
+    write_snapshot(other, get_snapshot_path(endpoint), metadata={'source_version': '0-0',
+                                                                  'format': 'application/rdf+xml'})
+    assert isomorphic(load_ontology_snapshot(endpoint), graph)
+
+
+@pytest.mark.parametrize('content', CORRUPT)
+def test_corrupt_snapshot_is_rewritten(graph, endpoint, content):
+    with open(get_snapshot_path(endpoint), 'wb') as output_file:
+        output_file.write(content)
+    assert isomorphic(load_ontology_snapshot(endpoint), graph)
+    assert read_snapshot_header(get_snapshot_path(endpoint))['triples'] == len(graph)
@@ -0,0 +1,221 @@
+import math
+
+import pytest
+from rdflib import Literal
+from rdflib.namespace import XSD
+
+from utilities.ont import normalize_query_text
+from utilities.template import QueryTemplate, Slot, get_query_template, render_query_template
+
+# the 'Show ticker prices' query of data/defi/defi_sparql.csv
+DEFI_TEMPLATE = '''# Show ticker prices over a date range
+#
+# <<start_date: start_date>>
+# <<end_date: end_date>>
+# <<precision: precision>>
+#
+PREFIX ns1: <http://www.semanticweb.org/sichengyun/ontologies/2023/6/>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+SELECT
+(ROUND(?BTCPrice*precision)/precision AS ?BTCPrice)
+(ROUND(?BNBPrice*precision)/precision AS ?BNBPrice)
+(ROUND(?ETHPrice*precision)/precision AS ?ETHPrice)
+(ROUND(?XRPPrice*precision)/precision AS ?XRPPrice)
+?date
+
+WHERE {
+?BTC ns1:BTC_date ?date ;
+       ns1:BTC_price ?BTCPrice .
+?BNB ns1:BNB_date ?date ;
+       ns1:BNB_price ?BNBPrice .
+?ETH ns1:ETH_date ?date ;
+       ns1:ETH_price ?ETHPrice .
+?XRP ns1:XRP_date ?date ;
+       ns1:XRP_price ?XRPPrice .
+
+FILTER(?date >= "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date)
+}
+ORDER BY ?date'''
+
+# the same query over the tickers picked in the dropdowns
+TICKER_TEMPLATE = '''# <<start_date: start_date>>
+# <<end_date: end_date>>
+# <<precision: precision>>
+# <<first: dropdown1>>
+# <<second: dropdown2>>
+PREFIX ns1: <http://www.semanticweb.org/sichengyun/ontologies/2023/6/>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+SELECT (ROUND(?firstPrice*precision)/precision AS ?firstPrice) ?secondPrice ?date WHERE {
+?first ns1:first_date ?date ;
+       ns1:first_price ?firstPrice .
+?second ns1:second_date ?date ;
+       ns1:second_price ?secondPrice .
+FILTER(?date >= "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date)
+}
+ORDER BY ?date'''
+
+# a query of data/pizza/pizza_sparql.csv, without tags
+PIZZA_QUERY = '''
+SELECT *
+WHERE {
+    ?subject ?predicate ?object .
+}
+LIMIT 10'''
+
+PARAMETERS = {'start_date': '2023-01-01', 'end_date': '2023-03-01', 'precision': 2,
+              'dropdown1': 'BTC', 'dropdown2': 'ETH', 'dropdown3': 'BNB', 'dropdown4': 'XRP'}
+
+
+def substitute(sparql_query_template, parameters):
+    # the tag substitution of submit_button_selected before utilities.template
+    sparql_query_text = sparql_query_template
+    start_tag, end_tag = "<<", ">>"
+    start_index = 0
+    while True:
+        idx_1 = sparql_query_template.find(start_tag, start_index)
+        if idx_1 == -1:
+            break
+        idx_2 = sparql_query_template.find(end_tag, start_index + len(start_tag))
+        if idx_2 == -1:
+            break
+        tag = sparql_query_template[idx_1 + len(start_tag): idx_2]
+        name_value = tag.split(':')
+
+        if name_value[1].strip() in ('dropdown1', 'dropdown2', 'dropdown3', 'dropdown4', 'start_date', 'end_date'):
+            sparql_query_text = sparql_query_text.replace(name_value[0], parameters[name_value[1].strip()])
+        elif name_value[1].strip() == 'precision':
+            sparql_query_text = sparql_query_text.replace('precision', str(math.pow(10, parameters['precision'])))
+        start_index = idx_2
+    return sparql_query_text
+
+
+@pytest.mark.parametrize('text', [DEFI_TEMPLATE, TICKER_TEMPLATE, PIZZA_QUERY], ids=['defi', 'tickers', 'pizza'])
+def test_render_matches_the_former_substitution(text):
+    # the former substitution also rewrote the tag comments, so only the queries are compared
+    assert normalize_query_text(render_query_template(text, PARAMETERS)) == \
+        normalize_query_text(substitute(text, PARAMETERS))
+
+
+def test_render_keeps_comments():
+    rendered = render_query_template(DEFI_TEMPLATE, PARAMETERS)
+    assert '# <<start_date: start_date>>' in rendered
+    assert '# <<precision: precision>>' in rendered
+    assert '"2023-01-01"^^xsd:date' in rendered
+    assert '(ROUND(?BTCPrice*100.0)/100.0 AS ?BTCPrice)' in rendered
+
+
+def test_comment_after_a_slot():
+    text = '# <<start_date: start_date>>\nSELECT * WHERE { ?s ?p "start_date"^^xsd:date } # not start_date'
+    assert render_query_template(text, PARAMETERS).endswith('"2023-01-01"^^xsd:date } # not start_date')
+
+
+@pytest.mark.parametrize('text', [
+    '# <<start_date: start_date>>\nSELECT * WHERE { ?s <http://example.org/onto#p> "start_date"^^xsd:date }',
+    '# <<start_date: start_date>>\nSELECT * WHERE { ?s ?p "#", "start_date"^^xsd:date }',
+    "# <<start_date: start_date>>\nSELECT * WHERE { ?s ?p '''a\n# b''', \"start_date\"^^xsd:date }",
+], ids=['iri', 'string', 'long string'])
+def test_hash_in_strings_and_iris_is_not_a_comment(text):
+    assert text.split('\n', 1)[1].replace('"start_date"', '"2023-01-01"') == \
+        render_query_template(text, PARAMETERS).split('\n', 1)[1]
+
+
+def test_placeholder_inside_a_name_is_not_a_slot():
+    text = '# <<start_date: start_date>>\nSELECT ?start_date_x WHERE { ?s ?p ?start_date_x . ?s ?q start_date }'
+    assert render_query_template(text, PARAMETERS).endswith(
+        '?start_date_x WHERE { ?s ?p ?start_date_x . ?s ?q 2023-01-01 }')
+
+
+def test_tickers_are_substituted_inside_names():
+    rendered = render_query_template(TICKER_TEMPLATE, PARAMETERS)
+    assert 'ns1:BTC_price ?BTCPrice' in rendered
+    assert 'ns1:ETH_date ?date' in rendered
+
+
+def test_ticker_list():
+    text = '# <<TICKERS: tickers>>\nSELECT * WHERE { VALUES ?ticker { TICKERS } }'
+    rendered = render_query_template(text, dict(PARAMETERS, tickers=['BTC', 'ETH']))
+    assert rendered.endswith('VALUES ?ticker { BTC ETH } }')
+
+
+def test_repeated_placeholder_is_one_slot():
+    template = QueryTemplate(DEFI_TEMPLATE)
+    assert [(s.name, s.tag_type) for s in template.slots] == [
+        ('precision', 'precision'), ('start_date', 'start_date'), ('end_date', 'end_date')]
+
+
+def test_unknown_tag_types_are_left_alone():
+    text = '# <<colour: colour>>\nSELECT * WHERE { ?s ?p colour }'
+    assert QueryTemplate(text).slots == []
+    assert render_query_template(text, PARAMETERS) == text
+
+
+@pytest.mark.parametrize('value', [None, '', 'yesterday', '01/02/2023', '2023-1-2'])
+def test_bad_date(value):
+    template = QueryTemplate('# <<start_date: start_date>>\nSELECT * WHERE { ?s ?p "start_date"^^xsd:date }')
+    with pytest.raises(ValueError, match='start_date must be a date'):
+        template.render(dict(PARAMETERS, start_date=value))
+    with pytest.raises(ValueError):
+        template.bindings(dict(PARAMETERS, start_date=value))
+
+
+def test_date_is_cut_to_the_day():
+    template = QueryTemplate('# <<start_date: start_date>>\nSELECT * WHERE { ?s ?p "start_date"^^xsd:date }')
+    assert template.render(dict(PARAMETERS, start_date='2023-01-01T00:00:00"} DROP ALL #')).endswith(
+        '"2023-01-01"^^xsd:date }')
+
+
+@pytest.mark.parametrize('value', [None, '', 'BTC ETH', 'BTC>', 'BTC"', 'ns1:BTC'])
+def test_bad_ticker(value):
+    with pytest.raises(ValueError, match='dropdown1 must be a ticker'):
+        render_query_template(TICKER_TEMPLATE, dict(PARAMETERS, dropdown1=value))
+
+
+def test_bad_ticker_in_a_list():
+    text = '# <<TICKERS: tickers>>\nSELECT * WHERE { VALUES ?ticker { TICKERS } }'
+    with pytest.raises(ValueError, match='tickers must be a ticker'):
+        render_query_template(text, dict(PARAMETERS, tickers=['BTC', 'E TH']))
+
+
+@pytest.mark.parametrize('slot, bindable', [
+    (Slot('start_date', 'start_date', '"', 'xsd:date'), True),
+    (Slot('start_date', 'start_date', "'", '<http://www.w3.org/2001/XMLSchema#date>'), True),
+    (Slot('start_date', 'start_date'), False),
+    (Slot('start_date', 'start_date', '"'), False),
+    (Slot('precision', 'precision'), True),
+    (Slot('precision', 'precision', '"'), False),
+    (Slot('first', 'dropdown1'), False),
+    (Slot('TICKERS', 'tickers'), False),
+    (Slot('start-date', 'start_date', '"', 'xsd:date'), False),
+], ids=['typed date', 'typed date with an iri', 'bare date', 'untyped date', 'precision', 'quoted precision',
+        'ticker', 'ticker list', 'not a variable name'])
+def test_bindable(slot, bindable):
+    assert slot.bindable is bindable
+
+
+def test_variable_text_of_a_bindable_template():
+    template = QueryTemplate(DEFI_TEMPLATE)
+    assert template.bindable
+    text = template.variable_text()
+    assert '(ROUND(?BTCPrice*?__precision)/?__precision AS ?BTCPrice)' in text
+    assert 'FILTER(?date >= ?__start_date && ?date <= ?__end_date)' in text
+    # the tag comments are kept as they are
+    assert '# <<start_date: start_date>>' in text
+    assert template.bindings(PARAMETERS) == {
+        '__start_date': Literal('2023-01-01', datatype=XSD.date),
+        '__end_date': Literal('2023-03-01', datatype=XSD.date),
+        '__precision': Literal('100.0', datatype=XSD.decimal),
+    }
+
+
+def test_templates_with_text_slots_are_rendered():
+    template = QueryTemplate(TICKER_TEMPLATE)
+    assert not template.bindable
+    assert template.variable_text() is None
+    assert {s.name: s.bindable for s in template.slots} == {
+        'precision': True, 'first': False, 'start_date': True, 'end_date': True, 'second': False}
+
+
+def test_templates_are_parsed_once():
+    assert get_query_template(DEFI_TEMPLATE) is get_query_template(DEFI_TEMPLATE)
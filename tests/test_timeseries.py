@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import XSD
+
+from utilities.timeseries import build_price_index, match_price_query
+
+NS = 'http://www.semanticweb.org/sichengyun/ontologies/2023/6/'
+PREFIXES = f'PREFIX ns1: <{NS}>\nPREFIX xsd: <http://www.w3.org/2001/XMLSchema#>\n'
+
+
+@pytest.fixture(scope='module')
+def graph():
+    g = Graph()
+    rng = np.random.default_rng(0)
+    for ticker, days in (('BTC', 40), ('ETH', 30)):
+        for date in pd.date_range('2023-01-01', periods=days):
+            observation = BNode()
+            g.add((observation, URIRef(f'{NS}{ticker}_date'), Literal(date.date(), datatype=XSD.date)))
+            g.add((observation, URIRef(f'{NS}{ticker}_price'),
+                   Literal(str(round(100 + 10 * rng.random(), 4)), datatype=XSD.decimal)))
+    # a second observation of one day, which a join multiplies
+    observation = BNode()
+    g.add((observation, URIRef(f'{NS}ETH_date'), Literal('2023-01-05', datatype=XSD.date)))
+    g.add((observation, URIRef(f'{NS}ETH_price'), Literal('99.5', datatype=XSD.decimal)))
+    return g
+
+
+def sparql_dataframe(g, query, bindings=None):
+    result = g.query(query, initBindings=bindings or {})
+    rows = [[term.toPython() for term in row] for row in result]
+    df = pd.DataFrame(rows, columns=[str(v) for v in result.vars])
+    for c in df.columns:
+        df[c] = pd.to_datetime(df[c]) if c == 'date' else df[c].astype(float)
+    return df
+
+
+def assert_same_rows(actual, expected, ordered):
+    if not ordered:
+        actual = actual.sort_values(list(actual.columns), ignore_index=True)
+        expected = expected.sort_values(list(expected.columns), ignore_index=True)
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+MATCHED = [
+    ('one ticker', '''
+        SELECT ?date ?price WHERE {
+            ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price .
+            FILTER (?date >= "2023-01-10"^^xsd:date && ?date <= "2023-01-20"^^xsd:date)
+        } ORDER BY ?date''', True),
+    ('two tickers, duplicate dates joined', '''
+        SELECT ?date ?btc ?eth WHERE {
+            ?a ns1:BTC_date ?date ; ns1:BTC_price ?btc .
+            ?b ns1:ETH_date ?date ; ns1:ETH_price ?eth .
+        }''', False),
+    ('strict bounds, descending', '''
+        SELECT ?date ?price WHERE {
+            ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price .
+            FILTER (?date > "2023-01-10"^^xsd:date && ?date < "2023-01-20"^^xsd:date)
+        } ORDER BY DESC(?date)''', True),
+    ('rounded, as the catalogue templates write it', '''
+        SELECT ?date (ROUND(?price * 100) / 100 AS ?price) WHERE {
+            ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price .
+        } ORDER BY ?date''', True),
+    ('empty range', '''
+        SELECT ?date ?price WHERE {
+            ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price .
+            FILTER (?date >= "2023-03-01"^^xsd:date && ?date <= "2023-02-01"^^xsd:date)
+        }''', False),
+]
+
+
+@pytest.mark.parametrize('name, query, ordered', MATCHED, ids=[m[0] for m in MATCHED])
+def test_matched_queries_answer_like_sparql(graph, name, query, ordered):
+    price_query = match_price_query(PREFIXES + query)
+    assert price_query is not None
+    actual = price_query.evaluate(build_price_index(graph))
+    assert_same_rows(actual, sparql_dataframe(graph, PREFIXES + query), ordered)
+
+
+def test_bound_dates_from_bindings(graph):
+    query = PREFIXES + '''
+        SELECT ?date ?price WHERE {
+            ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price .
+            FILTER (?date >= ?start && ?date <= ?end)
+        } ORDER BY ?date'''
+    bindings = {'start': Literal('2023-01-03', datatype=XSD.date), 'end': Literal('2023-01-06', datatype=XSD.date)}
+    price_query = match_price_query(query)
+    assert price_query.date_range(bindings) == (np.datetime64('2023-01-03'), np.datetime64('2023-01-06'))
+    actual = price_query.evaluate(build_price_index(graph), bindings)
+    assert len(actual) == 4
+    assert_same_rows(actual, sparql_dataframe(graph, query, bindings), True)
+    with pytest.raises(KeyError):
+        price_query.date_range()
+
+
+NOT_MATCHED = [
+    ('not sparql', 'SELECT ?date WHERE {'),
+    ('ask', 'ASK { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . }'),
+    ('no price', 'SELECT ?date WHERE { ?btc ns1:BTC_date ?date . }'),
+    ('only the date projected', 'SELECT ?date WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . }'),
+    ('subject projected', 'SELECT ?btc ?price WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . }'),
+    ('another triple', 'SELECT ?date ?price WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price ; ns1:x ?y . }'),
+    ('optional', 'SELECT ?date ?price WHERE { ?btc ns1:BTC_date ?date . OPTIONAL { ?btc ns1:BTC_price ?price } }'),
+    ('price filter', 'SELECT ?date ?price WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . '
+                     'FILTER (?price > 100) }'),
+    ('not a date', 'SELECT ?date ?price WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . '
+                   'FILTER (?date > "yesterday") }'),
+    ('order by price', 'SELECT ?date ?price WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . } '
+                       'ORDER BY ?price'),
+    ('different dates', 'SELECT ?d1 ?btc ?eth WHERE { ?a ns1:BTC_date ?d1 ; ns1:BTC_price ?btc . '
+                        '?b ns1:ETH_date ?d2 ; ns1:ETH_price ?eth . }'),
+    ('limit', 'SELECT ?date ?price WHERE { ?btc ns1:BTC_date ?date ; ns1:BTC_price ?price . } LIMIT 5'),
+]
+
+
+@pytest.mark.parametrize('name, query', NOT_MATCHED, ids=[m[0] for m in NOT_MATCHED])
+def test_other_queries_are_not_matched(name, query):
+    assert match_price_query(PREFIXES + query) is None
+
+
+def test_price_index(graph):
+    index = build_price_index(graph)
+    assert index.tickers == ['BTC', 'ETH']
+    assert len(index) == 71
+    dates, prices = index.series(NS + 'ETH', np.datetime64('2023-01-05'), np.datetime64('2023-01-05'))
+    assert len(dates) == len(prices) == 2
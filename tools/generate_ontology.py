@@ -0,0 +1,280 @@
+"""
+Generate a synthetic ticker price ontology with the structure of
+data/defi/defi.owl, for testing the dashboard at scale.
+
+Every ticker gets a class <Name>(<TICKER>) under Tokens, in the class
+hierarchy of defi.owl, and one individual per day with an ns1:<TICKER>_date
+and an ns1:<TICKER>_price.  Prices follow a geometric random walk.
+
+    python tools/generate_ontology.py --tickers 100 --days 3650 --name "Synthetic 100x3650" \\
+        --register data/ontologies.csv
+
+The ontology is registered with a sparql query file holding the defi
+'Show ticker prices' query over its first four tickers, so the benchmarks
+and load tests can select it by name.
+"""
+import argparse
+import datetime
+import os
+import pathlib
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+
+BASE_PATH = pathlib.Path(__file__).parent.parent.resolve()
+
+PRICE_NAMESPACE = 'http://www.semanticweb.org/sichengyun/ontologies/2023/6/'
+RDF_NAMESPACE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+RDFS_NAMESPACE = 'http://www.w3.org/2000/01/rdf-schema#'
+OWL_NAMESPACE = 'http://www.w3.org/2002/07/owl#'
+XSD_NAMESPACE = 'http://www.w3.org/2001/XMLSchema#'
+
+# the class hierarchy of defi.owl: class -> superclass
+DEFI_CLASSES = {
+    'Decentralized_Exchanges_(DEX)': 'Defi',
+    'Governance': 'Defi',
+    'Lending_and_Borrowing': 'Defi',
+    'Smart_Contratcs': 'Defi',
+    'Stablecoins': 'Defi',
+    'Tokens': 'Defi',
+    'Yield_Farming': 'Defi',
+    'Automated_Market_Makers_(AMMs)': 'Decentralized_Exchanges_(DEX)',
+    'Cross-Chain-DEXs': 'Decentralized_Exchanges_(DEX)',
+    'Layer-2_DEXs': 'Decentralized_Exchanges_(DEX)',
+    'Liquidity_Protocol_DEXs': 'Decentralized_Exchanges_(DEX)',
+    'Order_Book_Based_DEXs': 'Decentralized_Exchanges_(DEX)',
+    'Peer-to-Peer_(P2P)_DEXs': 'Decentralized_Exchanges_(DEX)',
+    'Aave': 'Lending_and_Borrowing',
+    'Compound': 'Lending_and_Borrowing',
+    'Cardano': 'Smart_Contratcs',
+    'Ethereum': 'Smart_Contratcs',
+    'Solana': 'Smart_Contratcs',
+    'Binance_USD(BUSD)': 'Stablecoins',
+    'Dai(DAI)': 'Stablecoins',
+    'USD_Coin(USDC)': 'Stablecoins',
+    'usdt': 'Stablecoins',
+    'Defidate': 'usdt',
+    'defiPrice': 'usdt',
+    'PancakeSwap': 'Yield_Farming',
+    'SushiSwap': 'Yield_Farming',
+    'Uniswap': 'Yield_Farming',
+}
+
+# the tickers of defi.owl, their class names and rough starting prices; further tickers are generated
+DEFI_TICKERS = [('BTC', 'Bitcoin', 16500.0), ('ETH', 'Ethereum', 1200.0), ('BNB', 'BNB', 245.0),
+                ('XRP', 'XRP', 0.34)]
+
+# file extensions of the rdflib serialisations
+FORMATS = {'xml': '.owl', 'turtle': '.ttl', 'nt': '.nt', 'n3': '.n3', 'json-ld': '.jsonld', 'trig': '.trig'}
+
+QUERY_NAME = 'Show ticker prices'
+
+
+# --------------------------------------------------
+# prices
+#
+def ticker_names(count):
+    """
+    Return count tickers: the defi tickers, then T0004, T0005, ...
+    :param count: number of tickers
+    :return: list of (ticker, class name, starting price) tuples
+    """
+    tickers = DEFI_TICKERS[:count]
+    for i in range(len(tickers), count):
+        tickers.append((f'T{i:04d}', f'Token_{i:04d}', 10.0 ** (i % 5)))
+    return tickers
+
+
+def generate_prices(start_prices, days, noise, seed=0):
+    """
+    Return daily prices of every ticker as a geometric random walk.
+    :param start_prices: price of every ticker on the first day
+    :param days: number of days
+    :param noise: standard deviation of the daily log returns
+    :param seed: random seed
+    :return: 2-D float64 array, days by tickers
+    """
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(0.0, noise, size=(days, len(start_prices)))
+    log_returns[0] = 0.0
+    return np.asarray(start_prices) * np.exp(np.cumsum(log_returns, axis=0))
+
+
+# --------------------------------------------------
+# serialisations
+#
+def iter_rdfxml(name, tickers, dates, prices):
+    """
+    Yield the ontology as RDF/XML, in the layout of defi.owl, without
+    building a graph in memory.
+    """
+    base = f'{PRICE_NAMESPACE}{name}'
+    yield '<?xml version="1.0" ?>\n'
+    yield (f'<rdf:RDF xmlns:ns1="{PRICE_NAMESPACE}" xmlns:owl="{OWL_NAMESPACE}" '
+           f'xmlns:rdfs="{RDFS_NAMESPACE}" xmlns:rdf="{RDF_NAMESPACE}">\n')
+    yield f'  <owl:Ontology rdf:about={quoteattr(PRICE_NAMESPACE + name)}>\n'
+    yield f'    <rdfs:comment xml:lang="en">This is an ontology about {escape(name)}</rdfs:comment>\n'
+    yield '  </owl:Ontology>\n'
+    for cls, superclass in ontology_classes(tickers).items():
+        yield f'  <owl:Class rdf:about={quoteattr(f"{base}#{cls}")}>\n'
+        if superclass is not None:
+            yield f'    <rdfs:subClassOf rdf:resource={quoteattr(f"{base}#{superclass}")}/>\n'
+        yield '  </owl:Class>\n'
+    iso_dates = [d.isoformat() for d in dates]
+    for j, (ticker, _, _) in enumerate(tickers):
+        for i, day in enumerate(iso_dates):
+            yield (f'  <rdf:Description rdf:about={quoteattr(f"{base}#{ticker}_{i}")}>\n'
+                   f'    <ns1:{ticker}_date rdf:datatype="{XSD_NAMESPACE}date">{day}</ns1:{ticker}_date>\n'
+                   f'    <ns1:{ticker}_price rdf:datatype="{XSD_NAMESPACE}decimal">{prices[i, j]:.6f}'
+                   f'</ns1:{ticker}_price>\n'
+                   '  </rdf:Description>\n')
+    yield '</rdf:RDF>\n'
+
+
+def build_graph(name, tickers, dates, prices):
+    """
+    Return the ontology as a rdflib graph, for the other serialisations.
+    """
+    from rdflib import Graph, Literal, Namespace, URIRef
+    from rdflib.namespace import OWL, RDF, RDFS, XSD
+
+    g = Graph()
+    ns1 = Namespace(PRICE_NAMESPACE)
+    g.bind('ns1', ns1)
+    base = f'{PRICE_NAMESPACE}{name}'
+    g.add((ns1[name], RDF.type, OWL.Ontology))
+    g.add((ns1[name], RDFS.comment, Literal(f'This is an ontology about {name}', lang='en')))
+    for cls, superclass in ontology_classes(tickers).items():
+        g.add((URIRef(f'{base}#{cls}'), RDF.type, OWL.Class))
+        if superclass is not None:
+            g.add((URIRef(f'{base}#{cls}'), RDFS.subClassOf, URIRef(f'{base}#{superclass}')))
+    iso_dates = [d.isoformat() for d in dates]
+    for j, (ticker, _, _) in enumerate(tickers):
+        date_predicate, price_predicate = ns1[f'{ticker}_date'], ns1[f'{ticker}_price']
+        for i, day in enumerate(iso_dates):
+            subject = URIRef(f'{base}#{ticker}_{i}')
+            g.add((subject, date_predicate, Literal(day, datatype=XSD.date)))
+            g.add((subject, price_predicate, Literal(f'{prices[i, j]:.6f}', datatype=XSD.decimal)))
+    return g
+
+
+def ontology_classes(tickers):
+    """
+    Return the class hierarchy of defi.owl with a class per ticker under Tokens.
+    :return: dictionary of class to superclass, None for the root
+    """
+    classes = {'Defi': None}
+    classes.update(DEFI_CLASSES)
+    for ticker, class_name, _ in tickers:
+        classes[f'{class_name}({ticker})'] = 'Tokens'
+    return classes
+
+
+def ticker_prices_query(tickers):
+    """
+    Return the defi 'Show ticker prices' query template over the given tickers.
+    """
+    select = '\n'.join(f'(ROUND(?{t}Price*precision)/precision AS ?{t}Price)' for t in tickers)
+    where = '\n'.join(f'?{t} ns1:{t}_date ?date ;\n       ns1:{t}_price ?{t}Price .' for t in tickers)
+    return f'''# Show ticker prices over a date range
+#
+# <<start_date: start_date>>
+# <<end_date: end_date>>
+# <<precision: precision>>
+#
+PREFIX ns1: <{PRICE_NAMESPACE}>
+PREFIX xsd: <{XSD_NAMESPACE}>
+
+SELECT
+{select}
+?date
+
+WHERE {{
+{where}
+
+FILTER(?date >= "start_date"^^xsd:date && ?date <= "end_date"^^xsd:date)
+}}
+ORDER BY ?date'''
+
+
+# --------------------------------------------------
+# catalogue
+#
+def register_ontology(ontologies_file, name, description, endpoint, sparql_file):
+    """
+    Add an ontology to an ontologies csv, replacing an entry of the same name.
+    The endpoint is written relative to the repository, where the app runs,
+    and the sparql file relative to the csv, where they lie below them.
+    :param ontologies_file: csv with Name, Description, Endpoint and Sparql columns
+    :param name: ontology name
+    :param description: ontology description
+    :param endpoint: ontology file
+    :param sparql_file: csv of the ontology's sparql queries
+    :return: None
+    """
+    ontologies_file = pathlib.Path(ontologies_file).resolve()
+    endpoint = pathlib.Path(endpoint).resolve()
+    if endpoint.is_relative_to(BASE_PATH):
+        endpoint = endpoint.relative_to(BASE_PATH)
+    sparql_file = pathlib.Path(sparql_file).resolve()
+    if sparql_file.is_relative_to(ontologies_file.parent):
+        sparql_file = sparql_file.relative_to(ontologies_file.parent)
+    row = {'Name': name, 'Description': description, 'Endpoint': str(endpoint), 'Sparql': str(sparql_file)}
+    if ontologies_file.exists():
+        ontologies_df = pd.read_csv(ontologies_file)
+        ontologies_df = ontologies_df[ontologies_df['Name'] != name]
+    else:
+        ontologies_df = pd.DataFrame(columns=list(row))
+    ontologies_df = pd.concat([ontologies_df, pd.DataFrame([row])], ignore_index=True)
+    # written to a temporary file and renamed, so the app never reads half a catalogue
+    temporary = ontologies_file.with_name(f'.{ontologies_file.name}.tmp')
+    ontologies_df.to_csv(temporary, index=False)
+    os.replace(temporary, ontologies_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=4, help='number of tickers, at least 1')
+    parser.add_argument('--days', type=int, default=365, help='number of days')
+    parser.add_argument('--start-date', default='2023-01-01', type=datetime.date.fromisoformat)
+    parser.add_argument('--noise', type=float, default=0.03, help='standard deviation of the daily log returns')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', default='xml', choices=sorted(FORMATS), help='rdflib serialisation')
+    parser.add_argument('--output', help='ontology file to write, by default data/synthetic/<name>.<extension>')
+    parser.add_argument('--name', default='Synthetic', help='ontology name')
+    parser.add_argument('--register', metavar='ONTOLOGIES_CSV',
+                        help='add the ontology to this csv, e.g. data/ontologies.csv')
+    args = parser.parse_args()
+    if args.tickers < 1 or args.days < 1:
+        parser.error('--tickers and --days must be at least 1')
+    if args.register and args.format != 'xml':
+        # build_ontology_as_rdflib_graph parses every endpoint as RDF/XML
+        parser.error('only RDF/XML ontologies can be registered with the app')
+
+    tickers = ticker_names(args.tickers)
+    dates = [args.start_date + datetime.timedelta(days=i) for i in range(args.days)]
+    prices = generate_prices([p for _, _, p in tickers], args.days, args.noise, args.seed)
+    identifier = args.name.replace(' ', '_')
+
+    output = pathlib.Path(args.output or BASE_PATH.joinpath('data', 'synthetic', identifier + FORMATS[args.format]))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if args.format == 'xml':
+        with open(output, 'w', encoding='utf-8') as f:
+            f.writelines(iter_rdfxml(identifier, tickers, dates, prices))
+    else:
+        build_graph(identifier, tickers, dates, prices).serialize(destination=str(output), format=args.format)
+    print(f'{output}: {len(tickers)} tickers x {len(dates)} days', file=sys.stderr)
+
+    if args.register:
+        sparql_file = output.with_name(f'{output.stem}_sparql.csv')
+        pd.DataFrame({'Name': [QUERY_NAME], 'Sparql': [ticker_prices_query([t for t, _, _ in tickers[:4]])]}) \
+            .to_csv(sparql_file, index=False)
+        register_ontology(args.register, args.name,
+                          f'Synthetic ontology of {len(tickers)} tickers over {len(dates)} days', output, sparql_file)
+        print(f'registered {args.name} in {args.register}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def private_directory(path):
+    """
+    Create a directory that only the current user can use, or check that an
+    existing one is.  Cached values are unpickled, so a directory another
+    user can write to would let them run code in the app.
+    :param path: directory
+    :return: path
+    :raises PermissionError: when the directory is a symlink, belongs to another user or is open to others
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f'cache directory {path} is not a directory')
+    # no owners on windows; the directory inherits the acl of the user's profile
+    if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+        raise PermissionError(f'cache directory {path} must be owned by uid {os.getuid()} '
+                              f'with mode 0700, not uid {st.st_uid} and mode {stat.S_IMODE(st.st_mode):04o}')
+    return path
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by a cost budget.
+
+    Every entry carries a cost (e.g. an estimate of its size in bytes); once the
+    total cost exceeds the budget the least recently used entries are evicted.
+    Hit, miss and eviction counters are kept so they can be scraped.
+    """
+
+    def __init__(self, budget, name='cache'):
+        self.name = name
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_cost = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under key and mark it as recently used.
+        :param key: cache key
+        :param default: value returned on a miss
+        :return: cached value or default
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value, cost=1):
+        """
+        Cache value under key, evicting least recently used entries over budget.
+        :param key: cache key
+        :param value: value to cache
+        :param cost: cost of the entry counted against the budget
+        :return: None
+        """
+        with self._lock:
+            if key in self._entries:
+                self._total_cost -= self._entries.pop(key)[1]
+            self._entries[key] = (value, cost)
+            self._total_cost += cost
+            # always keep the newest entry, even when it alone exceeds the budget
+            while self._total_cost > self.budget and len(self._entries) > 1:
+                _, (_, evicted_cost) = self._entries.popitem(last=False)
+                self._total_cost -= evicted_cost
+                self.evictions += 1
+
+    def discard(self, key):
+        """
+        Remove key from the cache if present.
+        :param key: cache key
+        :return: None
+        """
+        with self._lock:
+            if key in self._entries:
+                self._total_cost -= self._entries.pop(key)[1]
+
+    def discard_if(self, predicate):
+        """
+        Remove every entry whose key satisfies predicate.
+        :param predicate: function of a key returning True for keys to remove
+        :return: None
+        """
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._total_cost -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Remove every entry; counters are kept.
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._total_cost = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """
+        Return the cache counters as a dictionary.
+        :return: dictionary of counters and sizes
+        """
+        with self._lock:
+            return {
+                'name': self.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'cost': self._total_cost,
+                'budget': self.budget,
+            }
+
+
+class DiskCache:
+    """
+    Least-recently-used cache of pickled values in a local directory.
+
+    The directory can be shared by every worker process on the host: entries
+    are written atomically, read without locks, and evicted by whichever
+    process pushes the total size over budget.  Entries may also expire after
+    a time-to-live.  Counters are kept per process.
+    """
+
+    def __init__(self, directory, budget, ttl=None, name='disk'):
+        """
+        :param directory: cache directory, created when missing; must be private to the current user
+        :param budget: maximum total size of the cache files in bytes
+        :param ttl: default time-to-live of an entry in seconds, None for no expiry
+        :param name: name reported by stats
+        """
+        self.name = name
+        self.directory = directory
+        self.budget = budget
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        private_directory(directory)
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.pkl')
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under key and mark it as recently used.
+        :param key: cache key; its repr must be stable across processes
+        :param default: value returned on a miss
+        :return: cached value or default
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as input_file:
+                expires_at, value = pickle.load(input_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._count('misses')
+            return default
+        if expires_at is not None and expires_at < time.time():
+            self._remove(path)
+            self._count('misses')
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count('hits')
+        return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Cache value under key, evicting least recently used entries over budget.
+        :param key: cache key; its repr must be stable across processes
+        :param value: picklable value
+        :param ttl: time-to-live in seconds, defaults to the cache's ttl
+        :return: None
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.time() + ttl
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as output_file:
+                pickle.dump((expires_at, value), output_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def discard(self, key):
+        """
+        Remove key from the cache if present.
+        :param key: cache key
+        :return: None
+        """
+        self._remove(self._path(key))
+
+    def clear(self):
+        """
+        Remove every entry; counters are kept.
+        :return: None
+        """
+        for path, _, _ in self._entries():
+            self._remove(path)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.path, st.st_mtime, st.st_size))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        # keep the newest entry, even when it alone exceeds the budget
+        for path, _, size in sorted(entries, key=lambda e: e[1])[:-1]:
+            if total <= self.budget:
+                break
+            self._remove(path)
+            total -= size
+            self._count('evictions')
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        Return the cache counters as a dictionary.
+        :return: dictionary of counters and sizes
+        """
+        entries = self._entries()
+        return {
+            'name': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'cost': sum(size for _, _, size in entries),
+            'budget': self.budget,
+        }
@@ -0,0 +1,131 @@
+import os
+import pathlib
+import threading
+import time
+
+import pandas as pd
+
+# seconds between checks of the catalogue files for changes
+CATALOGUE_RELOAD_SECONDS = float(os.environ.get('CATALOGUE_RELOAD_SECONDS', 1.0))
+
+
+class Catalogue:
+    """
+    In-memory catalogue of the ontologies listed in ontologies.csv and of the
+    sparql queries in their per-ontology csv files.
+
+    Lookups by ontology name and query name are dictionary lookups.  The csv
+    files are reloaded when their modification time or size changes, checked
+    at most once every reload_seconds.
+    """
+
+    def __init__(self, ontologies_file, reload_seconds=CATALOGUE_RELOAD_SECONDS):
+        """
+        :param ontologies_file: csv with Name, Description, Endpoint and Sparql columns;
+                                Sparql files are relative to its directory
+        :param reload_seconds: seconds between checks for changed files
+        """
+        self.ontologies_file = pathlib.Path(ontologies_file)
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._versions = {}
+        self._ontologies_df = pd.DataFrame()
+        self._ontologies = {}
+        self._queries = {}
+        self._refresh(force=True)
+
+    @property
+    def ontologies_df(self):
+        """
+        The ontologies as listed in ontologies.csv.
+        """
+        self._refresh()
+        return self._ontologies_df
+
+    def names(self):
+        """
+        Return the ontology names in file order.
+        :return: list of names
+        """
+        self._refresh()
+        return list(self._ontologies)
+
+    def ontology(self, name):
+        """
+        Return the catalogue entry of an ontology.
+        :param name: ontology name
+        :return: dictionary of Name, Description, Endpoint and Sparql, or None
+        """
+        self._refresh()
+        return self._ontologies.get(name)
+
+    def queries(self, name):
+        """
+        Return the sparql query templates of an ontology.
+        :param name: ontology name
+        :return: dictionary of query name to template, in file order
+        """
+        self._refresh()
+        return self._queries.get(name, {})
+
+    def query(self, name, query_name):
+        """
+        Return one sparql query template.
+        :param name: ontology name
+        :param query_name: query name
+        :return: template, or None
+        """
+        return self.queries(name).get(query_name)
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_seconds:
+            return
+        with self._lock:
+            if not force and now - self._checked < self.reload_seconds:
+                return
+            self._checked = now
+            if force:
+                self._load()
+            elif self._changed():
+                try:
+                    self._load()
+                except (OSError, KeyError, pd.errors.ParserError, pd.errors.EmptyDataError):
+                    # keep serving the previous catalogue; the file is retried next check
+                    pass
+
+    def _changed(self):
+        return any(_file_version(path) != version for path, version in self._versions.items())
+
+    def _load(self):
+        versions = {self.ontologies_file: _file_version(self.ontologies_file)}
+        ontologies_df = pd.read_csv(self.ontologies_file)
+        ontologies, queries = {}, {}
+        for row in ontologies_df.to_dict('records'):
+            # the first row of a name wins, as the former DataFrame queries did
+            if row['Name'] in ontologies:
+                continue
+            ontologies[row['Name']] = row
+            query_file = self.ontologies_file.parent.joinpath(row['Sparql'])
+            versions[query_file] = _file_version(query_file)
+            try:
+                sparql_query_df = pd.read_csv(query_file)
+                names, templates = sparql_query_df['Name'], sparql_query_df['Sparql']
+            except (OSError, KeyError, pd.errors.ParserError, pd.errors.EmptyDataError):
+                # keep the previous queries of a missing or half-written file until it changes again
+                queries[row['Name']] = self._queries.get(row['Name'], {})
+                continue
+            queries[row['Name']] = {}
+            for query_name, template in zip(names, templates):
+                queries[row['Name']].setdefault(query_name, template)
+        self._ontologies_df, self._ontologies, self._queries = ontologies_df, ontologies, queries
+        self._versions = versions
+
+
+def _file_version(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+# points per chart trace, about the plot's width in pixels
+CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', 1000))
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Return the indices of the points kept by largest-triangle-three-buckets
+    downsampling: the first and last point, and from every bucket in between
+    the point spanning the largest triangle with the averages of the buckets
+    either side.  Anchoring on the previous bucket's average rather than the
+    point kept from it lets every bucket be chosen at once.  Suits lines.
+    :param x: float64 array, ascending
+    :param y: float64 array without NaN
+    :param n_out: number of points to keep
+    :return: int64 array of ascending indices
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    running_x = np.concatenate([[0.0], np.cumsum(x)])
+    running_y = np.concatenate([[0.0], np.cumsum(y)])
+    counts = edges[1:] - edges[:-1]
+    mean_x = (running_x[edges[1:]] - running_x[edges[:-1]]) / counts
+    mean_y = (running_y[edges[1:]] - running_y[edges[:-1]]) / counts
+    # the first and last point stand in for the buckets before the first and after the last one
+    prev_x, prev_y = np.append(x[0], mean_x[:-1])[:, None], np.append(y[0], mean_y[:-1])[:, None]
+    next_x, next_y = np.append(mean_x[1:], x[-1])[:, None], np.append(mean_y[1:], y[-1])[:, None]
+
+    # one row per bucket, short buckets padded with their first point
+    offsets = np.arange(counts.max())
+    rows = edges[:-1, None] + np.where(offsets < counts[:, None], offsets, 0)
+    areas = np.abs((prev_x - next_x) * (y[rows] - prev_y) - (prev_x - x[rows]) * (next_y - prev_y))
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    kept[1:-1] = rows[np.arange(len(rows)), areas.argmax(axis=1)]
+    return kept
+
+
+def minmax_indices(y, n_out):
+    """
+    Return the indices of the smallest and largest value of every bucket,
+    and of the first and last point, so no spike is lost.  Suits bars.
+    :param y: float64 array without NaN
+    :param n_out: number of points to keep at most
+    :return: int64 array of ascending indices
+    """
+    n = len(y)
+    buckets = (n_out - 2) // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(buckets), edges[1:] - edges[:-1])
+    # sorted by bucket, then value: each bucket's minimum comes first and its maximum last
+    order = np.lexsort((y, bucket))
+    return np.unique(np.concatenate([order[edges[:-1]], order[edges[1:] - 1], [0, n - 1]]))
+
+
+def downsample(x, y, max_points=CHART_MAX_POINTS, method='lttb'):
+    """
+    Return at most max_points points of a trace.  Missing values are dropped.
+    :param x: array of dates or numbers, ascending
+    :param y: array of numbers
+    :param max_points: points to keep at most
+    :param method: 'lttb' or 'minmax'
+    :return: tuple of the kept x and y arrays
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    present = ~np.isnan(y)
+    if not present.all():
+        x, y = x[present], y[present]
+    if len(y) <= max_points:
+        return x, y
+    if method == 'minmax':
+        kept = minmax_indices(y, max_points)
+    elif method == 'lttb':
+        # offsets from the first point keep the triangle areas within float precision
+        if np.issubdtype(x.dtype, np.datetime64):
+            numeric = x.astype('datetime64[ns]').astype(np.int64)
+        elif np.issubdtype(x.dtype, np.number):
+            numeric = x
+        else:
+            # categories are spaced evenly
+            numeric = np.arange(len(x))
+        numeric = (numeric - numeric[0]).astype(np.float64)
+        kept = lttb_indices(numeric, y, max_points)
+    else:
+        raise ValueError(f'unknown downsampling method: {method}')
+    return x[kept], y[kept]
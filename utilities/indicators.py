@@ -0,0 +1,302 @@
+import numbers
+import os
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utilities.instrumentation import instrumented
+
+# rolling window sizes in rows, e.g. INDICATOR_WINDOWS=20,50
+DEFAULT_WINDOWS = tuple(int(w) for w in os.environ.get('INDICATOR_WINDOWS', '20').split(',') if w.strip())
+
+# indicators computed when none are requested
+DEFAULT_INDICATORS = ('ma', 'diff')
+
+INDICATORS = ('ma', 'diff', 'vol', 'return')
+
+
+def price_columns(dataframe, date_column='date'):
+    """
+    Return the numeric columns of a query result, i.e. every column that holds
+    numbers (including the Decimals of xsd:decimal literals) other than the date.
+    :param dataframe: query result
+    :param date_column: name of the date column
+    :return: list of column names
+    """
+    columns = []
+    for c in dataframe.columns:
+        if c == date_column:
+            continue
+        series = dataframe[c]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            columns.append(c)
+        elif pd.api.types.is_object_dtype(series):
+            first = series.first_valid_index()
+            if first is not None and isinstance(series[first], numbers.Number) \
+                    and not isinstance(series[first], bool):
+                columns.append(c)
+    return columns
+
+
+def price_matrix(dataframe, columns):
+    """
+    Return the given columns as one float64 matrix, rows by columns.
+    Decimals are converted by a single numpy cast; missing values become NaN.
+    :param dataframe: query result
+    :param columns: numeric column names
+    :return: 2-D float64 array
+    """
+    if not columns:
+        return np.empty((len(dataframe), 0), dtype=np.float64)
+    return dataframe[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def rolling_mean(matrix, window):
+    """
+    Return the rolling mean of every column over window rows.
+    A mean is NaN until window rows are seen and whenever the window holds a NaN.
+    :param matrix: 2-D float64 array
+    :param window: window size in rows
+    :return: 2-D float64 array of the same shape
+    """
+    sums, counts = _window_sums(matrix, window)
+    out = np.full(matrix.shape, np.nan)
+    if len(sums):
+        out[window - 1:] = np.where(counts == window, sums / window, np.nan)
+    return out
+
+
+def rolling_std(matrix, window):
+    """
+    Return the rolling sample standard deviation of every column over window rows.
+    :param matrix: 2-D float64 array
+    :param window: window size in rows, at least 2
+    :return: 2-D float64 array of the same shape
+    """
+    out = np.full(matrix.shape, np.nan)
+    if window < 2 or len(matrix) < window:
+        return out
+    # centre the columns so the running sums of squares do not lose precision
+    with warnings.catch_warnings():
+        # columns without any value have no mean
+        warnings.simplefilter('ignore', RuntimeWarning)
+        centred = matrix - np.nan_to_num(np.nanmean(matrix, axis=0))
+    sums, counts = _window_sums(centred, window)
+    squares, _ = _window_sums(centred * centred, window)
+    variance = np.maximum(squares - sums * sums / window, 0.0) / (window - 1)
+    out[window - 1:] = np.where(counts == window, np.sqrt(variance), np.nan)
+    return out
+
+
+def simple_returns(matrix):
+    """
+    Return the one-row simple returns of every column; the first row is NaN.
+    :param matrix: 2-D float64 array
+    :return: 2-D float64 array of the same shape
+    """
+    out = np.full(matrix.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[1:] = matrix[1:] / matrix[:-1] - 1.0
+    return out
+
+
+@instrumented('indicators.compute_indicators', size=lambda result: len(result[0]))
+def compute_indicators(dataframe, windows=DEFAULT_WINDOWS, indicators=DEFAULT_INDICATORS, date_column='date'):
+    """
+    Add indicator columns for every numeric column of a query result.
+
+    For each column and window: the moving average <col>_<w>d_ma, the
+    difference to it <col>_diff (<col>_<w>d_diff for windows after the first)
+    and the volatility of the returns <col>_<w>d_vol; and once per column the
+    returns <col>_return.  Each indicator is computed for all columns at once.
+    :param dataframe: query result
+    :param windows: window sizes in rows
+    :param indicators: indicators to compute, a subset of INDICATORS
+    :param date_column: name of the date column
+    :return: tuple of the DataFrame with the indicator columns appended and a
+             dictionary of indicator column name to indicator
+    """
+    unknown = set(indicators) - set(INDICATORS)
+    if unknown:
+        raise ValueError(f'unknown indicators: {sorted(unknown)}')
+    columns = price_columns(dataframe, date_column)
+    prices = price_matrix(dataframe, columns)
+
+    returns = simple_returns(prices) if {'vol', 'return'} & set(indicators) else None
+    computed = {}
+    for i, window in enumerate(windows):
+        mean = rolling_mean(prices, window) if {'ma', 'diff'} & set(indicators) else None
+        if 'ma' in indicators:
+            computed[('ma', i)] = (f'_{window}d_ma', mean)
+        if 'diff' in indicators:
+            computed[('diff', i)] = ('_diff' if i == 0 else f'_{window}d_diff', prices - mean)
+        if 'vol' in indicators:
+            computed[('vol', i)] = (f'_{window}d_vol', rolling_std(returns, window))
+    if 'return' in indicators:
+        computed[('return', 0)] = ('_return', returns)
+
+    # interleave per column: <col>_20d_ma, <col>_diff, ... as the chart lists them
+    names, kinds, blocks = [], {}, []
+    for j, c in enumerate(columns):
+        for (kind, _), (suffix, values) in computed.items():
+            names.append(f'{c}{suffix}')
+            kinds[f'{c}{suffix}'] = kind
+            blocks.append(values[:, j])
+    if not names:
+        return dataframe.copy(), kinds
+
+    indicator_df = pd.DataFrame(np.column_stack(blocks), columns=names, index=dataframe.index)
+    return pd.concat([dataframe, indicator_df], axis=1), kinds
+
+
+def _window_sums(matrix, window):
+    """
+    Return the sums and numbers of non-NaN values of every full window, from
+    differences of running sums.
+    """
+    valid = ~np.isnan(matrix)
+    zero = np.zeros((1, matrix.shape[1]))
+    running = np.concatenate([zero, np.cumsum(np.where(valid, matrix, 0.0), axis=0)])
+    running_counts = np.concatenate([zero, np.cumsum(valid, axis=0)])
+    if len(matrix) < window:
+        empty = np.empty((0, matrix.shape[1]))
+        return empty, empty
+    return running[window:] - running[:-window], running_counts[window:] - running_counts[:-window]
+
+
+class IndicatorSeries:
+    """
+    A date-sorted query result over a date range together with its indicators,
+    kept so a wider date range only needs the rows of the added dates.
+
+    The window state of every ticker is the tail of the series: the last rows
+    a window of the largest size (plus one for returns) can still reach.
+    Indicators of appended rows are computed from that tail and the new rows
+    only, so extending the range by a day costs one day, not the whole range.
+    """
+
+    def __init__(self, dataframe, start, end, windows=DEFAULT_WINDOWS, indicators=DEFAULT_INDICATORS,
+                 date_column='date'):
+        """
+        :param dataframe: query result over the date range, sorted by date
+        :param start: first date of the range (numpy datetime64[D])
+        :param end: last date of the range (numpy datetime64[D])
+        :param windows: window sizes in rows
+        :param indicators: indicators to compute, a subset of INDICATORS
+        :param date_column: name of the date column
+        """
+        self.start = start
+        self.end = end
+        self.windows = tuple(windows)
+        self.indicators = tuple(indicators)
+        self.date_column = date_column
+        self.columns = list(dataframe.columns)
+        self.frame, self.kinds = compute_indicators(dataframe.reset_index(drop=True), self.windows,
+                                                    self.indicators, date_column)
+        self._dates = _date_array(self.frame[date_column])
+        self._chunks = []
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def supports(dataframe, date_column='date'):
+        """
+        Whether a query result can be kept as a series, i.e. it has a date
+        column in ascending order.
+        """
+        if date_column not in dataframe.columns:
+            return False
+        try:
+            dates = _date_array(dataframe[date_column])
+        except (TypeError, ValueError):
+            return False
+        return not np.isnat(dates).any() and bool(np.all(dates[1:] >= dates[:-1]))
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            self._collect()
+            return int(self.frame.memory_usage(deep=True).sum())
+
+    def select(self, start, end, fetch):
+        """
+        Return the query result and indicators over a date range, fetching only
+        the dates the series does not hold yet.
+        :param start: first date (numpy datetime64[D])
+        :param end: last date (numpy datetime64[D])
+        :param fetch: function of a first and last date returning the query result between them
+        :return: tuple of the query result and the DataFrame with indicator columns
+        """
+        with self._lock:
+            return self._select(start, end, fetch)
+
+    def _select(self, start, end, fetch):
+        day = np.timedelta64(1, 'D')
+        if start < self.start:
+            # rows before the first window change every indicator; recompute them all
+            self._prepend(fetch(start, self.start - day), start)
+        if end > self.end:
+            self._append(fetch(self.end + day, end), end)
+        self._collect()
+
+        lo = np.searchsorted(self._dates, start, side='left')
+        hi = np.searchsorted(self._dates, end, side='right')
+        frame = self.frame.iloc[lo:hi]
+        if lo > 0:
+            # the first windows of a narrower range start without history, like a fresh query
+            frame, _ = compute_indicators(frame[self.columns].reset_index(drop=True), self.windows,
+                                          self.indicators, self.date_column)
+        else:
+            frame = frame.reset_index(drop=True)
+        return frame[self.columns], frame
+
+    def _append(self, dataframe, end):
+        self.end = end
+        if not len(dataframe):
+            return
+        dataframe = _sorted_by_date(dataframe, self.date_column)[self.columns]
+        tail_rows = max(self.windows, default=0) + 1
+        tail = self._tail(tail_rows)
+        block, _ = compute_indicators(pd.concat([tail, dataframe], ignore_index=True), self.windows,
+                                      self.indicators, self.date_column)
+        self._chunks.append(block.iloc[len(tail):])
+
+    def _prepend(self, dataframe, start):
+        self._collect()
+        self.start = start
+        if not len(dataframe):
+            return
+        dataframe = _sorted_by_date(dataframe, self.date_column)[self.columns]
+        combined = pd.concat([dataframe, self.frame[self.columns]], ignore_index=True)
+        self.frame, _ = compute_indicators(combined, self.windows, self.indicators, self.date_column)
+        self._dates = _date_array(self.frame[self.date_column])
+
+    def _tail(self, rows):
+        parts, needed = [], rows
+        for part in reversed([self.frame] + self._chunks):
+            if needed <= 0:
+                break
+            parts.append(part.iloc[-needed:][self.columns])
+            needed -= len(parts[-1])
+        return pd.concat(parts[::-1], ignore_index=True) if parts else self.frame[self.columns].iloc[:0]
+
+    def _collect(self):
+        # appended chunks are concatenated once, when the series is read
+        if self._chunks:
+            self.frame = pd.concat([self.frame] + self._chunks, ignore_index=True)
+            self._dates = _date_array(self.frame[self.date_column])
+            self._chunks = []
+
+
+def _date_array(series):
+    return pd.to_datetime(series).to_numpy().astype('datetime64[D]')
+
+
+def _sorted_by_date(dataframe, date_column):
+    if IndicatorSeries.supports(dataframe, date_column):
+        return dataframe
+    order = np.argsort(_date_array(dataframe[date_column]), kind='stable')
+    return dataframe.iloc[order]
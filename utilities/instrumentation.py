@@ -0,0 +1,439 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+# timing spans are recorded unless INSTRUMENTATION=0
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION', '1') != '0'
+
+# requests at least this slow are written to the structured log; 0 logs every request
+INSTRUMENTATION_LOG_MS = float(os.environ.get('INSTRUMENTATION_LOG_MS', 1000))
+
+# requests at least this slow are profiled; 0 disables profiling
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', 0))
+# cprofile, or pyinstrument when it is installed (pip install pyinstrument)
+PROFILER = os.environ.get('PROFILER', 'cprofile')
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), f'semantic-web-profiles-{os.getuid()}'))
+
+# upper bounds in seconds of the span duration histogram buckets
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = 'semantic_web'
+
+# where the structured log goes: '-' for stderr, a file, or '' to leave it to the logging configuration
+INSTRUMENTATION_LOG = os.environ.get('INSTRUMENTATION_LOG', '-')
+
+logger = logging.getLogger('semantic_web.instrumentation')
+if INSTRUMENTATION_LOG:
+    # one json record per line
+    _handler = logging.StreamHandler() if INSTRUMENTATION_LOG == '-' else logging.FileHandler(INSTRUMENTATION_LOG)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+# --------------------------------------------------
+# spans
+#
+class Span:
+    """
+    One timed operation: a request, a callback or a utilities.ont call.
+    Spans started while another is open become its children.
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.children = []
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.error = None
+
+    def set(self, **fields):
+        """
+        Attach fields to the span, e.g. result sizes; 'size' and 'bytes' are
+        also summed per span name in the metrics.
+        """
+        self.fields.update(fields)
+
+    @property
+    def self_seconds(self):
+        """
+        Seconds spent in the span itself rather than in its children.
+        """
+        return self.seconds - sum(child.seconds for child in self.children)
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """
+    Time a block as a span of the current request.
+    :param name: span name, e.g. 'ont.build_ontology_as_rdflib_graph'
+    :param fields: fields logged with the span
+    :return: context manager yielding the Span
+    """
+    s = Span(name, fields)
+    if not INSTRUMENTATION:
+        yield s
+        return
+    parent = _current_span.get()
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.seconds = time.perf_counter() - s.started
+        _current_span.reset(token)
+        metrics.observe(s)
+        if parent is not None:
+            parent.children.append(s)
+        elif s.seconds * 1000 >= INSTRUMENTATION_LOG_MS or 'profile' in s.fields:
+            logger.info(json.dumps(summarise_span(s), default=str))
+
+
+def instrumented(name=None, size=None):
+    """
+    Decorator timing every call of a function as a span.
+    :param name: span name, by default the function's qualified name
+    :param size: function of the result returning its size, e.g. len
+    :return: decorator
+    """
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name) as s:
+                result = fn(*args, **kwargs)
+                if size is not None:
+                    s.set(size=size(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def summarise_span(root):
+    """
+    Return a request span as a log record: its own fields and duration and,
+    per name, the number, total and self milliseconds of the spans below it.
+    :param root: finished span
+    :return: dictionary
+    """
+    spans = {}
+    pending = list(root.children)
+    while pending:
+        s = pending.pop()
+        pending.extend(s.children)
+        entry = spans.setdefault(s.name, {'count': 0, 'ms': 0.0, 'self_ms': 0.0})
+        entry['count'] += 1
+        entry['ms'] += s.seconds * 1000
+        entry['self_ms'] += s.self_seconds * 1000
+        for field in ('size', 'bytes'):
+            if field in s.fields:
+                entry[field] = entry.get(field, 0) + s.fields[field]
+    for entry in spans.values():
+        entry['ms'] = round(entry['ms'], 3)
+        entry['self_ms'] = round(entry['self_ms'], 3)
+    record = {'span': root.name, 'ms': round(root.seconds * 1000, 3),
+              'self_ms': round(root.self_seconds * 1000, 3)}
+    if root.error is not None:
+        record['error'] = root.error
+    record.update(root.fields)
+    record['spans'] = dict(sorted(spans.items(), key=lambda item: -item[1]['self_ms']))
+    return record
+
+
+# --------------------------------------------------
+# metrics
+#
+class Metrics:
+    """
+    Span counters of this process, rendered in the Prometheus text format.
+    Every gunicorn worker keeps its own counters; scrape each worker, or run
+    one worker per instance, to see them all.
+    """
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        """
+        :param buckets: upper bounds in seconds of the duration histogram
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._collectors = []
+
+    def observe(self, s):
+        """
+        Count a finished span.
+        :param s: Span
+        :return: None
+        """
+        with self._lock:
+            entry = self._spans.get(s.name)
+            if entry is None:
+                entry = self._spans[s.name] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0,
+                                               'errors': 0, 'size': 0, 'bytes': 0}
+            for i, bound in enumerate(self.buckets):
+                if s.seconds <= bound:
+                    entry['buckets'][i] += 1
+            entry['count'] += 1
+            entry['sum'] += s.seconds
+            entry['errors'] += s.error is not None
+            entry['size'] += s.fields.get('size', 0) or 0
+            entry['bytes'] += s.fields.get('bytes', 0) or 0
+
+    def register_collector(self, collect):
+        """
+        Add a function reporting further metrics whenever they are rendered.
+        :param collect: function returning an iterable of (name, type, help, labels, value) tuples
+        :return: None
+        """
+        self._collectors.append(collect)
+
+    def register_cache(self, stats):
+        """
+        Report the counters of a cache, see utilities.cache.
+        :param stats: function returning the stats() dictionary of a cache
+        :return: None
+        """
+        def collect():
+            s = stats()
+            labels = {'cache': s['name']}
+            yield 'cache_hits_total', 'counter', 'Cache hits.', labels, s['hits']
+            yield 'cache_misses_total', 'counter', 'Cache misses.', labels, s['misses']
+            yield 'cache_evictions_total', 'counter', 'Cache evictions.', labels, s['evictions']
+            yield 'cache_entries', 'gauge', 'Cache entries.', labels, s['entries']
+            yield 'cache_cost', 'gauge', 'Cache size in its cost unit, usually bytes.', labels, s['cost']
+        self.register_collector(collect)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        :return: string
+        """
+        with self._lock:
+            spans = {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in self._spans.items()}
+        families = {}
+
+        def add(name, metric_type, help_text, labels, value):
+            family = families.setdefault(name, (metric_type, help_text, []))
+            family[2].append((labels, value))
+
+        for name, entry in sorted(spans.items()):
+            labels = {'span': name}
+            for bound, count in zip(self.buckets, entry['buckets']):
+                add('span_seconds_bucket', 'histogram', 'Duration of spans.', dict(labels, le=repr(bound)), count)
+            add('span_seconds_bucket', 'histogram', '', dict(labels, le='+Inf'), entry['count'])
+            add('span_seconds_sum', 'histogram', '', labels, entry['sum'])
+            add('span_seconds_count', 'histogram', '', labels, entry['count'])
+            add('span_errors_total', 'counter', 'Spans ended by an exception.', labels, entry['errors'])
+            if entry['size']:
+                add('span_result_size_total', 'counter', 'Result sizes (rows, triples or elements) of spans.',
+                    labels, entry['size'])
+            if entry['bytes']:
+                add('span_payload_bytes_total', 'counter', 'Payload bytes returned by spans.', labels,
+                    entry['bytes'])
+        for collect in self._collectors:
+            for name, metric_type, help_text, labels, value in collect():
+                add(name, metric_type, help_text, labels, value)
+
+        lines = []
+        for name, (metric_type, help_text, samples) in families.items():
+            full_name = f'{METRIC_PREFIX}_{name}'
+            if help_text:
+                # the histogram's _sum and _count share the type line of its _bucket
+                family = re.sub(r'_bucket$', '', full_name)
+                lines.append(f'# HELP {family} {help_text}')
+                lines.append(f'# TYPE {family} {metric_type}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f'{full_name}{{{label_text}}} {value}' if label_text else f'{full_name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+# --------------------------------------------------
+# profiles of slow requests
+#
+class RequestProfiler:
+    """
+    Profiles one request with cProfile or pyinstrument and keeps the profile
+    when the request took at least PROFILE_THRESHOLD_MS.  Only one request is
+    profiled at a time, since python allows a single active profiler.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, profiler=PROFILER, directory=PROFILE_DIR):
+        """
+        :param profiler: 'cprofile' or 'pyinstrument'
+        :param directory: directory the profiles are written to
+        """
+        self.profiler = profiler
+        self.directory = directory
+        self._profile = None
+
+    def start(self):
+        """
+        Start profiling, unless another request is being profiled.
+        :return: whether profiling started
+        """
+        if not RequestProfiler._lock.acquire(blocking=False):
+            return False
+        try:
+            if self.profiler == 'pyinstrument':
+                try:
+                    import pyinstrument
+                    self._profile = pyinstrument.Profiler()
+                except ImportError:
+                    self.profiler = 'cprofile'
+            if self.profiler == 'pyinstrument':
+                self._profile.start()
+            else:
+                import cProfile
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+        except Exception:
+            self._profile = None
+            RequestProfiler._lock.release()
+            raise
+        return True
+
+    def stop(self, seconds, name):
+        """
+        Stop profiling and write the profile of a slow request.
+        :param seconds: duration of the request
+        :param name: request name, part of the file name
+        :return: path of the profile, or None
+        """
+        if self._profile is None:
+            return None
+        try:
+            if self.profiler == 'pyinstrument':
+                self._profile.stop()
+            else:
+                self._profile.disable()
+            if seconds * 1000 < PROFILE_THRESHOLD_MS:
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            stem = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(seconds * 1000)}ms-{re.sub(r"[^A-Za-z0-9_.-]+", "_", name)}'
+            if self.profiler == 'pyinstrument':
+                path = os.path.join(self.directory, stem + '.html')
+                with open(path, 'w') as f:
+                    f.write(self._profile.output_html())
+            else:
+                # view with python -m pstats, snakeviz or similar
+                path = os.path.join(self.directory, stem + '.prof')
+                self._profile.dump_stats(path)
+            return path
+        finally:
+            self._profile = None
+            RequestProfiler._lock.release()
+
+
+# --------------------------------------------------
+# dash and flask
+#
+def instrument_callbacks(app):
+    """
+    Time every callback registered with a dash app so far as a span named
+    after its function, recording the bytes of the json response.
+    :param app: dash app
+    :return: None
+    """
+    for spec in app.callback_map.values():
+        # clientside callbacks run in the browser and have no function here
+        callback = spec.get('callback')
+        if callback is None or getattr(callback, '_instrumented', False):
+            continue
+        spec['callback'] = _instrument_callback(callback)
+
+
+def _instrument_callback(callback):
+    name = f'callback.{callback.__name__}'
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        with span(name) as s:
+            response = callback(*args, **kwargs)
+            if isinstance(response, (str, bytes)):
+                s.set(bytes=len(response))
+            return response
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_server(server, metrics_path='/metrics'):
+    """
+    Open a span per request of a flask server, profile slow requests when
+    PROFILE_THRESHOLD_MS is set, and serve the metrics at metrics_path.
+    :param server: flask app, e.g. dash's app.server
+    :param metrics_path: url of the Prometheus metrics
+    :return: None
+    """
+    import flask
+
+    def before_request():
+        rule = flask.request.url_rule.rule if flask.request.url_rule is not None else 'unmatched'
+        context = span(f'http {flask.request.method} {rule}')
+        flask.g.instrumentation_span = context.__enter__()
+        flask.g.instrumentation_context = context
+        flask.g.instrumentation_profiler = None
+        if PROFILE_THRESHOLD_MS > 0 and INSTRUMENTATION:
+            profiler = RequestProfiler()
+            if profiler.start():
+                flask.g.instrumentation_profiler = profiler
+
+    def after_request(response):
+        s = flask.g.get('instrumentation_span')
+        if s is not None:
+            # streamed responses, e.g. csv downloads, have no length yet
+            s.set(status=response.status_code)
+            if response.content_length is not None:
+                s.set(bytes=response.content_length)
+        return response
+
+    def teardown_request(exc):
+        context = flask.g.pop('instrumentation_context', None)
+        if context is None:
+            return
+        s = flask.g.pop('instrumentation_span')
+        profiler = flask.g.pop('instrumentation_profiler', None)
+        if profiler is not None:
+            path = profiler.stop(time.perf_counter() - s.started, s.name)
+            if path is not None:
+                s.set(profile=path)
+        if exc is not None:
+            context.__exit__(type(exc), exc, exc.__traceback__)
+        else:
+            context.__exit__(None, None, None)
+
+    server.before_request(before_request)
+    server.after_request(after_request)
+    server.teardown_request(teardown_request)
+
+    @server.route(metrics_path)
+    def prometheus_metrics():
+        return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
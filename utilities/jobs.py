@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# threads of every web process running submitted queries
+JOB_THREADS = int(os.environ.get('JOB_THREADS', 4))
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job by its progress function once the job was cancelled.
+    """
+
+
+class JobRunner:
+    """
+    Runs long callbacks on a thread pool of the web process, so they use the
+    process's warm caches and query executor, and publishes their progress
+    and results in a store every worker process can read.
+
+    A job reports progress by calling the function it is passed as first
+    argument.  Once the job is cancelled that call raises JobCancelled, so
+    the job stops at its next progress report and its result is dropped.
+    """
+
+    def __init__(self, store, max_workers=JOB_THREADS):
+        """
+        :param store: cache with get and put shared by the worker processes, e.g. a DiskCache
+        :param max_workers: jobs running at once in this process
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args):
+        """
+        Start a job.
+        :param function: function of a progress function and args
+        :param args: further arguments of function
+        :return: job id
+        """
+        job_id = uuid.uuid4().hex
+        self.store.put(('job', job_id), {'state': 'running', 'progress': ''})
+        self._get_executor().submit(self._run, job_id, function, args)
+        return job_id
+
+    def status(self, job_id):
+        """
+        Return the state of a job: 'running' with its progress, 'done' with its
+        result, 'error' with the error as progress, 'cancelled', or 'missing'
+        when the job is unknown or expired.
+        :param job_id: id returned by submit
+        :return: dictionary with 'state', 'progress' and, once done, 'result'
+        """
+        return self.store.get(('job', job_id)) or {'state': 'missing', 'progress': ''}
+
+    def cancel(self, job_id):
+        """
+        Cancel a job, in whichever worker process it runs.
+        :param job_id: id returned by submit
+        :return: None
+        """
+        self.store.put(('job-cancelled', job_id), True)
+        self.store.put(('job', job_id), {'state': 'cancelled', 'progress': ''})
+
+    def cancelled(self, job_id):
+        """
+        Whether a job was cancelled.
+        :param job_id: id returned by submit
+        :return: bool
+        """
+        return self.store.get(('job-cancelled', job_id)) is not None
+
+    def _get_executor(self):
+        # threads do not survive a fork, so a forked worker process starts its own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, job_id, function, args):
+        def set_progress(progress):
+            if self.cancelled(job_id):
+                raise JobCancelled(job_id)
+            self.store.put(('job', job_id), {'state': 'running', 'progress': progress})
+
+        try:
+            status = {'state': 'done', 'progress': '', 'result': function(set_progress, *args)}
+        except JobCancelled:
+            return
+        except Exception as e:
+            logger.exception('job %s failed', job_id)
+            status = {'state': 'error', 'progress': f'{type(e).__name__}: {e}'}
+        if not self.cancelled(job_id):
+            self.store.put(('job', job_id), status)
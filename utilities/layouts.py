@@ -0,0 +1,105 @@
+import math
+
+import networkx as nx
+import numpy as np
+
+# layouts of the View tab, named as in cytoscape.js
+LAYOUTS = ('random', 'grid', 'circle', 'concentric', 'breadthfirst')
+
+# distance between neighbouring nodes, in cytoscape model units
+NODE_SPACING = 80
+
+
+def compute_layout(g, name):
+    """
+    Return cytoscape positions of every node of a graph, arranged like the
+    cytoscape.js layout of the same name.
+    :param g: networkx graph whose nodes are cytoscape node ids
+    :param name: one of LAYOUTS
+    :return: dictionary of cytoscape node id to {'x': x, 'y': y}
+    """
+    if name not in LAYOUTS:
+        raise ValueError(f'unknown layout: {name}')
+    nodes = list(g.nodes)
+    if not nodes:
+        return {}
+    if name == 'random':
+        xy = _random_layout(len(nodes))
+    elif name == 'grid':
+        xy = _grid_layout(len(nodes))
+    elif name == 'circle':
+        xy = _circle_layout(len(nodes))
+    elif name == 'concentric':
+        xy = _concentric_layout(g, nodes)
+    else:
+        xy = _breadthfirst_layout(g, nodes)
+    xy = np.round(xy, 1)
+    return {str(node): {'x': x, 'y': y} for node, (x, y) in zip(nodes, xy.tolist())}
+
+
+def elements_to_networkx(elements):
+    """
+    Return the undirected graph of cytoscape nodes and edges.
+    :param elements: list of dictionaries specifying nodes and edges
+    :return: networkx graph
+    """
+    g = nx.Graph()
+    g.add_nodes_from(e['data']['id'] for e in elements if 'source' not in e['data'])
+    g.add_edges_from((e['data']['source'], e['data']['target']) for e in elements if 'source' in e['data'])
+    return g
+
+
+def _random_layout(n):
+    # a fixed seed keeps the picture stable across workers and restarts
+    side = NODE_SPACING * math.sqrt(n)
+    return np.random.default_rng(0).random((n, 2)) * side
+
+
+def _grid_layout(n):
+    columns = math.ceil(math.sqrt(n))
+    i = np.arange(n)
+    return np.column_stack([i % columns, i // columns]) * NODE_SPACING
+
+
+def _circle_layout(n):
+    radius = max(NODE_SPACING * n / (2 * math.pi), NODE_SPACING)
+    angle = 2 * math.pi * np.arange(n) / n
+    return np.column_stack([np.cos(angle), np.sin(angle)]) * radius
+
+
+def _concentric_layout(g, nodes):
+    # like cytoscape: the highest degrees in the middle, levels of a quarter of the highest degree each
+    degrees = np.array([g.degree(node) for node in nodes])
+    level_width = max(degrees.max() / 4, 1)
+    levels = (degrees.max() - degrees) // level_width
+    xy = np.zeros((len(nodes), 2))
+    radius = 0.0
+    for i, level in enumerate(np.unique(levels)):
+        members = np.flatnonzero(levels == level)
+        # a single node of the innermost level sits in the middle; every other level is a ring
+        if i or len(members) > 1:
+            # far enough out for the nodes of this level not to overlap
+            radius = max(radius + NODE_SPACING, NODE_SPACING * len(members) / (2 * math.pi))
+        angle = 2 * math.pi * np.arange(len(members)) / len(members)
+        xy[members] = np.column_stack([np.cos(angle), np.sin(angle)]) * radius
+    return xy
+
+
+def _breadthfirst_layout(g, nodes):
+    # every connected component is a tree of breadth-first levels from its best connected node,
+    # the components side by side
+    undirected = g.to_undirected(as_view=True) if g.is_directed() else g
+    index = {node: i for i, node in enumerate(nodes)}
+    xy = np.zeros((len(nodes), 2))
+    left = 0.0
+    for component in sorted(nx.connected_components(undirected), key=len, reverse=True):
+        root = max(component, key=undirected.degree)
+        layers = list(nx.bfs_layers(undirected, root))
+        width = max(len(layer) for layer in layers)
+        for depth, layer in enumerate(layers):
+            # centre every level under the widest one
+            members = [index[node] for node in layer]
+            xy[members, 0] = left + ((width - len(layer)) / 2 + np.arange(len(layer))) * NODE_SPACING
+            xy[members, 1] = depth * NODE_SPACING
+        left += (width + 1) * NODE_SPACING
+    return xy
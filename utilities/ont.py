@@ -0,0 +1,1135 @@
+import contextlib
+import hashlib
+import itertools
+import atexit
+import os
+import queue
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process locks on windows; identical queries may then run twice
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+import ontospy
+
+from multiprocessing.connection import Connection
+
+from rdflib import Graph, Literal
+from rdflib.namespace import XSD
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.evaluate import evalQuery
+from rdflib.extras.external_graph_libs import rdflib_to_networkx_graph
+from ontospy.gendocs.viz.viz_html_single import HTMLVisualizer
+
+from utilities.cache import DiskCache, LRUCache, private_directory
+from utilities.indicators import DEFAULT_INDICATORS, DEFAULT_WINDOWS, IndicatorSeries, compute_indicators
+from utilities.instrumentation import instrumented, span
+from utilities.layouts import compute_layout, elements_to_networkx
+from utilities.projection import DEFAULT_PROJECTION, graph_predicates, project_graph
+from utilities.template import get_query_template, render_query_template
+from utilities.serialization import load_snapshot, read_snapshot_header, write_snapshot
+from utilities.timeseries import build_price_index, match_price_query
+
+# --------------------------------------------------
+# parsed ontology cache
+#
+# parsed graphs are shared process-wide, keyed by endpoint, format and file version
+GRAPH_CACHE_BUDGET_BYTES = int(os.environ.get('GRAPH_CACHE_BUDGET_BYTES', 512 * 1024 * 1024))
+# rough in-memory footprint of one triple in rdflib's default store
+GRAPH_BYTES_PER_TRIPLE = 2048
+
+# binary snapshots are written next to each local ontology file
+SNAPSHOT_SUFFIX = '.snapshot'
+
+_graph_cache = LRUCache(GRAPH_CACHE_BUDGET_BYTES, name='graph')
+_graph_load_lock = threading.Lock()
+
+# columnar ticker price indexes, built alongside each parsed ontology
+_price_index_cache = LRUCache(GRAPH_CACHE_BUDGET_BYTES // 8, name='price_index')
+# cytoscape elements of the View tab, one entry per ontology version
+_cytoscape_cache = LRUCache(GRAPH_CACHE_BUDGET_BYTES // 8, name='cytoscape')
+# rough serialised size of one cytoscape node or edge
+CYTOSCAPE_BYTES_PER_ELEMENT = 256
+# node positions of the View tab, one entry per ontology version and layout
+_cytoscape_layout_cache = LRUCache(GRAPH_CACHE_BUDGET_BYTES // 8, name='cytoscape_layout')
+# rough size of one node position
+CYTOSCAPE_BYTES_PER_POSITION = 128
+# predicates of every ontology version, offered by the View tab's predicate filter
+_predicate_cache = LRUCache(1024, name='predicates')
+
+# query results shared by every worker process on the host, in a directory private to the user
+QUERY_CACHE_DIR = os.environ.get('QUERY_CACHE_DIR', os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'semantic-web'))
+QUERY_CACHE_BUDGET_BYTES = int(os.environ.get('QUERY_CACHE_BUDGET_BYTES', 256 * 1024 * 1024))
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', 3600))
+
+private_directory(QUERY_CACHE_DIR)
+_result_cache = DiskCache(os.path.join(QUERY_CACHE_DIR, 'queries'), QUERY_CACHE_BUDGET_BYTES,
+                          ttl=QUERY_CACHE_TTL_SECONDS, name='query_results')
+
+# identical queries in flight are run once; every key has its own lock file
+QUERY_LOCK_DIR = os.path.join(QUERY_CACHE_DIR, 'locks')
+
+# sparql tokens that must survive normalisation untouched; whitespace and comments collapse
+_QUERY_TOKEN_PATTERN = re.compile(
+    r'(?P<string>"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+    r'|(?P<iri><[^<>"{}|^`\\\s]*>)'
+    r'|(?P<space>(?:\s|#[^\n]*)+)'
+)
+# literal datatypes converted to float64 (or int64) columns
+NUMERIC_DATATYPES = {
+    XSD.decimal, XSD.double, XSD.float, XSD.integer, XSD.int, XSD.long, XSD.short, XSD.byte,
+    XSD.nonNegativeInteger, XSD.nonPositiveInteger, XSD.positiveInteger, XSD.negativeInteger,
+    XSD.unsignedLong, XSD.unsignedInt, XSD.unsignedShort, XSD.unsignedByte,
+}
+
+# worker processes evaluating sparql queries; 0 evaluates them in the calling thread
+QUERY_WORKERS = int(os.environ.get('QUERY_WORKERS', 0))
+# queries waiting for a worker before further queries are turned away
+QUERY_MAX_PENDING = int(os.environ.get('QUERY_MAX_PENDING', 4 * max(QUERY_WORKERS, 1)))
+QUERY_TIMEOUT_SECONDS = float(os.environ.get('QUERY_TIMEOUT_SECONDS', 60))
+# seconds a query waits for an identical one in flight before running itself
+QUERY_LOCK_TIMEOUT_SECONDS = float(os.environ.get('QUERY_LOCK_TIMEOUT_SECONDS', QUERY_TIMEOUT_SECONDS))
+
+# worker processes computing View tab layouts; 0 computes them in the calling thread
+LAYOUT_WORKERS = int(os.environ.get('LAYOUT_WORKERS', 0))
+LAYOUT_TIMEOUT_SECONDS = float(os.environ.get('LAYOUT_TIMEOUT_SECONDS', 120))
+
+# rows per chunk of the streaming query api
+QUERY_CHUNK_ROWS = int(os.environ.get('QUERY_CHUNK_ROWS', 10000))
+
+# (ontology key, query text, is template) -> PreparedQuery
+_prepared_query_cache = LRUCache(1024, name='prepared_query')
+
+# template results and their indicators, keyed by everything but the date range
+_indicator_series_cache = LRUCache(GRAPH_CACHE_BUDGET_BYTES // 8, name='indicator_series')
+
+
+@instrumented('ont.get_sparql_query_results', size=len)
+def get_sparql_query_results(endpoint, query_text):
+    """
+    Return the result of a sparql query.
+    Results are cached on disk by normalised query text and ontology version.
+    :param endpoint: endpoint
+    :param query_text: sparql query
+    :return: QueryResult
+    """
+    key = get_query_cache_key(endpoint, query_text)
+    result = _result_cache.get(key)
+    if not isinstance(result, QueryResult):
+        # a miss, or an entry written in the former tuple format
+        with single_flight(key):
+            # an identical query may have finished while this one waited
+            result = _result_cache.get(key)
+            if not isinstance(result, QueryResult):
+                result = execute_sparql_query(endpoint, query_text)
+                _result_cache.put(key, result)
+    return result
+
+
+@contextlib.contextmanager
+def single_flight(key, timeout=None):
+    """
+    Hold an exclusive lock for a cache key, shared by every process on the
+    host, so that of several identical queries in flight only the first runs
+    and the others wait for its cached result.  A caller that waits longer
+    than timeout goes ahead without the lock.
+    :param key: cache key
+    :param timeout: seconds to wait for the lock, defaults to QUERY_LOCK_TIMEOUT_SECONDS
+    :return: context manager yielding whether the lock is held
+    """
+    if fcntl is None:
+        yield False
+        return
+    timeout = QUERY_LOCK_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    private_directory(QUERY_LOCK_DIR)
+    digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+    with open(os.path.join(QUERY_LOCK_DIR, f'{digest}.lock'), 'a') as lock_file:
+        delay = 0.005
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    locked = False
+                    break
+                time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+                delay = min(delay * 2, 0.1)
+        try:
+            yield locked
+        finally:
+            if locked:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_query_cache_key(endpoint, query_text):
+    """
+    Return the key a query result is cached under.
+    :param endpoint: ontology endpoint
+    :param query_text: sparql query
+    :return: key as a string
+    """
+    normalized = normalize_query_text(query_text)
+    digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    return f'{endpoint}@{get_ontology_version(endpoint)}:{digest}'
+
+
+def normalize_query_text(query_text):
+    """
+    Return a query with comments removed and whitespace collapsed, leaving
+    string literals and IRIs untouched.
+    :param query_text: sparql query
+    :return: normalised query
+    """
+    def replace(match):
+        return ' ' if match.lastgroup == 'space' else match.group(0)
+
+    return _QUERY_TOKEN_PATTERN.sub(replace, query_text).strip()
+
+
+def get_query_cache_stats():
+    """
+    Return hit/miss/eviction counters of the query result cache.
+    :return: dictionary of counters
+    """
+    return _result_cache.stats()
+
+
+@instrumented('ont.execute_sparql_query', size=len)
+def execute_sparql_query(endpoint, query_text):
+    """
+    Run a sparql query against an ontology, bypassing the result cache.
+    :param endpoint: endpoint
+    :param query_text: sparql query
+    :return: QueryResult
+    """
+    prepared = get_prepared_query(endpoint, query_text, is_template=False)
+    return _execute_prepared_query(prepared, endpoint, query_text, False, None)
+
+
+def iter_sparql_query_results(endpoint, query_text, chunk_size=None):
+    """
+    Run a sparql query, yielding the result in fixed-size chunks so it can be
+    consumed in bounded memory.  Results are not cached.
+    :param endpoint: endpoint
+    :param query_text: sparql query
+    :param chunk_size: rows per chunk, defaults to QUERY_CHUNK_ROWS
+    :return: generator of typed DataFrames
+    """
+    return get_prepared_query(endpoint, query_text, is_template=False).iter_chunks(endpoint, None, chunk_size)
+
+
+def iter_sparql_template_results(endpoint, template_text, parameters, chunk_size=None):
+    """
+    Run a sparql query template, yielding the result in fixed-size chunks.
+    :param endpoint: endpoint
+    :param template_text: sparql query template with <<name: type>> tags
+    :param parameters: dictionary of tag type to value
+    :param chunk_size: rows per chunk, defaults to QUERY_CHUNK_ROWS
+    :return: generator of typed DataFrames
+    """
+    prepared = get_prepared_query(endpoint, template_text, is_template=True)
+    if prepared.query is None:
+        return iter_sparql_query_results(endpoint, render_query_template(template_text, parameters), chunk_size)
+    return prepared.iter_chunks(endpoint, prepared.bindings(parameters), chunk_size)
+
+
+@instrumented('ont.get_sparql_template_results', size=len)
+def get_sparql_template_results(endpoint, template_text, parameters):
+    """
+    Return the result of a sparql query template for a set of parameters.
+    Date and precision slots are bound as initBindings of the template's
+    precompiled query; templates with other slots are rendered as text.
+    :param endpoint: endpoint
+    :param template_text: sparql query template with <<name: type>> tags
+    :param parameters: dictionary of tag type to value, e.g. {'start_date': '2023-01-01'}
+    :return: QueryResult
+    """
+    prepared = get_prepared_query(endpoint, template_text, is_template=True)
+    if prepared.query is None:
+        return get_sparql_query_results(endpoint, render_query_template(template_text, parameters))
+
+    bindings = prepared.bindings(parameters)
+    key = get_query_cache_key(endpoint, template_text) + ':' + repr(sorted(bindings.items()))
+    result = _result_cache.get(key)
+    if not isinstance(result, QueryResult):
+        with single_flight(key):
+            result = _result_cache.get(key)
+            if not isinstance(result, QueryResult):
+                result = _execute_prepared_query(prepared, endpoint, template_text, True, bindings)
+                _result_cache.put(key, result)
+    return result
+
+
+@instrumented('ont.get_sparql_template_indicators', size=lambda result: len(result[1]))
+def get_sparql_template_indicators(endpoint, template_text, parameters, windows=DEFAULT_WINDOWS,
+                                   indicators=DEFAULT_INDICATORS):
+    """
+    Return the result of a sparql query template and its indicators.
+    For templates filtering on an inclusive start_date to end_date range, see
+    has_inclusive_date_range, the result is kept per set of other parameters,
+    so changing the date range only queries the added dates and only computes
+    the indicators of the added rows.
+    :param endpoint: endpoint
+    :param template_text: sparql query template with <<name: type>> tags
+    :param parameters: dictionary of tag type to value
+    :param windows: indicator window sizes in rows
+    :param indicators: indicators to compute, see utilities.indicators
+    :return: tuple of column specifications, result DataFrame, DataFrame with
+             the indicator columns appended and a dictionary of indicator column to indicator
+    """
+    try:
+        start = np.datetime64(str(parameters['start_date'])[:10], 'D')
+        end = np.datetime64(str(parameters['end_date'])[:10], 'D')
+    except (KeyError, ValueError):
+        start = end = None
+    if start is None or not has_inclusive_date_range(get_prepared_query(endpoint, template_text, is_template=True)):
+        result = get_sparql_template_results(endpoint, template_text, parameters)
+        frame, kinds = compute_indicators(result.dataframe, windows, indicators)
+        return result.columns, result.dataframe, frame, kinds
+
+    def fetch(first, last):
+        bounded = dict(parameters, start_date=str(first), end_date=str(last))
+        return get_sparql_template_results(endpoint, template_text, bounded).dataframe
+
+    others = sorted((k, str(v)) for k, v in parameters.items() if k not in ('start_date', 'end_date'))
+    key = (endpoint, get_ontology_version(endpoint), template_text, repr(others), tuple(windows), tuple(indicators))
+    series = _indicator_series_cache.get(key)
+    if series is None:
+        dataframe = fetch(start, end)
+        if not IndicatorSeries.supports(dataframe):
+            frame, kinds = compute_indicators(dataframe, windows, indicators)
+            return _column_specs(dataframe), dataframe, frame, kinds
+        series = IndicatorSeries(dataframe, start, end, windows, indicators)
+        # entries of older ontology versions can never be hit again
+        _indicator_series_cache.discard_if(lambda k: k[0] == endpoint and k[1] != key[1])
+
+    dataframe, frame = series.select(start, end, fetch)
+    _indicator_series_cache.put(key, series, cost=series.nbytes)
+    return _column_specs(dataframe), dataframe, frame, series.kinds
+
+
+def has_inclusive_date_range(prepared):
+    """
+    Whether the rows of a template over a date range are exactly its rows on
+    each date of the range, so a wider range only needs the rows of the added
+    dates and a narrower one is a slice of the rows held.  That holds for a
+    date-ordered join of ticker prices filtered by ?date >= start_date and
+    ?date <= end_date, and not, for example, for exclusive bounds, LIMIT,
+    DISTINCT or aggregates.
+    :param prepared: PreparedQuery of a template
+    :return: bool
+    """
+    price_query = prepared.price_query
+    if prepared.template is None or price_query is None or price_query.order not in (None, 'ASC'):
+        return False
+    variables = {slot.tag_type: slot.variable for slot in prepared.template.slots}
+    if 'start_date' not in variables or 'end_date' not in variables:
+        return False
+    bounds = sorted((op, str(value)) for op, value in price_query.bounds)
+    return bounds == [('<=', variables['end_date']), ('>=', variables['start_date'])]
+
+
+def _column_specs(dataframe):
+    return [{'name': c, 'id': c} for c in dataframe.columns]
+
+
+@instrumented('ont.prepare_query_templates')
+def prepare_query_templates(endpoint, template_texts):
+    """
+    Compile the query templates of an ontology ahead of their first use.
+    :param endpoint: ontology endpoint
+    :param template_texts: sparql query templates
+    :return: None
+    """
+    for template_text in template_texts:
+        try:
+            get_prepared_query(endpoint, template_text, is_template=True)
+        except Exception:
+            # broken templates report their error when they are submitted
+            pass
+
+
+@instrumented('ont.get_prepared_query')
+def get_prepared_query(endpoint, query_text, is_template=False):
+    """
+    Return a query or query template parsed and algebrized once per ontology.
+    :param endpoint: ontology endpoint
+    :param query_text: sparql query, or template with <<name: type>> tags
+    :param is_template: whether query_text is a template
+    :return: PreparedQuery
+    """
+    key = (_graph_key(endpoint, 'application/rdf+xml'), query_text, is_template)
+    prepared = _prepared_query_cache.get(key)
+    if prepared is None:
+        g = build_ontology_as_rdflib_graph(endpoint)
+        prepared = PreparedQuery(query_text, dict(g.namespaces()), is_template)
+        _prepared_query_cache.put(key, prepared)
+    return prepared
+
+
+# --------------------------------------------------
+# query executor
+#
+# rdflib evaluates queries in pure python under the GIL, so concurrent
+# queries are spread over worker processes.  Each worker maps the ontology
+# snapshots itself; only the query and its typed result cross the pipe.
+_query_executor = None
+_query_executor_lock = threading.Lock()
+
+
+class QueryExecutorBusy(RuntimeError):
+    """
+    Raised when every worker is busy and the queue of waiting queries is full.
+    """
+
+
+class OntologyVersionChanged(RuntimeError):
+    """
+    Raised when an ontology file changed while something was built from it.
+    """
+
+
+def get_query_executor():
+    """
+    Return the process-wide query executor, started on first use when
+    QUERY_WORKERS is set.
+    :return: QueryExecutor or None
+    """
+    global _query_executor
+    if _query_executor is None and QUERY_WORKERS > 0:
+        with _query_executor_lock:
+            if _query_executor is None:
+                _query_executor = QueryExecutor(QUERY_WORKERS)
+    return _query_executor
+
+
+def start_query_executor(workers, max_pending=None, timeout=QUERY_TIMEOUT_SECONDS, preload=()):
+    """
+    Start the process-wide query executor, replacing a running one.
+    :param workers: number of worker processes
+    :param max_pending: queries waiting for a worker before further queries are turned away
+    :param timeout: seconds a query may take
+    :param preload: endpoints every worker loads at start
+    :return: QueryExecutor
+    """
+    global _query_executor
+    with _query_executor_lock:
+        if _query_executor is not None:
+            _query_executor.close()
+        _query_executor = QueryExecutor(workers, max_pending, timeout, preload)
+    return _query_executor
+
+
+def _execute_prepared_query(prepared, endpoint, query_text, is_template, bindings):
+    executor = get_query_executor()
+    if executor is None or prepared.price_query is not None:
+        # the price index answers in a few vectorized steps; not worth a round trip
+        return prepared.execute(endpoint, bindings)
+    return executor.run(endpoint, query_text, is_template, bindings)
+
+
+class QueryExecutor:
+    """
+    A pool of worker processes evaluating sparql queries.
+
+    Every worker runs one query at a time.  At most max_pending queries wait
+    for a worker; beyond that run raises QueryExecutorBusy at once, so load
+    is shed instead of piling up.  A query that takes longer than its
+    timeout has its worker killed and replaced.
+    """
+    # what the workers do, and the function of this module they run
+    task = 'query'
+    worker_function = 'serve_query_worker'
+
+    def __init__(self, workers, max_pending=None, timeout=QUERY_TIMEOUT_SECONDS, preload=()):
+        """
+        :param workers: number of worker processes
+        :param max_pending: queries waiting for a worker, defaults to QUERY_MAX_PENDING
+        :param timeout: seconds a query may take, including its wait for a worker
+        :param preload: endpoints every worker loads at start
+        """
+        self.workers = workers
+        self.max_pending = QUERY_MAX_PENDING if max_pending is None else max_pending
+        self.timeout = timeout
+        self.preload = list(preload)
+        self._slots = threading.BoundedSemaphore(workers + self.max_pending)
+        self._idle = queue.Queue()
+        self._processes = set()
+        # workers that died and could not be replaced yet
+        self._missing = 0
+        self._missing_lock = threading.Lock()
+        self._closed = False
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+        atexit.register(self.close)
+
+    @instrumented('ont.QueryExecutor.run', size=len)
+    def run(self, endpoint, query_text, is_template=False, bindings=None, timeout=None):
+        """
+        Evaluate a query on a worker process.
+        :param endpoint: ontology endpoint
+        :param query_text: sparql query, or template with <<name: type>> tags
+        :param is_template: whether query_text is a template
+        :param bindings: initBindings of the template variables
+        :param timeout: seconds the query may take, defaults to the executor's timeout
+        :return: QueryResult
+        """
+        return self._submit((endpoint, query_text, is_template, bindings or {}), timeout)
+
+    def close(self):
+        """
+        Stop every worker process.
+        :return: None
+        """
+        self._closed = True
+        for worker in list(self._processes):
+            self._kill(worker)
+
+    def _submit(self, message, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        if self._closed:
+            raise RuntimeError(f'{self.task} executor is closed')
+        if not self._slots.acquire(blocking=False):
+            raise QueryExecutorBusy(f'{self.workers} {self.task} workers busy and {self.max_pending} waiting')
+        try:
+            self._respawn()
+            try:
+                worker = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f'no {self.task} worker became free within {timeout} s') from None
+            try:
+                status, payload = self._call(worker, message, deadline, timeout)
+            except BaseException:
+                # the worker is killed mid-query or died; replace it
+                self._kill(worker)
+                with self._missing_lock:
+                    self._missing += 1
+                try:
+                    self._respawn()
+                except Exception:
+                    # the query's own error is the one to report
+                    pass
+                raise
+            self._idle.put(worker)
+        finally:
+            self._slots.release()
+        if status == 'error':
+            raise payload
+        return payload
+
+    def _respawn(self):
+        # a worker that cannot be started is tried again by the next query,
+        # which only fails for it once no worker is left
+        with self._missing_lock:
+            while self._missing and not self._closed:
+                try:
+                    worker = self._spawn()
+                except Exception:
+                    if self._processes:
+                        return
+                    raise
+                self._idle.put(worker)
+                self._missing -= 1
+
+    def _call(self, worker, message, deadline, timeout):
+        process, connection = worker
+        try:
+            connection.send(message)
+            finished = connection.poll(max(0.0, deadline - time.monotonic()))
+            reply = connection.recv() if finished else None
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f'{self.task} worker exited with code {process.poll()}') from e
+        if not finished:
+            raise TimeoutError(f'{self.task} did not finish within {timeout} s')
+        return reply
+
+    def _spawn(self):
+        parent, child = socket.socketpair()
+        env = dict(os.environ, QUERY_WORKERS='0')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (root, env.get('PYTHONPATH')) if p)
+        process = subprocess.Popen(
+            [sys.executable, '-c', f'import sys; from utilities.ont import {self.worker_function}; '
+                                   f'{self.worker_function}(int(sys.argv[1]), sys.argv[2:])',
+             str(child.fileno())] + self.preload,
+            pass_fds=(child.fileno(),), env=env,
+        )
+        child.close()
+        worker = (process, Connection(parent.detach()))
+        self._processes.add(worker)
+        return worker
+
+    def _kill(self, worker):
+        process, connection = worker
+        self._processes.discard(worker)
+        connection.close()
+        process.kill()
+        process.wait()
+
+
+def serve_query_worker(fd, preload=()):
+    """
+    Evaluate the queries a QueryExecutor sends over a socket until it closes.
+    :param fd: file descriptor of the socket
+    :param preload: endpoints to load before the first query
+    :return: None
+    """
+    connection = Connection(fd)
+    for endpoint in preload:
+        build_ontology_as_rdflib_graph(endpoint)
+    while True:
+        try:
+            endpoint, query_text, is_template, bindings = connection.recv()
+        except EOFError:
+            return
+        try:
+            reply = ('ok', get_prepared_query(endpoint, query_text, is_template).execute(endpoint, bindings))
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # the error itself could not be pickled
+            connection.send(('error', RuntimeError(f'{type(e).__name__}: {e}')))
+
+
+class LayoutExecutor(QueryExecutor):
+    """
+    A pool of worker processes computing View tab layouts with networkx, so
+    large ontologies do not hold the GIL of the web process.
+    """
+    task = 'layout'
+    worker_function = 'serve_layout_worker'
+
+    def __init__(self, workers, max_pending=None, timeout=LAYOUT_TIMEOUT_SECONDS, preload=()):
+        super().__init__(workers, max_pending, timeout, preload)
+
+    @instrumented('ont.LayoutExecutor.run', size=len)
+    def run(self, endpoint, name, projection=DEFAULT_PROJECTION, predicates=None, version=None, timeout=None):
+        """
+        Compute a layout on a worker process.
+        :param endpoint: ontology endpoint
+        :param name: layout name, one of utilities.layouts.LAYOUTS
+        :param projection: what to draw, one of utilities.projection.PROJECTIONS
+        :param predicates: predicate uris to keep, or None for all
+        :param version: ontology version the layout is for, as get_ontology_version, or None for any
+        :param timeout: seconds the layout may take, defaults to the executor's timeout
+        :return: dictionary of cytoscape node id to position
+        :raises OntologyVersionChanged: when the worker finds another version of the ontology
+        """
+        return self._submit((endpoint, name, projection, predicates, version), timeout)
+
+
+_layout_executor = None
+_layout_executor_lock = threading.Lock()
+
+
+def get_layout_executor():
+    """
+    Return the process-wide layout executor, started on first use when
+    LAYOUT_WORKERS is set.
+    :return: LayoutExecutor or None
+    """
+    global _layout_executor
+    if _layout_executor is None and LAYOUT_WORKERS > 0:
+        with _layout_executor_lock:
+            if _layout_executor is None:
+                _layout_executor = LayoutExecutor(LAYOUT_WORKERS)
+    return _layout_executor
+
+
+def serve_layout_worker(fd, preload=()):
+    """
+    Compute the layouts a LayoutExecutor sends over a socket until it closes.
+    :param fd: file descriptor of the socket
+    :param preload: endpoints to load before the first layout
+    :return: None
+    """
+    connection = Connection(fd)
+    for endpoint in preload:
+        build_ontology_as_rdflib_graph(endpoint)
+    while True:
+        try:
+            endpoint, name, projection, predicates, version = connection.recv()
+        except EOFError:
+            return
+        try:
+            reply = ('ok', build_cytoscape_layout(endpoint, name, projection, predicates, version))
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            connection.send(('error', RuntimeError(f'{type(e).__name__}: {e}')))
+
+
+class PreparedQuery:
+    """
+    A sparql query, or a template whose tags become query variables, compiled
+    with prepareQuery.  Queries joining ticker date/price pairs over a date
+    range are answered from the ontology's price index instead of the sparql
+    evaluator.
+    """
+
+    def __init__(self, query_text, namespaces, is_template=False):
+        """
+        :param query_text: sparql query, or template with <<name: type>> tags
+        :param namespaces: prefixes the query may use without declaring them
+        :param is_template: whether query_text is a template
+        """
+        self.text = query_text
+        self.template = get_query_template(query_text) if is_template else None
+        self.query = None
+        self.price_query = None
+
+        variable_text = self.template.variable_text() if is_template else query_text
+        if variable_text is not None:
+            self.query = prepareQuery(variable_text, initNs=namespaces)
+            self.price_query = match_price_query(self.query)
+
+    def bindings(self, parameters):
+        """
+        Return the initBindings of a set of template parameters.
+        :param parameters: dictionary of tag type to value
+        :return: dictionary of variable name to Literal
+        """
+        return self.template.bindings(parameters) if self.template is not None else {}
+
+    @instrumented('ont.PreparedQuery.execute', size=len)
+    def execute(self, endpoint, bindings=None):
+        """
+        Run the query against an ontology.
+        :param endpoint: ontology endpoint
+        :param bindings: initBindings of the template variables
+        :return: QueryResult
+        """
+        if self.price_query is not None:
+            return QueryResult(self.price_query.evaluate(get_price_index(endpoint), bindings))
+
+        rows, variables = self._evaluate(endpoint, bindings)
+        return QueryResult(bindings_to_dataframe(rows, variables))
+
+    def iter_chunks(self, endpoint, bindings=None, chunk_size=None):
+        """
+        Run the query against an ontology, yielding the result in chunks as
+        the sparql evaluator produces rows.
+        :param endpoint: ontology endpoint
+        :param bindings: initBindings of the template variables
+        :param chunk_size: rows per chunk, defaults to QUERY_CHUNK_ROWS
+        :return: generator of typed DataFrames of at most chunk_size rows
+        """
+        chunk_size = chunk_size or QUERY_CHUNK_ROWS
+        if self.price_query is not None:
+            # the price index answers in one vectorized step; only the slicing is chunked
+            dataframe = self.price_query.evaluate(get_price_index(endpoint), bindings)
+            for start in range(0, len(dataframe), chunk_size):
+                yield dataframe.iloc[start:start + chunk_size].reset_index(drop=True)
+            return
+
+        rows, variables = self._evaluate(endpoint, bindings)
+        rows = (row for row in rows if row)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield bindings_to_dataframe(chunk, variables)
+
+    def _evaluate(self, endpoint, bindings):
+        # evalQuery hands out the solution generator, which rdflib's Result would buffer
+        g = build_ontology_as_rdflib_graph(endpoint)
+        query = self.query if self.query is not None else prepareQuery(self.text)
+        result = evalQuery(g, query, bindings)
+        if result.get('type_') != 'SELECT':
+            raise ValueError('only SELECT queries can be shown as a table')
+        return result['bindings'], result['vars_']
+
+
+class QueryResult:
+    """
+    A query result held as one typed DataFrame.  The json records and column
+    specifications of the results table are derived from it when first used.
+    For callers of the former tuple interface the result still unpacks as
+    records, column specifications and DataFrame.
+    """
+
+    def __init__(self, dataframe):
+        """
+        :param dataframe: typed query result
+        """
+        self.dataframe = dataframe
+        self._records = None
+
+    @property
+    def columns(self):
+        return [{'name': c, 'id': c} for c in self.dataframe.columns]
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = dataframe_to_records(self.dataframe)
+        return self._records
+
+    def __len__(self):
+        return len(self.dataframe)
+
+    def __iter__(self):
+        yield self.records
+        yield self.columns
+        yield self.dataframe
+
+    def __getstate__(self):
+        # records are cheap to derive again and would double the cached size
+        return {'dataframe': self.dataframe}
+
+    def __setstate__(self, state):
+        self.__init__(state['dataframe'])
+
+
+def bindings_to_dataframe(rows, variables):
+    """
+    Convert sparql result rows to a DataFrame in a single pass.
+    Columns of xsd:date literals become datetime64, columns of numeric
+    literals float64 (int64 when every value is an integer), and any other
+    column holds the python values of its terms.
+    :param rows: iterable of mappings of variable to term
+    :param variables: projected variables
+    :return: DataFrame with one column per variable
+    """
+    cells = [[] for _ in variables]
+    # sparql evaluation is lazy: the solutions are computed as the rows are read
+    with span('ont.sparql_rows') as s:
+        for row in rows:
+            if not row:
+                # rdflib does not report rows without any bound variable either
+                continue
+            for column, variable in zip(cells, variables):
+                column.append(row.get(variable))
+        s.set(size=len(cells[0]) if cells else 0)
+    with span('ont.typed_columns'):
+        return pd.DataFrame({str(v): _typed_column(c) for v, c in zip(variables, cells)},
+                            columns=[str(v) for v in variables])
+
+
+def _typed_column(terms):
+    datatypes = set()
+    for term in terms:
+        if term is None:
+            continue
+        if not isinstance(term, Literal):
+            datatypes = None
+            break
+        datatypes.add(term.datatype)
+
+    if datatypes and datatypes <= {XSD.date}:
+        try:
+            # parsed like the price index parses dates, so both give the same dtype
+            return pd.to_datetime(np.array(['NaT' if t is None else str(t) for t in terms],
+                                           dtype='datetime64[D]')).to_numpy()
+        except ValueError:
+            # dates with a time zone; fall back to python dates
+            pass
+    elif datatypes and datatypes <= NUMERIC_DATATYPES:
+        lexical = pd.Series([None if t is None else str(t) for t in terms], dtype=object)
+        # ill-typed literals, e.g. an empty xsd:decimal, become NaN
+        values = pd.to_numeric(lexical, errors='coerce')
+        if values.dtype == object:
+            values = values.astype(np.float64)
+        return values.to_numpy()
+
+    return pd.Series([None if t is None else t.toPython() for t in terms], dtype=object).to_numpy()
+
+
+def dataframe_to_records(dataframe):
+    """
+    Return the rows of a typed query result as json-friendly records.
+    Dates become ISO strings and missing values None.
+    :param dataframe: query result
+    :return: list of dictionaries
+    """
+    df = dataframe.copy()
+    for c in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[c]):
+            df[c] = df[c].dt.strftime('%Y-%m-%d')
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
+
+
+@instrumented('ont.get_price_index')
+def get_price_index(endpoint, fmt='application/rdf+xml'):
+    """
+    Return the columnar ticker price index of an ontology.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :return: price index
+    """
+    key = _graph_key(endpoint, fmt)
+    index = _price_index_cache.get(key)
+    if index is None:
+        index = _build_price_index(key, build_ontology_as_rdflib_graph(endpoint, fmt))
+    return index
+
+
+def _build_price_index(key, g):
+    index = build_price_index(g)
+    _price_index_cache.discard_if(lambda k: k[:2] == key[:2])
+    _price_index_cache.put(key, index, cost=index.nbytes)
+    return index
+
+
+def build_html_visualizer(endpoint):
+    """
+    Open a browser view of an ontology.
+    :param endpoint: ontology endpoint
+    :return: None
+    """
+    g = ontospy.Ontospy(endpoint)
+    v = HTMLVisualizer(g)
+    v.build()
+    v.preview()
+
+
+def get_ontology_version(endpoint):
+    """
+    Return a version tag of an ontology which changes whenever its file changes.
+    :param endpoint: ontology endpoint
+    :return: version as a string, or None when the endpoint is not a local file
+    """
+    try:
+        st = os.stat(endpoint)
+    except (OSError, TypeError, ValueError):
+        return None
+    return f'{st.st_mtime_ns}-{st.st_size}'
+
+
+def get_graph_cache_stats():
+    """
+    Return hit/miss/eviction counters of the parsed ontology cache.
+    :return: dictionary of counters
+    """
+    return _graph_cache.stats()
+
+
+def clear_graph_cache():
+    """
+    Drop every parsed ontology and everything derived from it.
+    :return: None
+    """
+    _graph_cache.clear()
+    _price_index_cache.clear()
+    _cytoscape_cache.clear()
+    _cytoscape_layout_cache.clear()
+    _predicate_cache.clear()
+    _indicator_series_cache.clear()
+
+
+def get_snapshot_path(endpoint):
+    """
+    Return the path of the binary snapshot kept next to an ontology file.
+    :param endpoint: ontology endpoint
+    :return: snapshot path
+    """
+    return f'{endpoint}{SNAPSHOT_SUFFIX}'
+
+
+@instrumented('ont.load_ontology_snapshot')
+def load_ontology_snapshot(endpoint, fmt='application/rdf+xml'):
+    """
+    Return a memory-mapped graph of an ontology, (re)writing its snapshot when
+    it is missing or older than the ontology file.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :return: rdf graph, or None when the endpoint is not a local file
+    """
+    version = get_ontology_version(endpoint)
+    if version is None:
+        return None
+
+    snapshot_path = get_snapshot_path(endpoint)
+    try:
+        metadata = read_snapshot_header(snapshot_path)['metadata']
+        if metadata.get('source_version') == version and metadata.get('format') == fmt:
+            return load_snapshot(snapshot_path)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    g = Graph()
+    with span('ont.parse', endpoint=endpoint) as s:
+        g.parse(endpoint, format=fmt)
+        s.set(size=len(g))
+    try:
+        with span('ont.write_snapshot'):
+            write_snapshot(g, snapshot_path, metadata={'source_version': version, 'format': fmt})
+    except OSError:
+        # read-only data directory: serve the parsed graph instead
+        return g
+    return load_snapshot(snapshot_path)
+
+
+@instrumented('ont.build_ontology_as_rdflib_graph', size=len)
+def build_ontology_as_rdflib_graph(endpoint, fmt='application/rdf+xml'):
+    """
+    Return a rdf graph of an ontology.
+    The graph is cached and shared, so callers must not modify it.
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :return: rdf graph
+    """
+    key = _graph_key(endpoint, fmt)
+    g = _graph_cache.get(key)
+    if g is not None:
+        return g
+
+    with _graph_load_lock:
+        # another thread may have loaded it while we were waiting
+        if key in _graph_cache:
+            return _graph_cache.get(key)
+        g = load_ontology_snapshot(endpoint, fmt)
+        if g is None:
+            g = Graph()
+            g.parse(endpoint, format=fmt)
+        # older versions of this endpoint can never be hit again
+        _graph_cache.discard_if(lambda k: k[0] == endpoint and k[1] == fmt)
+        _graph_cache.put(key, g, cost=getattr(g.store, 'nbytes', len(g) * GRAPH_BYTES_PER_TRIPLE))
+        _build_price_index(key, g)
+    return g
+
+
+def _graph_key(endpoint, fmt):
+    return endpoint, fmt, get_ontology_version(endpoint)
+
+
+def build_ontology_as_networkx(endpoint, fmt='application/rdf+xml'):
+    """
+    Return a networkx graph from an ontology,
+    :param endpoint: ontology endpoint
+    :param fmt: ontology format
+    :return: networkx graph
+    """
+    g = build_ontology_as_rdflib_graph(endpoint, fmt)
+    g = rdflib_to_networkx_graph(g)
+    return g
+
+
+@instrumented('ont.get_cytoscape_elements', size=len)
+def get_cytoscape_elements(endpoint, projection=DEFAULT_PROJECTION, predicates=None):
+    """
+    Return a javascript-based cytoscape of a rdf ontology which requires nodes and edges.
+    The elements are built once per ontology version and projection and shared, so callers must not modify them.
+    :param endpoint: ontology endpoint
+    :param projection: what to draw, one of utilities.projection.PROJECTIONS
+    :param predicates: predicate uris to keep, or None for all
+    :return: list of dictionaries specifying nodes and edges
+    """
+    key = _graph_key(endpoint, 'application/rdf+xml') + (projection, _predicates_key(predicates))
+    elements = _cytoscape_cache.get(key)
+    if elements is None:
+        elements = build_cytoscape_elements(endpoint, projection, predicates)
+        # elements of older versions can never be hit again
+        _cytoscape_cache.discard_if(lambda k: k[:2] == key[:2] and k[2] != key[2])
+        _cytoscape_cache.put(key, elements, cost=len(elements) * CYTOSCAPE_BYTES_PER_ELEMENT)
+    return elements
+
+
+@instrumented('ont.build_cytoscape_elements', size=len)
+def build_cytoscape_elements(endpoint, projection=DEFAULT_PROJECTION, predicates=None):
+    """
+    Build the cytoscape nodes and edges of a projection of a rdf ontology.
+    :param endpoint: ontology endpoint
+    :param projection: what to draw, one of utilities.projection.PROJECTIONS
+    :param predicates: predicate uris to keep, or None for all
+    :return: list of dictionaries specifying nodes and edges
+    """
+    return project_graph(build_ontology_as_rdflib_graph(endpoint), projection, predicates)
+
+
+def get_ontology_predicates(endpoint):
+    """
+    Return the predicates used in an ontology, for the View tab's predicate filter.
+    :param endpoint: ontology endpoint
+    :return: sorted list of predicate uris
+    """
+    key = _graph_key(endpoint, 'application/rdf+xml')
+    predicates = _predicate_cache.get(key)
+    if predicates is None:
+        predicates = graph_predicates(build_ontology_as_rdflib_graph(endpoint))
+        _predicate_cache.discard_if(lambda k: k[:2] == key[:2])
+        _predicate_cache.put(key, predicates)
+    return predicates
+
+
+def _predicates_key(predicates):
+    return None if predicates is None else tuple(sorted(predicates))
+
+
+@instrumented('ont.get_cytoscape_layout', size=len)
+def get_cytoscape_layout(endpoint, name, projection=DEFAULT_PROJECTION, predicates=None, retry=True):
+    """
+    Return the positions of the cytoscape nodes of a rdf ontology in a layout,
+    for a cytoscape 'preset' layout.  Layouts are computed once per ontology
+    version and projection, on the layout workers when LAYOUT_WORKERS is set,
+    and shared, so callers must not modify them.
+    :param endpoint: ontology endpoint
+    :param name: layout name, one of utilities.layouts.LAYOUTS
+    :param projection: what to draw, one of utilities.projection.PROJECTIONS
+    :param predicates: predicate uris to keep, or None for all
+    :param retry: whether to lay out the ontology again when its file changes meanwhile
+    :return: dictionary of cytoscape node id to {'x': x, 'y': y}
+    """
+    predicates = _predicates_key(predicates)
+    key = _graph_key(endpoint, 'application/rdf+xml') + (name, projection, predicates)
+    positions = _cytoscape_layout_cache.get(key)
+    if positions is None:
+        executor = get_layout_executor()
+        try:
+            if executor is None:
+                positions = build_cytoscape_layout(endpoint, name, projection, predicates, key[2])
+            else:
+                positions = executor.run(endpoint, name, projection, predicates, key[2])
+        except OntologyVersionChanged:
+            if retry:
+                # the file changed while it was laid out; lay out the new version instead
+                return get_cytoscape_layout(endpoint, name, projection, predicates, retry=False)
+            raise
+        # layouts of older versions can never be hit again
+        _cytoscape_layout_cache.discard_if(lambda k: k[:2] == key[:2] and k[2] != key[2])
+        _cytoscape_layout_cache.put(key, positions, cost=len(positions) * CYTOSCAPE_BYTES_PER_POSITION)
+    return positions
+
+
+@instrumented('ont.build_cytoscape_layout', size=len)
+def build_cytoscape_layout(endpoint, name, projection=DEFAULT_PROJECTION, predicates=None, version=None):
+    """
+    Compute the positions of the cytoscape nodes of a rdf ontology in a layout.
+    :param endpoint: ontology endpoint
+    :param name: layout name, one of utilities.layouts.LAYOUTS
+    :param projection: what to draw, one of utilities.projection.PROJECTIONS
+    :param predicates: predicate uris to keep, or None for all
+    :param version: ontology version the layout is for, as get_ontology_version, or None for any
+    :return: dictionary of cytoscape node id to {'x': x, 'y': y}
+    :raises OntologyVersionChanged: when the ontology is not, or no longer, at version
+    """
+    _check_ontology_version(endpoint, version)
+    elements = get_cytoscape_elements(endpoint, projection, predicates)
+    positions = compute_layout(elements_to_networkx(elements), name)
+    # the elements are those of the version seen before, unless the file changed meanwhile
+    _check_ontology_version(endpoint, version)
+    return positions
+
+
+def _check_ontology_version(endpoint, version):
+    if version is not None and get_ontology_version(endpoint) != version:
+        raise OntologyVersionChanged(f'{endpoint} is no longer at version {version}')
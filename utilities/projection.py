@@ -0,0 +1,123 @@
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import OWL, RDF, RDFS
+
+# what the View tab draws of an ontology:
+#   classes      the rdfs:subClassOf hierarchy of its classes
+#   individuals  every resource, with its literal values folded into the node
+#   full         every triple as an edge, literals included
+PROJECTIONS = ('classes', 'individuals', 'full')
+DEFAULT_PROJECTION = 'classes'
+
+# types whose instances are classes
+CLASS_TYPES = (OWL.Class, RDFS.Class)
+
+
+def project_graph(g, projection=DEFAULT_PROJECTION, predicates=None):
+    """
+    Build the cytoscape nodes and edges of a projection of a rdf graph
+    straight from its triple indexes.
+    :param g: rdf graph
+    :param projection: one of PROJECTIONS
+    :param predicates: predicate uris to keep, or None for all; ignored by 'classes'
+    :return: list of dictionaries specifying nodes and edges
+    """
+    if projection == 'classes':
+        nodes, edges = _class_hierarchy(g)
+    elif projection == 'individuals':
+        nodes, edges = _individuals(g, predicates)
+    elif projection == 'full':
+        nodes, edges = _full(g, predicates)
+    else:
+        raise ValueError(f'unknown projection: {projection}')
+    return list(nodes.values()) + edges
+
+
+def graph_predicates(g):
+    """
+    Return the predicates used in a rdf graph.
+    :param g: rdf graph
+    :return: sorted list of predicate uris as strings
+    """
+    return sorted({str(p) for p in g.predicates(unique=True)})
+
+
+def local_name(term):
+    """
+    Return the part of a uri after its last '#' or '/', or a literal's value.
+    :param term: rdf term
+    :return: string
+    """
+    text = str(term)
+    if isinstance(term, URIRef):
+        text = text.rstrip('/#')
+        text = text[max(text.rfind('#'), text.rfind('/')) + 1:] or text
+    return text
+
+
+def _class_hierarchy(g):
+    nodes, edges = {}, []
+    for cls_type in CLASS_TYPES:
+        for cls in g.subjects(RDF.type, cls_type):
+            _add_node(nodes, cls)
+    for child, _, parent in g.triples((None, RDFS.subClassOf, None)):
+        # restrictions are blank nodes; only named classes make a hierarchy
+        if isinstance(parent, BNode) or isinstance(child, BNode):
+            continue
+        _add_node(nodes, child)
+        _add_node(nodes, parent)
+        edges.append(_edge(child, 'subClassOf', parent))
+    return nodes, edges
+
+
+def _individuals(g, predicates):
+    nodes, edges, names = {}, [], {}
+    for s, p, o in _triples(g, predicates):
+        node = _add_node(nodes, s)
+        # a handful of predicates label a great many triples
+        name = names.get(p)
+        if name is None:
+            name = names[p] = local_name(p)
+        if isinstance(o, Literal):
+            literals = node['data'].setdefault('literals', {})
+            if name not in literals:
+                literals[name] = str(o)
+            elif isinstance(literals[name], list):
+                literals[name].append(str(o))
+            else:
+                literals[name] = [literals[name], str(o)]
+        else:
+            _add_node(nodes, o)
+            edges.append(_edge(s, name, o))
+    return nodes, edges
+
+
+def _full(g, predicates):
+    nodes, edges, names = {}, [], {}
+    for s, p, o in _triples(g, predicates):
+        name = names.get(p)
+        if name is None:
+            name = names[p] = local_name(p)
+        _add_node(nodes, s)
+        _add_node(nodes, o)
+        edges.append(_edge(s, name, o))
+    return nodes, edges
+
+
+def _triples(g, predicates):
+    if predicates is None:
+        yield from g.triples((None, None, None))
+        return
+    for p in predicates:
+        yield from g.triples((None, URIRef(p), None))
+
+
+def _add_node(nodes, term):
+    key = str(term)
+    node = nodes.get(key)
+    if node is None:
+        node = nodes[key] = {'data': {'id': key, 'label': local_name(term)}}
+    return node
+
+
+def _edge(s, label, o):
+    return {'data': {'source': str(s), 'target': str(o), 'label': label}}
@@ -0,0 +1,273 @@
+import math
+import os
+import uuid
+
+import pandas as pd
+
+from utilities.cache import DiskCache, LRUCache
+from utilities.ont import dataframe_to_records, get_ontology_version, iter_sparql_template_results
+
+# queries of stored results kept to compute an evicted result again
+QUERY_STORE_ENTRIES = 4096
+
+# operators understood by the DataTable filter syntax, longest spellings first
+FILTER_OPERATORS = [
+    ['ge ', '>='],
+    ['le ', '<='],
+    ['lt ', '<'],
+    ['gt ', '>'],
+    ['ne ', '!='],
+    ['eq ', '='],
+    ['contains '],
+    ['datestartswith '],
+]
+
+
+class ResultStore:
+    """
+    Server-side store of query results, so only the visible page of a result
+    has to be sent to the browser.
+
+    Results are kept in process memory and, when a directory is given, also
+    on local disk so every worker process can serve pages of any result.
+    """
+
+    def __init__(self, budget, directory=None, ttl=None):
+        """
+        :param budget: memory (and disk) budget of the stored results in bytes
+        :param directory: directory shared by the worker processes, or None
+        :param ttl: time-to-live of results on disk in seconds
+        """
+        self._cache = LRUCache(budget, name='results')
+        self._shared = None if directory is None else DiskCache(directory, budget, ttl=ttl, name='shared_results')
+        # the queries of the results are small, so they outlive results evicted for their size
+        self._queries = LRUCache(QUERY_STORE_ENTRIES, name='result_queries')
+        self._shared_queries = None if directory is None else DiskCache(
+            os.path.join(directory, 'queries'), QUERY_STORE_ENTRIES * 4096, ttl=ttl, name='shared_result_queries')
+
+    def put(self, dataframe, query=None):
+        """
+        Store a query result.
+        :param dataframe: query result
+        :param query: tuple of the endpoint, ontology version, template and
+                      parameters of the result, so it can be queried again
+                      once the result itself is evicted
+        :return: id of the stored result
+        """
+        result_id = uuid.uuid4().hex
+        self._cache.put(result_id, dataframe, cost=int(dataframe.memory_usage(deep=True).sum()))
+        if self._shared is not None:
+            self._shared.put(result_id, dataframe)
+        if query is not None:
+            self._queries.put(result_id, query)
+            if self._shared_queries is not None:
+                self._shared_queries.put(result_id, query)
+        return result_id
+
+    def get(self, result_id):
+        """
+        Return a stored query result.
+        :param result_id: id returned by put
+        :return: DataFrame, or None when the result is unknown or was evicted
+        """
+        dataframe = self._cache.get(result_id)
+        if dataframe is None and self._shared is not None:
+            # stored by another worker
+            dataframe = self._shared.get(result_id)
+            if dataframe is not None:
+                self._cache.put(result_id, dataframe, cost=int(dataframe.memory_usage(deep=True).sum()))
+        return dataframe
+
+    def query(self, result_id):
+        """
+        Return the query a stored result was computed by.
+        :param result_id: id returned by put
+        :return: tuple of endpoint, ontology version, template and parameters,
+                 or None when the result was stored without its query or expired
+        """
+        query = self._queries.get(result_id)
+        if query is None and self._shared_queries is not None:
+            query = self._shared_queries.get(result_id)
+            if query is not None:
+                self._queries.put(result_id, query)
+        return query
+
+    def stats(self):
+        """
+        Return hit/miss/eviction counters of the store.
+        :return: dictionary of counters
+        """
+        return self._cache.stats()
+
+
+def get_results_page(dataframe, page_current, page_size, sort_by=None, filter_query=''):
+    """
+    Return one page of a query result after filtering and sorting it.
+    :param dataframe: query result
+    :param page_current: zero-based page number
+    :param page_size: rows per page
+    :param sort_by: DataTable sort_by property
+    :param filter_query: DataTable filter_query property
+    :return: tuple of the page records and the number of pages
+    """
+    df = filter_dataframe(dataframe, filter_query)
+    df = sort_dataframe(df, sort_by)
+    page_count = max(1, math.ceil(len(df) / page_size))
+    start = page_current * page_size
+    return dataframe_to_records(df.iloc[start:start + page_size]), page_count
+
+
+def sort_dataframe(dataframe, sort_by):
+    """
+    Sort a query result as requested by a DataTable.
+    :param dataframe: query result
+    :param sort_by: list of {'column_id', 'direction'} dictionaries
+    :return: sorted DataFrame
+    """
+    sort_by = [s for s in sort_by or [] if s['column_id'] in dataframe.columns]
+    if not sort_by:
+        return dataframe
+    return dataframe.sort_values(
+        [s['column_id'] for s in sort_by],
+        ascending=[s['direction'] == 'asc' for s in sort_by],
+        kind='stable',
+    )
+
+
+def filter_dataframe(dataframe, filter_query):
+    """
+    Filter a query result with a DataTable filter expression.
+    :param dataframe: query result
+    :param filter_query: expressions such as '{price} > 100' joined by ' && '
+    :return: filtered DataFrame
+    """
+    df = dataframe
+    for filter_part in (filter_query or '').split(' && '):
+        column, operator, value, text = _split_filter_part(filter_part)
+        if column not in df.columns:
+            continue
+        series = df[column]
+        if operator == 'contains':
+            # as typed: 16 must match '16' in a float column shown as 16, not '16.0'
+            mask = series.astype(str).str.contains(text, regex=False)
+        elif operator == 'datestartswith':
+            mask = series.astype(str).str.startswith(text)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            try:
+                value = pd.Timestamp(text)
+            except ValueError:
+                # not a date (yet, while the user types); ignore this part
+                continue
+            if pd.isna(value):
+                continue
+            mask = _compare(series, operator, value)
+        else:
+            mask = _compare(series, operator, value)
+        df = df.loc[mask]
+    return df
+
+
+def _compare(series, operator, value):
+    try:
+        if operator in ('eq', 'ne') and pd.api.types.is_object_dtype(series) and isinstance(value, str):
+            mask = series.astype(str) == value
+        else:
+            mask = getattr(series, operator)(value)
+    except TypeError:
+        mask = getattr(series.astype(str), operator)(str(value))
+    return mask.fillna(False).astype(bool)
+
+
+def split_filter_part(filter_part):
+    """
+    Split one DataTable filter expression into its column, operator and value.
+    :param filter_part: e.g. '{price} > 100'
+    :return: tuple of column, pandas comparison name and value, or Nones
+    """
+    return _split_filter_part(filter_part)[:3]
+
+
+def _split_filter_part(filter_part):
+    # as split_filter_part, plus the value as typed, unquoted but not converted to a number
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[:1]
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = text = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    text = value_part
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value, text
+
+    return None, None, None, None
+
+
+def iter_dataframe_chunks(dataframe, chunk_size):
+    """
+    Split a query result into consecutive chunks.
+    :param dataframe: query result
+    :param chunk_size: rows per chunk
+    :return: generator of DataFrames
+    """
+    for start in range(0, len(dataframe), chunk_size):
+        yield dataframe.iloc[start:start + chunk_size]
+
+
+def get_result_chunks(store, result_id, chunk_size, sort_by=None, filter_query=''):
+    """
+    Return a stored query result in chunks after filtering and sorting it.
+    A result evicted from the store is queried again with its stored query
+    and streamed from the sparql evaluator, so only a sorted download holds
+    the whole result in memory.
+    :param store: ResultStore
+    :param result_id: id returned by put
+    :param chunk_size: rows per chunk
+    :param sort_by: DataTable sort_by property
+    :param filter_query: DataTable filter_query property
+    :return: iterable of DataFrames, or None when the result is unknown or its ontology changed since
+    """
+    dataframe = store.get(result_id)
+    if dataframe is not None:
+        dataframe = sort_dataframe(filter_dataframe(dataframe, filter_query), sort_by)
+        return iter_dataframe_chunks(dataframe, chunk_size)
+
+    query = store.query(result_id)
+    if query is None:
+        return None
+    endpoint, version, template_text, parameters = query
+    if get_ontology_version(endpoint) != version:
+        return None
+    chunks = iter_sparql_template_results(endpoint, template_text, parameters, chunk_size)
+    if filter_query:
+        # the filter compares row by row, so it applies to every chunk on its own;
+        # chunks without a row left are dropped, like the rows of a stored result are chunked
+        chunks = (chunk for chunk in (filter_dataframe(c, filter_query) for c in chunks) if len(chunk))
+    if sort_by:
+        chunks = list(chunks)
+        if chunks:
+            chunks = iter_dataframe_chunks(sort_dataframe(pd.concat(chunks, ignore_index=True), sort_by), chunk_size)
+    return chunks
+
+
+def iter_csv(chunks):
+    """
+    Write query result chunks as csv text, one piece per chunk, so a result
+    can be streamed without building the whole file in memory.
+    :param chunks: iterable of DataFrames with the same columns
+    :return: generator of csv text
+    """
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header)
+        header = False
@@ -0,0 +1,295 @@
+import json
+import mmap
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.plugins.stores.memory import SimpleMemory
+from rdflib.store import Store
+
+
+def serialize(graph, filename):
+    """
+    Serialize a graph to a file via pickle.
+    :param graph: graph
+    :param filename: filename
+    :return: None
+    """
+    output_file = open(filename, 'wb')
+    pickle.dump(graph, output_file)
+    output_file.close()
+
+
+def deserialize(filename):
+    """
+    Deserialize a file to a graph via pickle.
+    :param filename: filename
+    :return: graph
+    """
+    input_file = open(filename, 'rb')
+    graph = pickle.load(input_file)
+    input_file.close()
+    return graph
+
+
+# --------------------------------------------------
+# binary snapshots
+#
+# A snapshot is a single file laid out as
+#
+#   magic | header length (uint64) | json header | aligned sections
+#
+# The header describes every section by offset, dtype and length.  Terms are
+# dictionary-encoded: their byte keys are stored sorted in one blob, and a term
+# id is its position in that order.  Triples are stored three times as integer
+# columns sorted by (s, p, o), (p, o, s) and (o, s, p) so that every triple
+# pattern is answered by binary search.  All sections are read straight out of
+# a read-only memory map, so processes loading the same snapshot share pages.
+#
+SNAPSHOT_MAGIC = b'ONTSNAP1'
+SNAPSHOT_VERSION = 1
+_ALIGNMENT = 8
+_INDEXES = {
+    'spo': (0, 1, 2),
+    'pos': (1, 2, 0),
+    'osp': (2, 0, 1),
+}
+
+
+def _term_key(term):
+    """
+    Return the byte key a term is dictionary-encoded under.
+    :param term: rdflib term
+    :return: bytes
+    """
+    if isinstance(term, Literal):
+        return b'\x00'.join([
+            b'L' + str(term).encode('utf-8'),
+            (term.language or '').encode('utf-8'),
+            (term.datatype or '').encode('utf-8'),
+        ])
+    if isinstance(term, BNode):
+        return b'B' + str(term).encode('utf-8')
+    return b'U' + str(term).encode('utf-8')
+
+
+def _key_term(key):
+    """
+    Return the rdflib term a byte key encodes.
+    :param key: bytes
+    :return: rdflib term
+    """
+    kind, value = key[:1], key[1:].decode('utf-8')
+    if kind == b'U':
+        return URIRef(value)
+    if kind == b'B':
+        return BNode(value)
+    lexical, language, datatype = value.split('\x00')
+    return Literal(lexical, lang=language or None, datatype=datatype or None)
+
+
+def write_snapshot(graph, filename, metadata=None):
+    """
+    Write a graph to a memory-mappable binary snapshot.
+    The file is written to a temporary name first and renamed into place.
+    :param graph: rdf graph
+    :param filename: snapshot filename
+    :param metadata: json-serializable dictionary stored in the header
+    :return: None
+    """
+    keys = sorted({_term_key(t) for triple in graph for t in triple})
+    ids = {k: i for i, k in enumerate(keys)}
+    triples = np.array(
+        [[ids[_term_key(s)], ids[_term_key(p)], ids[_term_key(o)]] for s, p, o in graph],
+        dtype=np.uint32,
+    ).reshape(-1, 3)
+
+    sections = {
+        'term_offsets': np.cumsum([0] + [len(k) for k in keys], dtype=np.uint64),
+        'term_data': np.frombuffer(b''.join(keys), dtype=np.uint8),
+    }
+    for name, order in _INDEXES.items():
+        # np.lexsort sorts by its last key first
+        rows = triples[np.lexsort([triples[:, i] for i in reversed(order)])] if len(triples) else triples
+        for column in order:
+            sections[name + '_' + 'spo'[column]] = np.ascontiguousarray(rows[:, column])
+
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'triples': len(triples),
+        'terms': len(keys),
+        'namespaces': [[prefix, str(uri)] for prefix, uri in graph.namespaces()],
+        'metadata': metadata or {},
+        'sections': {},
+    }
+    # section offsets depend on the header length, so lay out the header twice
+    for _ in range(2):
+        offset = _align(len(SNAPSHOT_MAGIC) + 8 + len(json.dumps(header).encode('utf-8')))
+        for name, array in sections.items():
+            header['sections'][name] = [offset, array.dtype.str, len(array)]
+            offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as output_file:
+            output_file.write(SNAPSHOT_MAGIC)
+            output_file.write(np.uint64(len(header_bytes)).tobytes())
+            output_file.write(header_bytes)
+            for name, array in sections.items():
+                output_file.seek(header['sections'][name][0])
+                output_file.write(array.tobytes())
+        os.chmod(tmp_filename, 0o644)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+
+def read_snapshot_header(filename):
+    """
+    Return the header of a snapshot without mapping its sections.
+    :param filename: snapshot filename
+    :return: header as a dictionary
+    """
+    with open(filename, 'rb') as input_file:
+        if input_file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f'{filename} is not an ontology snapshot')
+        length = input_file.read(8)
+        header_length = int(np.frombuffer(length, dtype=np.uint64)[0]) if len(length) == 8 else -1
+        if not 0 <= header_length <= os.fstat(input_file.fileno()).st_size:
+            raise ValueError(f'{filename} is a truncated or corrupt ontology snapshot')
+        return json.loads(input_file.read(header_length))
+
+
+def load_snapshot(filename):
+    """
+    Return a read-only graph backed by a memory-mapped snapshot.
+    :param filename: snapshot filename
+    :return: rdf graph
+    """
+    store = SnapshotStore(filename)
+    g = Graph(store=store)
+    for prefix, uri in store.header['namespaces']:
+        g.bind(prefix, uri, override=True)
+    return g
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SnapshotStore(Store):
+    """
+    Read-only rdflib store answering triple patterns from a mapped snapshot.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self.header = read_snapshot_header(filename)
+        if self.header['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f'{filename} has unsupported snapshot version {self.header["version"]}')
+
+        with open(filename, 'rb') as input_file:
+            self._map = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.nbytes = len(self._map)
+        self._sections = {
+            name: np.frombuffer(self._map, dtype=np.dtype(dtype), count=count, offset=offset)
+            for name, (offset, dtype, count) in self.header['sections'].items()
+        }
+        self._offsets = self._sections['term_offsets']
+        self._data = self._sections['term_data']
+        self._namespaces = SimpleMemory()
+        # per-process decode caches; they only grow with the terms actually touched
+        self._terms = {}
+        self._ids = {}
+
+    def _key(self, term_id):
+        return self._data[int(self._offsets[term_id]):int(self._offsets[term_id + 1])].tobytes()
+
+    def _term(self, term_id):
+        term = self._terms.get(term_id)
+        if term is None:
+            term = self._terms[term_id] = _key_term(self._key(term_id))
+        return term
+
+    def _id(self, term):
+        term_id = self._ids.get(term)
+        if term_id is None:
+            key = _term_key(term)
+            lo, hi = 0, self.header['terms']
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._key(mid) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            term_id = lo if lo < self.header['terms'] and self._key(lo) == key else -1
+            self._ids[term] = term_id
+        return term_id
+
+    def triples(self, triple_pattern, context=None):
+        bound = {}
+        for name, term in zip('spo', triple_pattern):
+            if term is not None:
+                bound[name] = self._id(term)
+                if bound[name] < 0:
+                    return
+
+        # pick the index whose leading columns are all bound
+        for index in ('spo', 'pos', 'osp'):
+            prefix = []
+            for name in index:
+                if name not in bound:
+                    break
+                prefix.append(name)
+            if len(prefix) == len(bound):
+                break
+
+        columns = [self._sections[index + '_' + name] for name in index]
+        lo, hi = 0, self.header['triples']
+        for name, column in zip(prefix, columns):
+            window = column[lo:hi]
+            lo, hi = (lo + int(np.searchsorted(window, bound[name], side='left')),
+                      lo + int(np.searchsorted(window, bound[name], side='right')))
+
+        for row in zip(*(column[lo:hi].tolist() for column in columns)):
+            triple = dict(zip(index, (self._term(term_id) for term_id in row)))
+            yield (triple['s'], triple['p'], triple['o']), iter(())
+
+    def __len__(self, context=None):
+        return self.header['triples']
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError('snapshot stores are read only')
+
+    def addN(self, quads):
+        raise TypeError('snapshot stores are read only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('snapshot stores are read only')
+
+    def bind(self, prefix, namespace, override=True):
+        self._namespaces.bind(prefix, namespace, override=override)
+
+    def prefix(self, namespace):
+        return self._namespaces.prefix(namespace)
+
+    def namespace(self, prefix):
+        return self._namespaces.namespace(prefix)
+
+    def namespaces(self):
+        return self._namespaces.namespaces()
@@ -0,0 +1,247 @@
+import math
+import re
+
+from rdflib import Literal
+from rdflib.namespace import XSD
+
+from utilities.cache import LRUCache
+
+# template tags look like <<name: type>>; the name is the placeholder used in the query body
+TAG_PATTERN = re.compile(r'<<\s*([^:<>]+?)\s*:\s*([^<>]+?)\s*>>')
+
+# comments of a sparql query; strings and IRIs are matched only to be skipped
+_COMMENT_PATTERN = re.compile(
+    r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\''
+    r'|<[^<>"{}|^`\\\s]*>'
+    r'|(?P<comment>#[^\n]*)'
+)
+
+_DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_TICKER_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+
+# tag type -> slot type
+SLOT_TYPES = {
+    'start_date': 'date',
+    'end_date': 'date',
+    'precision': 'int',
+    'dropdown1': 'ticker',
+    'dropdown2': 'ticker',
+    'dropdown3': 'ticker',
+    'dropdown4': 'ticker',
+    'tickers': 'ticker_list',
+}
+
+# slot types substituted wherever their placeholder occurs, e.g. inside ns1:TICKER_price
+_EMBEDDED_SLOT_TYPES = {'ticker', 'ticker_list'}
+
+_templates = LRUCache(1024, name='templates')
+
+
+class Slot:
+    """
+    A typed parameter slot of a query template.
+    """
+
+    def __init__(self, name, tag_type, quote=None, datatype=None):
+        """
+        :param name: placeholder name
+        :param tag_type: tag type the value is looked up under, e.g. start_date
+        :param quote: quote character when the slot is a typed literal such as "name"^^xsd:date
+        :param datatype: datatype text of a typed literal, e.g. xsd:date
+        """
+        self.name = name
+        self.tag_type = tag_type
+        self.slot_type = SLOT_TYPES.get(tag_type)
+        self.quote = quote
+        self.datatype = datatype
+
+    @property
+    def variable(self):
+        return f'__{self.name}'
+
+    @property
+    def bindable(self):
+        """
+        Whether the slot can be bound as a literal instead of spliced into the text.
+        """
+        if not re.match(r'^\w+$', self.name):
+            return False
+        if self.slot_type == 'date':
+            return self.quote is not None and self.datatype is not None
+        return self.slot_type == 'int' and self.quote is None
+
+    def value(self, parameters):
+        """
+        Return the validated text of the slot's parameter.
+        :param parameters: dictionary of tag type to value
+        :return: text
+        """
+        value = parameters.get(self.tag_type)
+        if self.slot_type == 'date':
+            if value is None or not _DATE_PATTERN.match(str(value)[:10]):
+                raise ValueError(f'{self.tag_type} must be a date, got {value!r}')
+            return str(value)[:10]
+        if self.slot_type == 'int':
+            # precision n stands for the scale factor 10^n
+            return str(math.pow(10, int(value)))
+        if self.slot_type == 'ticker_list':
+            tickers = [value] if isinstance(value, str) else list(value or [])
+        else:
+            tickers = [value]
+        for ticker in tickers:
+            if ticker is None or not _TICKER_PATTERN.match(str(ticker)):
+                raise ValueError(f'{self.tag_type} must be a ticker, got {ticker!r}')
+        return ' '.join(str(t) for t in tickers)
+
+    def render(self, parameters):
+        """
+        Return the query text of the slot, quoted and typed like the placeholder.
+        :param parameters: dictionary of tag type to value
+        :return: text
+        """
+        value = self.value(parameters)
+        if self.quote is None:
+            return value
+        text = f'{self.quote}{value}{self.quote}'
+        return f'{text}^^{self.datatype}' if self.datatype else text
+
+    def literal(self, parameters):
+        """
+        Return the slot's parameter as an rdflib literal.
+        :param parameters: dictionary of tag type to value
+        :return: Literal
+        """
+        datatype = XSD.date if self.slot_type == 'date' else XSD.decimal
+        return Literal(self.value(parameters), datatype=datatype)
+
+
+class QueryTemplate:
+    """
+    A sparql query template tokenised into literal text segments and typed
+    parameter slots.  Templates are parsed once; rendering is a single join.
+    """
+
+    def __init__(self, text):
+        """
+        :param text: sparql query template with <<name: type>> tags
+        """
+        self.text = text
+        self.tags = TAG_PATTERN.findall(text)
+        self.segments = _tokenise(text, self.tags)
+        self.slots = list(dict.fromkeys(s for s in self.segments if isinstance(s, Slot)))
+
+    @property
+    def bindable(self):
+        """
+        Whether every slot can be bound as a literal of a prepared query.
+        """
+        return all(slot.bindable for slot in self.slots)
+
+    def render(self, parameters):
+        """
+        Return the query text with every slot filled in.
+        :param parameters: dictionary of tag type to value
+        :return: sparql query
+        """
+        # a placeholder usually occurs several times; validate and format each slot once
+        values = {slot: slot.render(parameters) for slot in self.slots}
+        return ''.join([values.get(s, s) for s in self.segments])
+
+    def variable_text(self):
+        """
+        Return the query text with every slot replaced by a query variable.
+        :return: sparql query, or None when a slot cannot be bound as a literal
+        """
+        if not self.bindable:
+            return None
+        return ''.join([s if isinstance(s, str) else '?' + s.variable for s in self.segments])
+
+    def bindings(self, parameters):
+        """
+        Return the initBindings of the query returned by variable_text.
+        :param parameters: dictionary of tag type to value
+        :return: dictionary of variable name to Literal
+        """
+        return {slot.variable: slot.literal(parameters) for slot in self.slots}
+
+
+def get_query_template(text):
+    """
+    Return the parsed template of a query text, parsing each text only once.
+    :param text: sparql query template with <<name: type>> tags
+    :return: QueryTemplate
+    """
+    template = _templates.get(text)
+    if template is None:
+        template = QueryTemplate(text)
+        _templates.put(text, template)
+    return template
+
+
+def render_query_template(text, parameters):
+    """
+    Return the query text of a template with every slot filled in.
+    :param text: sparql query template with <<name: type>> tags
+    :param parameters: dictionary of tag type to value
+    :return: sparql query
+    """
+    return get_query_template(text).render(parameters)
+
+
+def _tokenise(text, tags):
+    """
+    Split a template into text segments and slots; comments, including the
+    tag declarations themselves, are never substituted.
+    """
+    names = {name: tag_type for name, tag_type in tags if tag_type in SLOT_TYPES}
+    if not names:
+        return [text]
+
+    def alternatives(selected):
+        # longest first, and a pattern that never matches when nothing is selected
+        return '|'.join(re.escape(n) for n in sorted(selected, key=len, reverse=True)) or '(?!)'
+
+    embedded = [n for n, tag_type in names.items() if SLOT_TYPES[tag_type] in _EMBEDDED_SLOT_TYPES]
+    words = [n for n in names if n not in embedded]
+    slot_pattern = re.compile(
+        r'(?P<quote>["\'])(?P<literal>' + alternatives(names) + r')(?P=quote)'
+        r'(?:\^\^(?P<datatype>[\w-]*:[\w-]+|<[^<>\s]*>))?'
+        r'|(?P<embedded>' + alternatives(embedded) + r')'
+        r'|(?<![\w?$:])(?P<bare>' + alternatives(words) + r')(?!\w)'
+    )
+
+    segments, last, slots = [], 0, {}
+    for match in _COMMENT_PATTERN.finditer(text):
+        if match.lastgroup == 'comment':
+            segments.extend(_split_slots(text[last:match.start()], slot_pattern, names, slots))
+            segments.append(match.group(0))
+            last = match.end()
+    segments.extend(_split_slots(text[last:], slot_pattern, names, slots))
+
+    # merge neighbouring text segments so rendering joins as few pieces as possible
+    merged = []
+    for segment in segments:
+        if isinstance(segment, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += segment
+        elif segment != '':
+            merged.append(segment)
+    return merged
+
+
+def _split_slots(text, slot_pattern, names, slots):
+    # slots are shared by every occurrence of the same placeholder spelling
+    segments, last = [], 0
+    for match in slot_pattern.finditer(text):
+        segments.append(text[last:match.start()])
+        if match.group('embedded') or match.group('bare'):
+            name = match.group('embedded') or match.group('bare')
+            key = (name, None, None)
+        else:
+            name = match.group('literal')
+            key = (name, match.group('quote'), match.group('datatype'))
+        if key not in slots:
+            slots[key] = Slot(name, names[name], key[1], key[2])
+        segments.append(slots[key])
+        last = match.end()
+    segments.append(text[last:])
+    return segments
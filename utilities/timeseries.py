@@ -0,0 +1,362 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from rdflib import Literal, URIRef, Variable
+from rdflib.namespace import XSD
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.parserutils import CompValue
+
+# predicates of a ticker are named <namespace><TICKER>_date and <namespace><TICKER>_price
+DATE_SUFFIX = '_date'
+PRICE_SUFFIX = '_price'
+
+
+class PriceIndex:
+    """
+    Columnar index of the ticker date/price pairs of an ontology.
+
+    For every ticker the observations are kept as a date-sorted datetime64
+    array and a matching float64 price array, so a date range is located by
+    binary search.  A date may be observed more than once for a ticker; joins
+    across tickers keep every combination, exactly as a SPARQL join would.
+    """
+
+    def __init__(self, series):
+        """
+        :param series: dictionary of ticker predicate base uri to a (dates, prices) tuple
+        """
+        self._series = {}
+        for base, (dates, prices) in series.items():
+            order = np.argsort(dates, kind='stable')
+            self._series[base] = (np.asarray(dates, dtype='datetime64[D]')[order],
+                                  np.asarray(prices, dtype=np.float64)[order])
+        all_dates = [dates for dates, _ in self._series.values()]
+        self.dates = np.unique(np.concatenate(all_dates)) if all_dates else np.array([], dtype='datetime64[D]')
+
+    @property
+    def tickers(self):
+        return sorted(_local_name(base) for base in self._series)
+
+    @property
+    def nbytes(self):
+        return sum(d.nbytes + p.nbytes for d, p in self._series.values()) + self.dates.nbytes
+
+    def __len__(self):
+        return sum(len(d) for d, _ in self._series.values())
+
+    def series(self, base, start=None, end=None):
+        """
+        Return the observations of one ticker within an inclusive date range.
+        :param base: ticker predicate base uri, e.g. <namespace>BTC
+        :param start: first date (numpy datetime64[D]) or None
+        :param end: last date (numpy datetime64[D]) or None
+        :return: tuple of date and price arrays
+        """
+        if base not in self._series:
+            empty = np.array([], dtype='datetime64[D]')
+            return empty, np.array([], dtype=np.float64)
+        dates, prices = self._series[base]
+        lo = 0 if start is None else np.searchsorted(dates, start, side='left')
+        hi = len(dates) if end is None else np.searchsorted(dates, end, side='right')
+        return dates[lo:hi], prices[lo:hi]
+
+    def join(self, bases, start=None, end=None):
+        """
+        Return the rows where every ticker has an observation on the same date.
+        :param bases: ticker predicate base uris
+        :param start: first date (numpy datetime64[D]) or None
+        :param end: last date (numpy datetime64[D]) or None
+        :return: tuple of a date array and a list of price arrays, one per ticker
+        """
+        series = [self.series(base, start, end) for base in bases]
+        common = series[0][0]
+        for dates, _ in series[1:]:
+            common = np.intersect1d(common, dates)
+        common = np.unique(common)
+
+        # per ticker: first row and number of rows of every common date
+        starts, counts = [], []
+        for dates, _ in series:
+            lo = np.searchsorted(dates, common, side='left')
+            starts.append(lo)
+            counts.append(np.searchsorted(dates, common, side='right') - lo)
+        block = np.prod(counts, axis=0) if counts else np.zeros(0, dtype=np.int64)
+
+        # expand each date into the cross product of its duplicate observations
+        row_date = np.repeat(np.arange(len(common)), block)
+        offset = np.arange(len(row_date)) - np.repeat(np.cumsum(block) - block, block)
+        columns = []
+        stride = np.ones(len(common), dtype=np.int64)
+        for (dates, prices), lo, count in reversed(list(zip(series, starts, counts))):
+            position = (offset // stride[row_date]) % count[row_date]
+            columns.append(prices[lo[row_date] + position])
+            stride = stride * count
+        return common[row_date], columns[::-1]
+
+
+def build_price_index(g):
+    """
+    Return a price index of every <TICKER>_date/<TICKER>_price predicate pair of a graph.
+    :param g: rdf graph
+    :return: price index
+    """
+    predicates = set(g.predicates())
+    series = {}
+    for predicate in predicates:
+        if not str(predicate).endswith(DATE_SUFFIX):
+            continue
+        base = str(predicate)[:-len(DATE_SUFFIX)]
+        price_predicate = URIRef(base + PRICE_SUFFIX)
+        if price_predicate not in predicates:
+            continue
+        dates, prices = [], []
+        for subject, date in g.subject_objects(predicate):
+            if not _is_date(date):
+                continue
+            for price in g.objects(subject, price_predicate):
+                dates.append(str(date))
+                prices.append(_to_float(price))
+        series[base] = (np.array(dates, dtype='datetime64[D]'), np.array(prices, dtype=np.float64))
+    return PriceIndex(series)
+
+
+def _is_date(term):
+    return isinstance(term, Literal) and term.datatype == XSD.date \
+        and isinstance(term.toPython(), datetime.date)
+
+
+def _to_float(literal):
+    try:
+        return float(str(literal))
+    except ValueError:
+        return np.nan
+
+
+def _local_name(uri):
+    return str(uri).replace('#', '/').rsplit('/', 1)[-1]
+
+
+# --------------------------------------------------
+# query matching
+#
+class PriceQuery:
+    """
+    A SPARQL query recognised as a date-range join over ticker date/price pairs.
+    """
+
+    def __init__(self, date_var, columns, bounds, order):
+        """
+        :param date_var: name of the shared date variable
+        :param columns: projected (name, ticker base uri or None for the date, precision or None) tuples
+        :param bounds: list of (operator, value) date bounds, value being a Literal or a Variable
+        :param order: 'ASC', 'DESC' or None
+        """
+        self.date_var = date_var
+        self.columns = columns
+        self.bounds = bounds
+        self.order = order
+
+    def date_range(self, bindings=None):
+        """
+        Return the inclusive date range selected by the filter.
+        :param bindings: dictionary of variable name to Literal for unbound bounds
+        :return: tuple of numpy datetime64[D] start and end, either may be None
+        """
+        start, end = None, None
+        day = np.timedelta64(1, 'D')
+        for op, value in self.bounds:
+            if isinstance(value, Variable):
+                value = (bindings or {}).get(str(value))
+                if value is None:
+                    raise KeyError('unbound date bound')
+            value = np.datetime64(str(value), 'D')
+            if op in ('>=', '>'):
+                value = value if op == '>=' else value + day
+                start = value if start is None else max(start, value)
+            else:
+                value = value if op == '<=' else value - day
+                end = value if end is None else min(end, value)
+        return start, end
+
+    def evaluate(self, index, bindings=None):
+        """
+        Answer the query from a price index.
+        :param index: price index
+        :param bindings: dictionary of variable name to Literal for unbound bounds
+        :return: DataFrame with one column per projected variable
+        """
+        start, end = self.date_range(bindings)
+        bases = list(dict.fromkeys(base for _, base, _ in self.columns if base is not None))
+        if start is not None and end is not None and start > end:
+            dates, prices = np.array([], dtype='datetime64[D]'), [np.array([])] * len(bases)
+        else:
+            dates, prices = index.join(bases, start, end)
+        if self.order == 'DESC':
+            dates, prices = dates[::-1], [p[::-1] for p in prices]
+
+        data = {}
+        for name, base, precision in self.columns:
+            if base is None:
+                data[name] = pd.to_datetime(dates)
+                continue
+            values = prices[bases.index(base)]
+            if precision is not None:
+                if isinstance(precision, Variable):
+                    precision = (bindings or {})[str(precision)]
+                precision = float(precision.toPython())
+                # round the scaled value first so float noise cannot flip a half
+                values = np.floor(np.round(values * precision, 6) + 0.5) / precision
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+def match_price_query(query):
+    """
+    Return a PriceQuery when a query only joins ticker date/price pairs on a
+    shared date, optionally filtered by date, rounded and ordered by date.
+    :param query: sparql query text or prepared query
+    :return: PriceQuery or None
+    """
+    if isinstance(query, str):
+        try:
+            query = prepareQuery(query)
+        except Exception:
+            return None
+    algebra = query.algebra
+    if algebra.name != 'SelectQuery' or algebra.datasetClause:
+        return None
+    project = algebra.p
+    if project.name != 'Project':
+        return None
+
+    node, order = project.p, None
+    if node.name == 'OrderBy':
+        if len(node.expr) != 1 or not isinstance(node.expr[0].expr, Variable):
+            return None
+        order_var, order = node.expr[0].expr, node.expr[0].order or 'ASC'
+        node = node.p
+
+    precisions = {}
+    while node.name == 'Extend':
+        precision = _match_rounding(node.expr, node.var)
+        if precision is None:
+            return None
+        precisions[str(node.var)] = precision
+        node = node.p
+
+    bounds = []
+    if node.name == 'Filter':
+        bounds = _match_date_filter(node.expr)
+        if bounds is None:
+            return None
+        node = node.p
+    if node.name != 'BGP':
+        return None
+
+    pairs = _match_ticker_pairs(node.triples)
+    if pairs is None:
+        return None
+    date_var, prices = pairs
+
+    if order is not None and order_var != date_var:
+        return None
+    if any(var != date_var for var, _ in bounds):
+        return None
+
+    columns = []
+    if not any(var in prices for var in project.PV):
+        return None
+    for var in project.PV:
+        if var == date_var:
+            columns.append((str(var), None, None))
+        elif var in prices:
+            columns.append((str(var), prices[var], precisions.get(str(var))))
+        else:
+            return None
+    if set(precisions) - {name for name, base, _ in columns if base is not None}:
+        return None
+    return PriceQuery(str(date_var), columns, [(op, value) for _, (op, value) in bounds], order)
+
+
+def _match_ticker_pairs(triples):
+    """
+    Return the shared date variable and a price variable to ticker base mapping,
+    when every subject has exactly one <TICKER>_date and one <TICKER>_price triple.
+    """
+    subjects = {}
+    for s, p, o in triples:
+        if not isinstance(s, Variable) or not isinstance(p, URIRef) or not isinstance(o, Variable):
+            return None
+        subjects.setdefault(s, []).append((str(p), o))
+
+    date_var, prices = None, {}
+    for s, pairs in subjects.items():
+        if len(pairs) != 2:
+            return None
+        pairs = dict(pairs)
+        date_predicates = [p for p in pairs if p.endswith(DATE_SUFFIX)]
+        if len(date_predicates) != 1:
+            return None
+        base = date_predicates[0][:-len(DATE_SUFFIX)]
+        if base + PRICE_SUFFIX not in pairs:
+            return None
+        if date_var is None:
+            date_var = pairs[date_predicates[0]]
+        price_var = pairs[base + PRICE_SUFFIX]
+        if pairs[date_predicates[0]] != date_var or price_var in prices or price_var in subjects:
+            return None
+        prices[price_var] = base
+    if date_var is None or date_var in prices or date_var in subjects:
+        return None
+    return date_var, prices
+
+
+def _match_date_filter(expr):
+    """
+    Return a list of (variable, (operator, bound)) for a conjunction of date comparisons.
+    """
+    if isinstance(expr, CompValue) and expr.name == 'ConditionalAndExpression':
+        parts = [expr.expr] + list(expr.other)
+    else:
+        parts = [expr]
+    bounds = []
+    for part in parts:
+        if not isinstance(part, CompValue) or part.name != 'RelationalExpression':
+            return None
+        if part.op not in ('>=', '>', '<=', '<') or not isinstance(part.expr, Variable):
+            return None
+        other = part.other
+        if isinstance(other, Literal):
+            if not _is_date(other):
+                return None
+        elif not isinstance(other, Variable):
+            return None
+        bounds.append((part.expr, (part.op, other)))
+    return bounds
+
+
+def _match_rounding(expr, var):
+    """
+    Return k of the expression ROUND(?var * k) / k, or None.
+    """
+    if not isinstance(expr, CompValue) or expr.name != 'MultiplicativeExpression':
+        return None
+    if list(expr.op) != ['/'] or len(expr.other) != 1:
+        return None
+    inner = expr.expr
+    if not isinstance(inner, CompValue) or inner.name != 'Builtin_ROUND':
+        return None
+    product = inner.arg
+    if not isinstance(product, CompValue) or product.name != 'MultiplicativeExpression':
+        return None
+    if list(product.op) != ['*'] or len(product.other) != 1 or product.expr != var:
+        return None
+    numerator, denominator = product.other[0], expr.other[0]
+    if numerator != denominator or not isinstance(numerator, (Literal, Variable)):
+        return None
+    if isinstance(numerator, Literal) and not isinstance(numerator.toPython(), (int, float)) \
+            and numerator.datatype != XSD.decimal:
+        return None
+    return numerator
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utilities.ont import build_ontology_as_rdflib_graph, get_cytoscape_elements, prepare_query_templates
+
+# ontologies loaded concurrently at start-up
+WARMUP_WORKERS = int(os.environ.get('WARMUP_WORKERS', 2))
+
+
+class OntologyWarmup:
+    """
+    Loads the listed ontologies on a background thread pool, so the first
+    user of an ontology does not pay for parsing it inside a callback, and
+    reports when every ontology is ready.
+    """
+
+    def __init__(self, max_workers=WARMUP_WORKERS):
+        """
+        :param max_workers: ontologies loaded concurrently
+        """
+        self.max_workers = max_workers
+        self._futures = {}
+        self._status = {}
+        self._lock = threading.Lock()
+
+    def start(self, ontologies):
+        """
+        Start loading ontologies in the background.
+        :param ontologies: iterable of (endpoint, sparql query csv file or None) tuples
+        :return: self
+        """
+        ontologies = list(ontologies)
+        if not ontologies:
+            return self
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ontology-warmup')
+        for endpoint, query_file in ontologies:
+            with self._lock:
+                self._status[endpoint] = {'state': 'pending'}
+            self._futures[endpoint] = executor.submit(self._load, endpoint, query_file)
+        # the pool's threads exit once every ontology is loaded
+        executor.shutdown(wait=False)
+        return self
+
+    @property
+    def ready(self):
+        """
+        Whether every ontology has been loaded, or has failed to load.
+        """
+        return all(future.done() for future in self._futures.values())
+
+    def wait(self, timeout=None):
+        """
+        Block until every ontology is loaded.
+        :param timeout: seconds to wait at most, None to wait indefinitely
+        :return: whether every ontology is loaded
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in list(self._futures.values()):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                # failures are reported by status
+                pass
+        return self.ready
+
+    def status(self):
+        """
+        Return the load state of every ontology.
+        :return: dictionary with 'ready' and per endpoint state, seconds and error
+        """
+        with self._lock:
+            ontologies = {endpoint: dict(status) for endpoint, status in self._status.items()}
+        return {'ready': self.ready, 'ontologies': ontologies}
+
+    def _load(self, endpoint, query_file):
+        self._set_status(endpoint, state='loading')
+        started = time.perf_counter()
+        try:
+            warm_up_ontology(endpoint, query_file)
+        except Exception as e:
+            self._set_status(endpoint, state='failed', error=f'{type(e).__name__}: {e}',
+                             seconds=round(time.perf_counter() - started, 3))
+            raise
+        self._set_status(endpoint, state='ready', seconds=round(time.perf_counter() - started, 3))
+
+    def _set_status(self, endpoint, **status):
+        with self._lock:
+            self._status[endpoint] = status
+
+
+def warm_up_ontology(endpoint, query_file=None):
+    """
+    Load everything a user of an ontology needs: the parsed graph (written to
+    its snapshot when stale) with its price index, the View tab elements and
+    the compiled query templates.
+    :param endpoint: ontology endpoint
+    :param query_file: csv file of the ontology's sparql queries, or None
+    :return: None
+    """
+    build_ontology_as_rdflib_graph(endpoint)
+    get_cytoscape_elements(endpoint)
+    if query_file is not None:
+        prepare_query_templates(endpoint, pd.read_csv(query_file)['Sparql'].unique())
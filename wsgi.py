@@ -0,0 +1,11 @@
+"""
+WSGI entry point of the dash app for production servers, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Dash's debug tooling (dev tools, hot reload, the reloader) is only switched on
+by app.run(debug=True) in app.py, so it is off here.
+"""
+from app import app, ontology_warmup  # noqa: F401
+
+application = app.server